@@ -0,0 +1,236 @@
+"""
+pypdns benchmarks, run against an in process PowerDNS API stub, from the
+repository root: python -m benchmarks.run
+
+Usage:
+    run [--size <size>] [--latency <latency>] [--only <operations>] [--baseline <path>] [--save] [--tolerance <tolerance>]
+    run (-h | --help)
+
+Options:
+    -h --help                  Show this screen
+    --size <size>              Number of rrsets of the benchmark zone [default: 10000]
+    --latency <latency>        Latency added to every stub response, in seconds [default: 0]
+    --only <operations>        Comma separated operations to run, default to all
+    --baseline <path>          Baseline file [default: benchmarks/baseline.json]
+    --save                     Store results as the baseline for this size and latency
+    --tolerance <tolerance>    Allowed wall time and memory increase over the baseline [default: 0.5]
+
+Every operation is measured for wall time, number of requests, bytes
+transferred (both ways) and peak memory allocated by python while it runs.
+Request counts and bytes must not grow over the baseline, wall time and
+memory may grow up to the tolerance. Exits with status 1 on regression.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+from docopt import docopt
+
+from pypdns.pypdns import PyPDNS
+
+from .stub import PdnsStub, generate_zone
+
+
+ZONE = 'bench.example.com.'
+OTHER_ZONES = 50
+
+
+def _names(size, count=1000):
+    step = max(size // count, 1)
+    return ['h%d.deep.label.%s' % (i, ZONE.rstrip('.'))
+            for i in range(0, size, step)][:count]
+
+
+def bench_zones_get(pdns, size):
+    pdns.zones_get(ZONE, 'h1', 'A')
+
+
+def bench_zones_get_snapshot(pdns, size):
+    pdns.snapshots.invalidate()
+    for _ in range(10):
+        pdns.zones_get(ZONE, 'h1', 'A')
+
+
+def bench_iter_zone(pdns, size):
+    for _ in pdns.iter_zone(ZONE, 'h1', 'A'):
+        pass
+
+
+def bench_zones_list(pdns, size):
+    pdns.zones_list(r'zone1\.example\.com\.$')
+    pdns.zones_list('zone4')
+
+
+def bench_search(pdns, size):
+    pdns.search('h1*', rtype='A', max_results=100)
+
+
+def bench_construct_names(pdns, size):
+    pdns.invalidate_zones_cache()
+    for name in _names(size):
+        pdns._construct_names(name)
+
+
+def bench_record_add(pdns, size):
+    for i in range(20):
+        pdns.record_add(ZONE, 'bench-add-%d' % i, '192.0.2.%d' % i,
+                        'benchmark', override=False)
+
+
+def bench_apply_changes(pdns, size):
+    changes = ({'name': 'bench-bulk-%d.%s' % (i, ZONE), 'type': 'A',
+                'content': '192.0.2.%d' % (i % 255), 'comment': 'benchmark',
+                'zone': ZONE}
+               for i in range(1000))
+    pdns.apply_changes(changes)
+
+
+def bench_export_zones(pdns, size):
+    directory = tempfile.mkdtemp()
+    try:
+        pdns.export_zones(directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+OPERATIONS = [
+    ('zones_get', bench_zones_get, {}),
+    ('zones_get_snapshot', bench_zones_get_snapshot,
+     {'snapshot-cache': True}),
+    ('iter_zone', bench_iter_zone, {}),
+    ('zones_list', bench_zones_list, {}),
+    ('search', bench_search, {}),
+    ('construct_names', bench_construct_names, {}),
+    ('record_add', bench_record_add, {}),
+    ('apply_changes', bench_apply_changes, {}),
+    ('export_zones', bench_export_zones, {}),
+]
+
+
+def _run_once(endpoint, size, func, config, trace_memory=False):
+    pdns = PyPDNS(dict(config, endpoint=endpoint, apikey='bench', retries=0))
+    # Session creation is not measured
+    pdns.zones_api.session
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.time()
+    try:
+        func(pdns, size)
+        wall = time.time() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        pdns.close()
+    return wall, peak
+
+
+def measure(stub, endpoint, size, func, config):
+    """
+    Run func on a new PyPDNS, return its measures. Memory is traced in a
+    second run, tracemalloc slows down the code it traces.
+    """
+    reset_zone(stub, size)
+    stub.reset_stats()
+    wall, _ = _run_once(endpoint, size, func, config)
+    stats = stub.stats()
+
+    reset_zone(stub, size)
+    _, peak = _run_once(endpoint, size, func, config, trace_memory=True)
+    return {'wall': round(wall, 4), 'requests': stats['requests'],
+            'bytes': stats['bytes'], 'peak_memory': peak}
+
+
+def reset_zone(stub, size):
+    # Operations writing records must start from the same zone
+    stub.add_zone(ZONE, generate_zone(ZONE, size))
+
+
+def run(size, latency, only=None):
+    os.environ.setdefault('USER', 'bench')
+    stub = PdnsStub(latency)
+    for i in range(OTHER_ZONES):
+        name = 'zone%d.example.com.' % i
+        stub.add_zone(name, generate_zone(name, 10, seed=i))
+    endpoint = stub.start()
+
+    results = {}
+    try:
+        for name, func, config in OPERATIONS:
+            if only and name not in only:
+                continue
+            results[name] = measure(stub, endpoint, size, func, config)
+            sys.stdout.write('%-20s %s\n' % (name, json.dumps(
+                results[name], sort_keys=True)))
+            sys.stdout.flush()
+    finally:
+        stub.stop()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return the list of regressions of results over baseline.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('requests', 'bytes'):
+            if result[key] > base[key]:
+                regressions.append('%s: %s %d > %d' % (name, key, result[key],
+                                                       base[key]))
+        for key in ('wall', 'peak_memory'):
+            limit = base[key] * (1 + tolerance)
+            if result[key] > limit:
+                regressions.append('%s: %s %s > %s (baseline %s)' % (
+                    name, key, result[key], round(limit, 4), base[key]))
+    return regressions
+
+
+def main():
+    options = docopt(__doc__)
+    size = int(options['--size'])
+    latency = float(options['--latency'])
+    only = options['--only'] and options['--only'].split(',')
+    key = '%d/%s' % (size, latency)
+
+    results = run(size, latency, only)
+
+    path = options['--baseline']
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as fh:
+            baselines = json.load(fh)
+
+    if options['--save']:
+        baselines.setdefault(key, {}).update(results)
+        with open(path, 'w') as fh:
+            json.dump(baselines, fh, sort_keys=True, indent=4,
+                      separators=(',', ': '))
+            fh.write('\n')
+        sys.stdout.write('Baseline %s saved to %s\n' % (key, path))
+        return
+
+    if key not in baselines:
+        sys.stdout.write('No baseline for %s in %s\n' % (key, path))
+        return
+
+    regressions = compare(results, baselines[key],
+                          float(options['--tolerance']))
+    for regression in regressions:
+        sys.stdout.write('REGRESSION %s\n' % regression)
+    if regressions:
+        sys.exit(1)
+    sys.stdout.write('No regression against baseline %s\n' % key)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+pypdns cli startup benchmark, from the repository root:
+python -m benchmarks.startup
+
+Usage:
+    startup [--repeat <repeat>] [--baseline <path>] [--save] [--tolerance <tolerance>]
+    startup (-h | --help)
+
+Options:
+    -h --help                  Show this screen
+    --repeat <repeat>          Number of runs, the fastest one is kept [default: 10]
+    --baseline <path>          Baseline file [default: benchmarks/baseline.json]
+    --save                     Store results as the startup baseline
+    --tolerance <tolerance>    Allowed time increase over the baseline [default: 0.5]
+
+Measures the import time of pypdns.cli as reported by python -X importtime
+(in microseconds), the number of modules it imports and the wall time of
+pypdns --help. The number of imported modules must not grow over the
+baseline, times may grow up to the tolerance. Exits with status 1 on
+regression.
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+
+from docopt import docopt
+
+
+BASELINE_KEY = 'startup'
+
+HELP = 'from pypdns.cli import main; main()'
+
+
+def import_time():
+    """
+    Return 2-tuple : cumulative import time of pypdns.cli in microseconds,
+    number of modules imported by it.
+    """
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             'import pypdns.cli'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    lines = [line for line in err.decode('utf-8').splitlines()
+             if line.startswith('import time:') and '|' in line]
+    # The first line is the header, modules are listed after their imports
+    modules = [line.split('|') for line in lines[1:]]
+    names = [module[2].strip() for module in modules]
+    index = names.index('pypdns.cli')
+    # Modules imported before pypdns.cli started belong to the interpreter
+    start = index
+    while start > 0 and modules[start - 1][2].startswith('  '):
+        start -= 1
+    return int(modules[index][1]), index - start + 1
+
+
+def help_time():
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', HELP, '--help'],
+                          stdout=open(os.devnull, 'w'))
+    return time.time() - start
+
+
+def run(repeat):
+    imports = [import_time() for _ in range(repeat)]
+    return {'import_us': min(us for us, _ in imports),
+            'modules': max(count for _, count in imports),
+            'help_wall': round(min(help_time() for _ in range(repeat)), 4)}
+
+
+def compare(result, baseline, tolerance):
+    """
+    Return the list of regressions of result over baseline.
+    """
+    regressions = []
+    if result['modules'] > baseline['modules']:
+        regressions.append('modules %d > %d' % (result['modules'],
+                                                baseline['modules']))
+    for key in ('import_us', 'help_wall'):
+        limit = baseline[key] * (1 + tolerance)
+        if result[key] > limit:
+            regressions.append('%s %s > %s (baseline %s)' % (
+                key, result[key], round(limit, 4), baseline[key]))
+    return regressions
+
+
+def main():
+    options = docopt(__doc__)
+    result = run(int(options['--repeat']))
+    sys.stdout.write('%-20s %s\n' % (BASELINE_KEY,
+                                     json.dumps(result, sort_keys=True)))
+
+    path = options['--baseline']
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as fh:
+            baselines = json.load(fh)
+
+    if options['--save']:
+        baselines[BASELINE_KEY] = result
+        with open(path, 'w') as fh:
+            json.dump(baselines, fh, sort_keys=True, indent=4,
+                      separators=(',', ': '))
+            fh.write('\n')
+        sys.stdout.write('Baseline %s saved to %s\n' % (BASELINE_KEY, path))
+        return
+
+    if BASELINE_KEY not in baselines:
+        sys.stdout.write('No baseline for %s in %s\n' % (BASELINE_KEY, path))
+        return
+
+    regressions = compare(result, baselines[BASELINE_KEY],
+                          float(options['--tolerance']))
+    for regression in regressions:
+        sys.stdout.write('REGRESSION %s\n' % regression)
+    if regressions:
+        sys.exit(1)
+    sys.stdout.write('No regression against baseline %s\n' % BASELINE_KEY)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+In process stub of the PowerDNS API endpoints used by pypdns: /zones,
+/zones/<zone> (GET, PATCH), /search-data, with synthetic zones and optional
+latency and fault injection. Counts requests and bytes transferred.
+
+Zone bodies are serialized once and reused until the zone is patched, so
+the stub costs as little as possible in the measures.
+"""
+import re
+import json
+import time
+import random
+import socket
+import fnmatch
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+
+
+SERVER_PATH = '/api/v1/servers/localhost'
+
+RECORD_TYPES = ('A', 'A', 'A', 'AAAA', 'CNAME', 'MX', 'TXT')
+
+
+def generate_zone(name, size, seed=0):
+    """
+    Return size synthetic rrsets for zone name: SOA, NS then a mix of A,
+    AAAA, CNAME, MX and TXT rrsets on up to three label deep names.
+    """
+    rand = random.Random(seed)
+    rrsets = [
+        {'name': name, 'type': 'SOA', 'ttl': 3600, 'comments': [],
+         'records': [{'content': 'ns1.%s hostmaster.%s 1 10800 3600 604800 '
+                                 '3600' % (name, name), 'disabled': False}]},
+        {'name': name, 'type': 'NS', 'ttl': 3600, 'comments': [],
+         'records': [{'content': 'ns%d.%s' % (i, name), 'disabled': False}
+                     for i in (1, 2)]},
+    ]
+    for i in range(max(size - len(rrsets), 0)):
+        labels = ['h%d' % i] + ['d%d' % rand.randint(0, 50)
+                                for _ in range(rand.randint(0, 2))]
+        rname = '.'.join(labels) + '.' + name
+        rtype = RECORD_TYPES[i % len(RECORD_TYPES)]
+        if rtype == 'A':
+            content = '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+        elif rtype == 'AAAA':
+            content = 'fd00::%x' % i
+        elif rtype == 'CNAME':
+            content = 'h%d.%s' % (rand.randint(0, size), name)
+        elif rtype == 'MX':
+            content = '10 mx%d.%s' % (i % 4, name)
+        else:
+            content = '"v=spf1 ip4:10.0.0.%d -all"' % (i % 255)
+        comments = []
+        if i % 10 == 0:
+            comments.append({'account': 'bench', 'content': 'comment %d' % i,
+                             'modified_at': 1500000000 + i})
+        rrsets.append({'name': rname, 'type': rtype, 'ttl': 300,
+                       'records': [{'content': content, 'disabled': False}],
+                       'comments': comments})
+    return rrsets
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class PdnsStub(object):
+    """
+    Stub API server, start() returns the endpoint to configure pypdns with.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.zones = {}
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._bodies = {}
+        self._faults = []
+        # Zones whose serials do not move on changes
+        self._static = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add_zone(self, name, rrsets, soa_edit_api=True):
+        """
+        Add zone name holding rrsets, without soa_edit_api its serials are
+        not increased by changes.
+        """
+        with self._lock:
+            if soa_edit_api:
+                self._static.discard(name)
+            else:
+                self._static.add(name)
+            self.zones[name] = {'name': name, 'id': name, 'kind': 'Native',
+                                'serial': 1, 'edited_serial': 1,
+                                'url': SERVER_PATH + '/zones/' + name,
+                                'rrsets': rrsets}
+            self._bodies.pop(name, None)
+
+    def fail(self, verb, path, status=None, truncate=None, times=1):
+        """
+        Make the next times requests verb whose path (query included)
+        contains path fail: answered with status, or with their body cut
+        after truncate bytes and the connection closed.
+        """
+        with self._lock:
+            self._faults.append({'verb': verb, 'path': path, 'status': status,
+                                 'truncate': truncate, 'times': times})
+
+    def take_fault(self, verb, path):
+        with self._lock:
+            for fault in self._faults:
+                if fault['verb'] == verb and fault['path'] in path:
+                    fault['times'] -= 1
+                    if not fault['times']:
+                        self._faults.remove(fault)
+                    return fault
+        return None
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.bytes_in = self.bytes_out = 0
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests,
+                    'bytes': self.bytes_in + self.bytes_out}
+
+    def start(self):
+        stub = self
+
+        class Handler(_Handler):
+            pass
+        Handler.stub = stub
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:%d%s' % (self._server.server_address[1],
+                                          SERVER_PATH)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # Request handling, called from the handler threads
+
+    def zone_body(self, name):
+        with self._lock:
+            body = self._bodies.get(name)
+            if body is None:
+                body = json.dumps(self.zones[name]).encode('utf-8')
+                self._bodies[name] = body
+            return body
+
+    def zones_listing(self, zone=None):
+        with self._lock:
+            return [dict((k, v) for k, v in data.items() if k != 'rrsets')
+                    for name, data in self.zones.items()
+                    if zone is None or name == zone]
+
+    def patch(self, name, rrsets):
+        with self._lock:
+            data = self.zones[name]
+            # Names are canonical lower case, as in PowerDNS
+            rrsets = [dict(rr, name=rr['name'].lower()) for rr in rrsets]
+            changes = dict(((rr['name'], rr['type']), rr) for rr in rrsets)
+            kept = [rr for rr in data['rrsets']
+                    if (rr['name'], rr['type']) not in changes]
+            for rrset in rrsets:
+                if rrset['changetype'] == 'REPLACE':
+                    rrset = dict(rrset)
+                    del rrset['changetype']
+                    rrset['records'] = [
+                        {'content': r['content'],
+                         'disabled': r.get('disabled', False)}
+                        for r in rrset['records']]
+                    for comment in rrset.get('comments', []):
+                        comment.setdefault('modified_at', int(time.time()))
+                    kept.append(rrset)
+            data['rrsets'] = kept
+            if name not in self._static:
+                data['serial'] += 1
+                data['edited_serial'] += 1
+            self._bodies.pop(name, None)
+
+    def search(self, term, max_results, object_type='all'):
+        pattern = re.compile(fnmatch.translate(term.lower()))
+        results = []
+        with self._lock:
+            zones = list(self.zones.values())
+        for zone in zones:
+            if object_type in ('all', 'zone') and \
+                    pattern.match(zone['name'].rstrip('.')):
+                results.append({'object_type': 'zone', 'name': zone['name'],
+                                'zone_id': zone['id']})
+            if object_type not in ('all', 'record'):
+                continue
+            for rrset in zone['rrsets']:
+                if not pattern.match(rrset['name'].rstrip('.')):
+                    continue
+                for record in rrset['records']:
+                    results.append({
+                        'object_type': 'record', 'name': rrset['name'],
+                        'type': rrset['type'], 'ttl': rrset['ttl'],
+                        'content': record['content'],
+                        'disabled': record['disabled'],
+                        'zone': zone['name'], 'zone_id': zone['id']})
+                if len(results) >= max_results:
+                    return results[:max_results]
+        return results[:max_results]
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    stub = None
+    fault = None
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Headers and body are written separately: with Nagle's algorithm
+        # each kept-alive request waits for the client's delayed ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.stub._lock:
+            self.stub.requests += 1
+            self.stub.bytes_in += len(body)
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        self.fault = self.stub.take_fault(self.command, self.path)
+        return body
+
+    def _failed(self):
+        # Answers the request with the status of its fault, if any
+        if self.fault is None or self.fault['status'] is None:
+            return False
+        self._send(self.fault['status'], {'error': 'Injected failure'})
+        return True
+
+    def _send(self, code, body=b''):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        # Counted first, the client may read stats as soon as it is sent
+        with self.stub._lock:
+            self.stub.bytes_out += len(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.fault is not None and self.fault['truncate'] is not None:
+            self.wfile.write(body[:self.fault['truncate']])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def _zone_name(self, path):
+        name = unquote(path[len(SERVER_PATH + '/zones/'):]).lower()
+        return name if name.endswith('.') else name + '.'
+
+    def do_GET(self):
+        self._read_body()
+        if self._failed():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == SERVER_PATH + '/zones':
+            zone = query.get('zone', [None])[0]
+            return self._send(200, self.stub.zones_listing(zone))
+
+        if url.path.startswith(SERVER_PATH + '/zones/'):
+            name = self._zone_name(url.path)
+            if name not in self.stub.zones:
+                return self._send(404, {'error': 'Could not find domain'})
+            if 'rrset_name' in query:
+                rname = query['rrset_name'][0].lower()
+                rtype = query.get('rrset_type', [None])[0]
+                data = dict(self.stub.zones[name])
+                data['rrsets'] = [rr for rr in data['rrsets']
+                                  if rr['name'] == rname and
+                                  rtype in (None, rr['type'])]
+                return self._send(200, data)
+            return self._send(200, self.stub.zone_body(name))
+
+        if url.path == SERVER_PATH + '/search-data':
+            return self._send(200, self.stub.search(
+                query['q'][0], int(query.get('max', [100])[0]),
+                query.get('object_type', ['all'])[0]))
+
+        self._send(404, {'error': 'Not found'})
+
+    def do_PATCH(self):
+        body = self._read_body()
+        if self._failed():
+            return
+        url = urlparse(self.path)
+        name = self._zone_name(url.path)
+        if name not in self.stub.zones:
+            return self._send(404, {'error': 'Could not find domain'})
+        self.stub.patch(name, json.loads(body.decode('utf-8'))['rrsets'])
+        self._send(204)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self._failed():
+            return
+        data = json.loads(body.decode('utf-8'))
+        self.stub.add_zone(data['name'], data.get('rrsets', []))
+        self._send(201, self.stub.zones_listing(data['name'])[0])
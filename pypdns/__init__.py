@@ -1,5 +1,17 @@
 from __future__ import absolute_import
 
-from pypdns.pypdns import PyPDNS
+import sys
 
 __version__ = '0.17'
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # PyPDNS is imported on first access, so that pypdns.cli can parse
+        # its options before loading the library
+        if name == 'PyPDNS':
+            from pypdns.pypdns import PyPDNS
+            return PyPDNS
+        raise AttributeError('module %r has no attribute %r' % (__name__,
+                                                                 name))
+else:
+    from pypdns.pypdns import PyPDNS  # noqa: F401
@@ -0,0 +1,289 @@
+"""
+asyncio variant of the PowerDNS API client, requires aiohttp.
+
+AsyncPyPDNS mirrors PyPDNS read and record methods, payloads and filtering
+are shared with the synchronous client.
+
+This module is python 3 only, it is not installed on python 2 (see
+setup.py).
+"""
+import asyncio
+import logging
+
+import aiohttp
+
+from .api import (PdnsAPI, PdnsConnectionError, PdnsError, PdnsTimeout,
+                  SearchAPI, ZonesAPI)
+from .jsonlib import loads
+from .pypdns import (load_config, parse_config, build_rrset, record_fqdn,
+                     record_key, filter_zones, filter_rrsets)
+from .query import SearchPlan, ZoneListingPlan
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncPdnsAPI(object):
+    """
+    Base asyncio API client, connections are kept alive in a pool of at most
+    max-workers connections, shared by every API built with the same session.
+
+    The session is created on first request, from a coroutine: aiohttp
+    sessions must be created in the event loop running them.
+    """
+
+    collection_url = ''
+    url = ''
+
+    def __init__(self, config, session=None, shared=None):
+        """
+        :param session: aiohttp session used, default to one created on
+        first request
+        :type session: aiohttp.ClientSession
+        :param shared: API whose session is used, so both share the same
+        connection pool
+        :type shared: AsyncPdnsAPI
+        """
+        self.endpoint = config['endpoint']
+        self.apikey = config['apikey']
+        self.max_workers = int(config['max-workers'])
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=float(config['connect-timeout']),
+            sock_read=float(config['read-timeout']))
+        self._session = session
+        self._shared = shared
+        self._semaphore = None
+
+    @property
+    def session(self):
+        if self._shared is not None:
+            return self._shared.session
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_workers)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout,
+                headers={'X-Api-Key': self.apikey})
+        return self._session
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    async def close(self):
+        # A shared session is closed by its owner
+        if self._session is not None and self._shared is None:
+            await self._session.close()
+            self._session = None
+
+    build_url = PdnsAPI.build_url
+
+    async def _call(self, verb, url, data=None, params=None):
+        """
+        Return 2-tuple : decoded response body (text if not json) and
+        response code. Raise PdnsConnectionError (or PdnsTimeout) when the
+        API cannot be reached, as PdnsAPI._call does.
+        """
+        log.info('Call %s with data %s', url, data)
+        if params:
+            params = dict((k, str(v)) for k, v in params.items())
+        try:
+            async with self.semaphore:
+                async with self.session.request(verb, url, json=data,
+                                                params=params) as resp:
+                    body = await resp.read()
+                    status_code = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            error = (PdnsTimeout if isinstance(exc, asyncio.TimeoutError)
+                     else PdnsConnectionError)
+            log.error('%s %s failed: %s', verb, url, exc)
+            raise error('%s %s failed: %s' % (verb, url, exc), verb=verb,
+                        url=url, attempts=1)
+
+        try:
+            return loads(body), status_code
+        except ValueError:
+            log.debug("No json response found.")
+            return body.decode('utf-8', 'replace'), status_code
+
+    async def collection_get(self, params=None):
+        url = self.endpoint + self.collection_url
+        return await self._call('GET', url, params=params)
+
+    async def get(self, url=None, _id=None, params=None):
+        url = self.build_url(_id, url)
+        return await self._call('GET', url, params=params)
+
+    async def collection_post(self, data):
+        url = self.endpoint + self.collection_url
+        return await self._call('POST', url, data=data)
+
+    async def patch(self, data, _id=None, url=None):
+        url = self.build_url(_id, url)
+        return await self._call('PATCH', url, data=data)
+
+
+class AsyncZonesAPI(AsyncPdnsAPI):
+    collection_url = '/zones'
+    url = '/zones/{}'
+
+    async def get_zones(self, zone=None):
+        return await self.collection_get(params={'zone': zone} if zone
+                                         else {})
+
+    async def get_zone(self, zone_id):
+        return await self.get(_id=zone_id)
+
+    async def get_rrset(self, zone_id, name, type_=None):
+        # See ZonesAPI.get_rrset
+        return await self.get(_id=zone_id,
+                              params=ZonesAPI._rrset_params(name, type_))
+
+    async def create_zone(self, data):
+        return await self.collection_post(data)
+
+    async def update_records(self, zone_name, data):
+        return await self.patch(data, _id=zone_name)
+
+
+class AsyncSearchAPI(AsyncPdnsAPI):
+    collection_url = '/search-data'
+    url = ''
+
+    async def search(self, term, max_results=None, object_type=None):
+        params = SearchAPI._search_params(term, max_results, object_type)
+        return await self.collection_get(params=params)
+
+
+class AsyncPyPDNS(object):
+    """
+    asyncio PowerDNS client, to be closed with close() or used as an async
+    context manager.
+    """
+
+    def __init__(self, ext_config={}):
+        cfg = load_config(ext_config.get('config_path'))
+
+        self.config = parse_config(cfg, ext_config)
+        self.zones_api = AsyncZonesAPI(self.config)
+        # Both APIs share the same connection pool
+        self.search_api = AsyncSearchAPI(self.config, shared=self.zones_api)
+
+    async def close(self):
+        await self.zones_api.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+        return False
+
+    async def zones_list(self, name='.*'):
+        """
+        Get all zone from remote pdns API, see PyPDNS.zones_list
+        """
+        ret, code = await self._list_zones(name)
+        if code != 200:
+            return ret
+        return filter_zones(ret, name)
+
+    async def _list_zones(self, name):
+        # See PyPDNS._list_zones, the lookups are sent concurrently
+        plan = ZoneListingPlan(name)
+        if plan.zone:
+            return await self.zones_api.get_zones(zone=plan.zone)
+        names = None
+        if plan.search is not None:
+            names = plan.lookups(
+                *await self.search_api.search(**plan.search))
+        if names is None:
+            return await self.zones_api.get_zones()
+        return plan.merge(await asyncio.gather(
+            *[self.zones_api.get_zones(zone=zone) for zone in names]))
+
+    async def zones_get(self, zone_id, name='.*', _type='.*'):
+        """
+        Return zone data, see PyPDNS.zones_get
+        """
+        ret, code = await self.zones_api.get_zone(zone_id)
+        if code != 200:
+            return ret
+        return filter_rrsets(ret['rrsets'], name, _type)
+
+    async def record_add(self, zone_name, record_name, contents, comment,
+                         type_='A', changetype='REPLACE', ttl=3600,
+                         reverse=False, disabled=False, override=False):
+        """
+        Add or replace a record, see PyPDNS.record_add, there is no
+        interactive mode.
+        """
+        type_ = type_.upper()
+        name = record_fqdn(zone_name, record_name, type_)
+
+        if not override:
+            # The record is not sent when its existence cannot be told
+            existing, code = await self.existing_records(zone_name,
+                                                         [(name, type_)])
+            if code != 200:
+                return existing, code
+            if existing:
+                return ('Specify override=True for erasing existing record',
+                        -1)
+
+        if not name.endswith('.'):
+            name += '.'
+
+        data = {
+            'rrsets': [build_rrset(name, type_, contents, comment,
+                                   changetype=changetype, ttl=ttl,
+                                   reverse=reverse, disabled=disabled)]
+        }
+        return await self.zones_api.update_records(zone_name, data)
+
+    async def search(self, term, object_type=None, zone=None, rtype=None,
+                     max_results=None):
+        """
+        Search for data in zone & record, see PyPDNS.search
+        """
+        plan = SearchPlan(term, object_type, zone, rtype, max_results,
+                          self.config.get('search-fetch-limit'))
+        found = []
+        while plan.pending:
+            results, sts_code = await self.search_api.search(**plan.params())
+            if sts_code != 200:
+                if not plan.requests:
+                    return results
+                log.error('Search %s failed: %s', plan.term, results)
+                break
+            found.extend(plan.filter(results))
+        return found
+
+    async def existing_records(self, zone_name, keys):
+        """
+        Return 2-tuple : dict of the rrsets of zone_name found for the given
+        (name, type) keys, response code, or the error of the lookup and its
+        code (-1 if the API cannot be reached), see
+        PyPDNS.existing_records. Each key is looked up with a request for
+        its rrset only.
+        """
+        keys = [record_key(name, type_) for name, type_ in keys]
+        try:
+            responses = await asyncio.gather(
+                *[self.zones_api.get_rrset(zone_name, name, type_)
+                  for name, type_ in keys])
+        except PdnsError as exc:
+            log.error('Cannot check records of zone %s: %s', zone_name, exc)
+            return str(exc), -1
+
+        found = {}
+        for key, (ret, code) in zip(keys, responses):
+            if code != 200:
+                log.error('Cannot get rrset %s %s: %s', key[0], key[1], ret)
+                return ret, code
+            # The server may ignore the rrset filter and return the zone
+            for rrset in ret.get('rrsets', ()):
+                if record_key(rrset['name'], rrset['type']) == key:
+                    found[key] = rrset
+        return found, 200
@@ -1,37 +1,211 @@
-import requests
+import time
+import random
 import logging
+import threading
+
+import requests
+from requests.packages.urllib3.exceptions import (
+    HTTPError as TransportError, NewConnectionError, ReadTimeoutError)
+
+from .jsonlib import loads
+from .metrics import RequestInfo, emit, now
 
 
 log = logging.getLogger(__name__)
 
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+# Requests which can be sent again without side effects
+IDEMPOTENT_VERBS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+RETRY_STATUS = frozenset((500, 502, 503, 504))
+# The server did not process the request, any verb can be retried
+THROTTLE_STATUS = 429
+
+
+class PdnsError(Exception):
+    """
+    Base error of the PowerDNS API client.
+    """
+
+    def __init__(self, message, verb=None, url=None, attempts=None):
+        super(PdnsError, self).__init__(message)
+        self.verb = verb
+        self.url = url
+        self.attempts = attempts
+
+
+class PdnsResponseError(PdnsError):
+    """
+    The API answered with an error status, kept with the response body.
+    """
+
+    def __init__(self, message, code, result=None, **kwargs):
+        super(PdnsResponseError, self).__init__(message, **kwargs)
+        self.code = code
+        self.result = result
+
+
+class PdnsConnectionError(PdnsError):
+    """
+    The API could not be reached, retries included.
+    """
+
+
+class PdnsTimeout(PdnsConnectionError):
+    """
+    The API did not answer in time, retries included.
+    """
+
+
+class RateLimiter(object):
+    """
+    Token bucket allowing rate requests per second, with bursts of up to
+    burst requests. Can be shared between threads and API objects.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, self.rate))
+        self._tokens = self.burst
+        self._last = now()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, wait until one is available.
+        """
+        while True:
+            with self._lock:
+                current = now()
+                self._tokens = min(self.burst, self._tokens +
+                                   (current - self._last) * self.rate)
+                self._last = current
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def build_rate_limiter(config):
+    """
+    Return the RateLimiter configured by rate-limit (requests per second)
+    and rate-burst, None if rate-limit is not set.
+    """
+    rate = float(config.get('rate-limit') or 0)
+    if rate <= 0:
+        return None
+    return RateLimiter(rate, config.get('rate-burst') and
+                       float(config['rate-burst']))
+
+
+def _not_sent(exc):
+    # True when the request could not reach the server at all
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _retry_after(resp):
+    try:
+        return min(float(resp.headers.get('Retry-After')), MAX_BACKOFF)
+    except (TypeError, ValueError):
+        return None
+
+
 class PdnsAPI(object):
 
     collection_url = ''
     url = ''
     _session = None
 
-    def __init__(self, config):
+    def __init__(self, config, rate_limiter=None, hooks=None):
+        """
+        :param rate_limiter: RateLimiter shared with other API objects,
+        default to one built from the rate-limit config value
+        :type rate_limiter: RateLimiter
+        :param hooks: Request hooks (see metrics.RequestHook), the list may be
+        shared with other API objects
+        :type hooks: list
+        """
         self.endpoint = config['endpoint']
         self.apikey = config['apikey']
+        # One connection per concurrent worker is kept alive
+        self.pool_size = int(config.get('pool-size') or
+                             config.get('max-workers') or DEFAULT_POOL_SIZE)
+        self.timeout = (
+            float(config.get('connect-timeout') or DEFAULT_CONNECT_TIMEOUT),
+            float(config.get('read-timeout') or DEFAULT_READ_TIMEOUT))
+        self.retries = int(config.get('retries', DEFAULT_RETRIES))
+        self.backoff = float(config.get('backoff', DEFAULT_BACKOFF))
+        self.rate_limiter = (rate_limiter if rate_limiter is not None
+                             else build_rate_limiter(config))
+        self.hooks = hooks if hooks is not None else []
+        self._session_lock = threading.Lock()
 
     @property
     def session(self):
+        # The session is shared between threads, it must not be mutated
+        # once created.
         if not self._session:
-            self._session = requests.Session()
-            self._session.headers.update({'X-Api-Key': self.apikey})
+            with self._session_lock:
+                if not self._session:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update({'X-Api-Key': self.apikey})
+                    self._session = session
         return self._session
 
     def _process_resp(self, resp, sts_code):
         data = None
+        start = now()
         try:
-            data = resp.json()
+            data = loads(resp.content)
         except ValueError:
             log.debug("No json response found.")
             data = resp.text
 
+        info = getattr(resp, 'pdns_info', None)
+        if info is not None and self.hooks:
+            info.decode_time = now() - start
+            info.response_bytes = len(resp.content)
+            emit(self.hooks, 'after_decode', info)
         return data, sts_code
 
+    def _process_stream(self, resp, sts_code, prefix):
+        """
+        Return 2-tuple : iterator over the items found at prefix (ijson
+        notation, e.g. rrsets.item) in the json body, response code.
+
+        The body is parsed while it is downloaded when ijson is installed,
+        error responses are decoded as usual.
+        """
+        ijson = _ijson()
+        if sts_code != 200 or ijson is None:
+            try:
+                data, sts_code = self._process_resp(resp, sts_code)
+            except requests.RequestException as exc:
+                # Body cut while it downloads
+                raise _stream_error(resp, exc)
+            if sts_code != 200:
+                return data, sts_code
+            for key in prefix.split('.')[:-1]:
+                data = data[key]
+            return iter(data), sts_code
+
+        resp.raw.decode_content = True
+        return _stream_items(ijson, resp, prefix), sts_code
+
     def build_url(self, _id, url):
         if not url and _id:
             url = self.endpoint + self.url.format(_id)
@@ -40,69 +214,216 @@ class PdnsAPI(object):
                              'call')
         return url
 
-    def _call(self, verb, url, data={}, params={}, headers={}):
-        if headers:
-            self.session.headers.update(headers)
+    def _call(self, verb, url, data={}, params={}, headers={}, stream=False,
+              endpoint=None):
+        """
+        Send a request, Return 2-tuple : response, response code.
 
-        log.info('Call %s with data %s', url, data)
-        resp = self.session.request(verb, url, json=data, params=params)
-        status_code = resp.status_code
-        try:
-            resp.raise_for_status()
-        except requests.HTTPError as exc:
-            log.debug('Error occured, endpoint : %s, apikey : %s',
-                      url, self.apikey)
-            return resp, status_code
+        Idempotent requests are retried on server errors (5xx), all requests
+        when throttled (429) or when they could not reach the server, with
+        jittered exponential backoff. Raise PdnsConnectionError (or
+        PdnsTimeout) when the API cannot be reached after retries.
+
+        :param endpoint: Url template called, used to aggregate metrics
+        :type endpoint: String
+        """
+        log.info('Call %s %s', verb, url)
+        log.debug('Request data %s', data)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            info = None
+            if self.hooks:
+                info = RequestInfo(verb, endpoint or url, url, attempt)
+                emit(self.hooks, 'before_request', info)
+                start = now()
+            try:
+                resp = self.session.request(verb, url, json=data,
+                                            params=params,
+                                            headers=headers or None,
+                                            stream=stream,
+                                            timeout=self.timeout)
+            except requests.RequestException as exc:
+                if info is not None:
+                    info.elapsed = now() - start
+                    info.error = exc
+                    emit(self.hooks, 'after_request', info)
+                if attempt < self.retries and (verb in IDEMPOTENT_VERBS or
+                                               _not_sent(exc)):
+                    attempt += 1
+                    log.warning('%s %s failed (%s), retry %d/%d', verb, url,
+                                exc, attempt, self.retries)
+                    self._wait(attempt)
+                    continue
+                error = (PdnsTimeout if isinstance(exc, requests.Timeout)
+                         else PdnsConnectionError)
+                log.error('%s %s failed: %s', verb, url, exc)
+                raise error('%s %s failed: %s' % (verb, url, exc), verb=verb,
+                            url=url, attempts=attempt + 1)
+
+            status_code = resp.status_code
+            if info is not None:
+                info.elapsed = now() - start
+                info.status = status_code
+                info.request_bytes = len(resp.request.body or b'')
+                length = resp.headers.get('Content-Length')
+                info.response_bytes = int(length) if length else None
+                resp.pdns_info = info
+                emit(self.hooks, 'after_request', info)
 
-        except requests.Timeout:
-            log.error('Request Timeout to %si', url)
-            return False, status_code
-        except requests.RequestException:
-            log.error('Requests Error')
-            return False, status_code
-        else:
+            if attempt < self.retries and (
+                    status_code == THROTTLE_STATUS or
+                    (status_code in RETRY_STATUS and
+                     verb in IDEMPOTENT_VERBS)):
+                attempt += 1
+                log.warning('%s %s returned %d, retry %d/%d', verb, url,
+                            status_code, attempt, self.retries)
+                delay = _retry_after(resp)
+                resp.close()
+                self._wait(attempt, delay)
+                continue
+
+            if status_code >= 400:
+                log.debug('Error occured, endpoint : %s, status : %d',
+                          url, status_code)
             return resp, status_code
 
-    def collection_get(self, params={}):
+    def _wait(self, attempt, delay=None):
+        if delay is None:
+            # Full jitter: spreads retries of concurrent workers
+            delay = random.uniform(
+                0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+        time.sleep(delay)
+
+    def _endpoint(self, _id, url):
+        return self.url if _id and not url else url[len(self.endpoint):]
+
+    def collection_get(self, params={}, stream=False):
         url = self.endpoint + self.collection_url
-        return self._call('GET', url, params=params)
+        return self._call('GET', url, params=params, stream=stream,
+                          endpoint=self.collection_url)
 
-    def get(self, url=None, _id=None, params={}):
+    def get(self, url=None, _id=None, params={}, stream=False):
+        endpoint = self._endpoint(_id, url)
         url = self.build_url(_id, url)
-        return self._call('GET', url, params=params)
+        return self._call('GET', url, params=params, stream=stream,
+                          endpoint=endpoint)
 
     def collection_post(self, data):
         url = self.endpoint + self.collection_url
-        return self._call('POST', url, data=data)
+        return self._call('POST', url, data=data,
+                          endpoint=self.collection_url)
 
     def patch(self, data, _id=None, url=None):
+        endpoint = self._endpoint(_id, url)
         url = self.build_url(_id, url)
-        return self._call('PATCH', url, data=data)
+        return self._call('PATCH', url, data=data, endpoint=endpoint)
+
+
+_ijson_module = False
+
+
+def _ijson():
+    # Imported on first streamed response, it is slow to import. None when
+    # ijson is not installed.
+    global _ijson_module
+    if _ijson_module is False:
+        try:
+            import ijson
+        except ImportError:
+            ijson = None
+        _ijson_module = ijson
+    return _ijson_module
+
+
+def _stream_error(resp, exc):
+    error = (PdnsTimeout if isinstance(exc, (ReadTimeoutError,
+                                             requests.Timeout))
+             else PdnsConnectionError)
+    verb = resp.request.method if resp.request is not None else 'GET'
+    log.error('%s %s interrupted: %s', verb, resp.url, exc)
+    return error('%s %s interrupted: %s' % (verb, resp.url, exc), verb=verb,
+                 url=resp.url)
+
+
+def _stream_items(ijson, resp, prefix):
+    """
+    Yield the items of a streamed response. The connection dropping or
+    timing out while the body downloads raises PdnsConnectionError (or
+    PdnsTimeout), a truncated or invalid body raises ValueError.
+    """
+    try:
+        for item in ijson.items(resp.raw, prefix):
+            yield item
+    except (TransportError, requests.RequestException, IOError) as exc:
+        raise _stream_error(resp, exc)
+    except ijson.JSONError as exc:
+        raise ValueError('Invalid json in %s response: %s' % (resp.url, exc))
+    finally:
+        resp.close()
 
 
 class ZonesAPI(PdnsAPI):
     collection_url = '/zones'
     url = '/zones/{}'
 
-    def get_zones(self):
-        return self._process_resp(*self.collection_get())
+    def get_zones(self, zone=None):
+        """
+        :param zone: Only list the zone of this name (ignored by servers
+        before PowerDNS 4.2)
+        :type zone: String
+        """
+        params = {'zone': zone} if zone else {}
+        return self._process_resp(*self.collection_get(params=params))
 
     def get_zone(self, zone_id):
         return self._process_resp(*self.get(_id=zone_id))
 
+    def get_rrset(self, zone_id, name, type_=None):
+        # Servers before PowerDNS 4.6 ignore these parameters and return
+        # the whole zone.
+        params = self._rrset_params(name, type_)
+        return self._process_resp(*self.get(_id=zone_id, params=params))
+
+    def iter_rrsets(self, zone_id):
+        return self._process_stream(*self.get(_id=zone_id, stream=True),
+                                    prefix='rrsets.item')
+
     def create_zone(self, data):
         return self._process_resp(*self.collection_post(data))
 
     def update_records(self, zone_name, data):
         return self._process_resp(*self.patch(data, _id=zone_name))
 
+    @staticmethod
+    def _rrset_params(name, type_=None):
+        params = {'rrset_name': name}
+        if type_:
+            params['rrset_type'] = type_
+        return params
+
 
 class SearchAPI(PdnsAPI):
     collection_url = '/search-data'
     url = ''
 
-    def search(self, term, max_results=None):
+    def search(self, term, max_results=None, object_type=None):
+        params = self._search_params(term, max_results, object_type)
+        return self._process_resp(*self.collection_get(params=params))
+
+    def iter_search(self, term, max_results=None, object_type=None):
+        params = self._search_params(term, max_results, object_type)
+        return self._process_stream(*self.collection_get(params=params,
+                                                         stream=True),
+                                    prefix='item')
+
+    @staticmethod
+    def _search_params(term, max_results=None, object_type=None):
         params = {'q': term}
         if max_results:
             params['max'] = max_results
-        return self._process_resp(*self.collection_get(params=params))
+        if object_type:
+            # all, zone, record or comment
+            params['object_type'] = object_type
+        return params
@@ -0,0 +1,120 @@
+"""
+Zone snapshots cache, a zone content is kept along with the serials it was
+fetched at and reused as long as the zones listing reports the same serials.
+"""
+import os
+import json
+import logging
+import threading
+import tempfile
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+log = logging.getLogger(__name__)
+
+# Suffix of the snapshot files, other files of the directory are left alone
+SNAPSHOT_SUFFIX = 'pypdns-snapshot.json'
+
+
+def zone_version(zone):
+    """
+    Return the version of a zone as found in the zones listing, None if the
+    listing does not expose any serial.
+    """
+    serial, edited_serial = zone.get('serial'), zone.get('edited_serial')
+    if serial is None and edited_serial is None:
+        return None
+    return '%s-%s' % (serial, edited_serial)
+
+
+class ZoneSnapshotCache(object):
+    """
+    In memory zone snapshots, optionally persisted as json files in
+    directory so they survive between processes. Zone names are case
+    insensitive.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory and os.path.expanduser(directory)
+        if self.directory and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        # example.com. is stored as example.com.pypdns-snapshot.json
+        return os.path.join(self.directory,
+                            quote(name, safe='') + SNAPSHOT_SUFFIX)
+
+    def get(self, name, version):
+        """
+        Return the zone data cached for name at version, None if missing or
+        outdated.
+        """
+        name = name.lower()
+        with self._lock:
+            snapshot = self._snapshots.get(name)
+        if snapshot and snapshot[0] == version:
+            return snapshot[1]
+
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(name)) as fh:
+                snapshot = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return None
+        if snapshot.get('version') != version:
+            return None
+
+        with self._lock:
+            self._snapshots[name] = (version, snapshot['zone'])
+        return snapshot['zone']
+
+    def set(self, name, version, data):
+        """
+        Store the zone data of name at version.
+        """
+        name = name.lower()
+        with self._lock:
+            self._snapshots[name] = (version, data)
+        if not self.directory:
+            return
+
+        # Written aside then renamed, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump({'name': name, 'version': version, 'zone': data}, fh)
+            os.rename(tmp_path, self._path(name))
+        except (IOError, OSError) as exc:
+            log.error('Cannot write snapshot of zone %s: %s', name, exc)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def invalidate(self, name=None):
+        """
+        Drop the snapshot of name, or all snapshots.
+        """
+        name = name and name.lower()
+        with self._lock:
+            if name is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(name, None)
+        if not self.directory:
+            return
+
+        if name is None:
+            paths = [os.path.join(self.directory, fname)
+                     for fname in os.listdir(self.directory)
+                     if fname.endswith(SNAPSHOT_SUFFIX)]
+        else:
+            paths = [self._path(name)]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
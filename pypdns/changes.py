@@ -0,0 +1,110 @@
+"""
+Readers for record changes files, as consumed by PyPDNS.iter_apply_changes.
+
+Both formats are read line by line, a file is never loaded in memory.
+
+  - jsonl: one change dict per line
+  - csv: a header line naming the change keys (name, type, content, comment,
+    ttl, changetype, reverse, disabled, zone), then one change per line
+
+Each change is tagged with the number of the line it starts at ('line'
+key). A line that cannot be read is yielded as {'line': line number,
+'error': message} and reading goes on, PyPDNS.iter_apply_changes reports it
+as a failed change.
+"""
+import csv
+
+from .compat import PY2
+from .jsonlib import loads
+from .pypdns import to_bool
+
+
+FORMATS = ('csv', 'jsonl')
+
+BOOLEAN_KEYS = ('reverse', 'disabled')
+
+
+def guess_format(path, default='jsonl'):
+    for fmt in FORMATS:
+        if path.lower().endswith('.' + fmt):
+            return fmt
+    return default
+
+
+def open_changes(path, fmt='jsonl'):
+    """
+    Open a changes file for read_changes. csv files are read without newline
+    translation, as the csv module requires: quoted cells may hold line
+    breaks.
+    """
+    if fmt != 'csv':
+        return open(path)
+    if PY2:
+        return open(path, 'rb')
+    return open(path, newline='')
+
+
+def invalid_line(lineno, message):
+    return {'line': lineno, 'error': 'Line %d: %s' % (lineno, message)}
+
+
+def read_jsonl(stream):
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            change = loads(line)
+        except ValueError as exc:
+            yield invalid_line(lineno, 'invalid json, %s' % exc)
+            continue
+        if not isinstance(change, dict):
+            yield invalid_line(lineno, 'expected a json object')
+            continue
+        change['line'] = lineno
+        yield change
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    try:
+        # Read the header first, the line numbers below are the rows ones
+        reader.fieldnames
+    except csv.Error as exc:
+        yield invalid_line(reader.line_num, 'invalid csv header, %s' % exc)
+        return
+    while True:
+        # A row spans several lines when a quoted cell holds line breaks
+        lineno = reader.line_num + 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield invalid_line(lineno, 'invalid csv, %s' % exc)
+            continue
+        # Empty cells fall back to the change defaults
+        change = dict((key.strip(), value) for key, value in row.items()
+                      if key and value not in (None, ''))
+        for key in BOOLEAN_KEYS:
+            if key in change:
+                change[key] = to_bool(change[key])
+        change['line'] = lineno
+        yield change
+
+
+def read_changes(stream, fmt='jsonl'):
+    """
+    Yield changes read from an open file.
+
+    :param stream: File object to read
+    :type stream: file
+    :param fmt: File format, csv or jsonl
+    :type fmt: String
+    """
+    if fmt == 'csv':
+        return read_csv(stream)
+    elif fmt == 'jsonl':
+        return read_jsonl(stream)
+    raise ValueError('Unknown changes format: %s, use one of %s'
+                     '' % (fmt, ', '.join(FORMATS)))
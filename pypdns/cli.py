@@ -2,13 +2,21 @@
 pypdns
 
 Usage:
-    pypdns zones list [--name <name>] [-c <cfg_pth>] [--log <log_level>]
-    pypdns zones get <zone_name> [--name <name>] [--type <type>] [--log <log_level>] [-c <cfg_pth>]
-    pypdns zones create <zone_name> [--soa <soa>] [--kind <kind>] [--nameservers=<nameservers>] [--soa-edit <soa_edit>] [--soa-ttl <soa_ttl>]
-    pypdns record add <full_record_name> <content> <comment> <rtype> [--ttl <ttl>] [--reverse] [--disabled] [--override] [-c <cfg_pth>] [--log <log_level>]
-    pypdns record delete <full_record_name> <comment> <rtype> [--override] [-c <cfg_pth>] [--log <log_level>]
-    pypdns record edit <zone_name> <record_name> <content> <comment> --rtype <type> [--changetype <changetype>] [--ttl <ttl>] [--reverse] [--disabled] [--override] [-c <cfg_pth>] [--log <log_level>]
-    pypdns search <term> [--otype <object_type>] [--zone <zone>] [--rtype <type>] [--max-results <max_results>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones list [--name <name>] [--output <output>] [--servers <servers>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones get <zone_name> [--name <name>] [--type <type>] [--output <output>] [--log <log_level>] [--servers <servers>] [-c <cfg_pth>]
+    pypdns zones create <zone_name> [--soa <soa>] [--kind <kind>] [--nameservers=<nameservers>] [--soa-edit <soa_edit>] [--soa-ttl <soa_ttl>] [--output <output>]
+    pypdns zones compare [--name <name>] [--contents] [--servers <servers>] [--output <output>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones export <directory> [--name <name>] [--format <format>] [--workers <workers>] [--restart] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones watch [--name <name>] [--interval <interval>] [--initial] [--workers <workers>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones import <zone_name> <zone_file> [--kind <kind>] [--batch-size <batch_size>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns zones reconcile <zone_name> <rrsets_file> [--dry-run] [--keep-extra] [--batch-size <batch_size>] [--output <output>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns record add <full_record_name> <content> <comment> <rtype> [--ttl <ttl>] [--reverse] [--disabled] [--override] [--output <output>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns record delete <full_record_name> <comment> <rtype> [--override] [--output <output>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns record edit <zone_name> <record_name> <content> <comment> --rtype <type> [--changetype <changetype>] [--ttl <ttl>] [--reverse] [--disabled] [--override] [--output <output>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns bulk <changes_file> [--format <format>] [--batch-size <batch_size>] [--workers <workers>] [--no-override] [--servers <servers>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns reverse check [--name <name>] [--fix] [--batch-size <batch_size>] [--workers <workers>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns serve [--socket <path>] [-c <cfg_pth>] [--log <log_level>]
+    pypdns search <term> [--otype <object_type>] [--zone <zone>] [--rtype <type>] [--max-results <max_results>] [--output <output>] [--servers <servers>] [-c <cfg_pth>] [--log <log_level>]
     pypdns (-h | --help)
     pypdns --version
 
@@ -23,7 +31,7 @@ Options:
     --type <type>                    Filter results on type for a given zone, regex format [default: .*]
     --soa <soa>                      SOA valid string, override default_soa in config file
     --soa-ttl <soa_ttl>              SOA ttl, [default: 7200]
-    --kind <kind>                    Zone type, [default: NATIVE]
+    --kind <kind>                    Zone type, of created and imported zones [default: NATIVE]
     --nameservers=<nameservers>      List of namservers for zone, override value from config file
     --soa_edit <soa_edit>            Soa edit behaviour for the zone, [default: DEFAULT]
     --rtype <type>                   Record's type
@@ -35,25 +43,151 @@ Options:
     --otype <object_type>            Filter search result, one of : record or zone [default: record]
     --zone <zone>                    Filter search result on zone name (sets object_type to record)
     --max-results <max_results>      Limit search results
+    --format <format>                Changes file format, csv or jsonl, guessed from file extension, default to jsonl. Zones export format, jsonl or bind, default to jsonl
+    --restart                        Export every zone again, ignore the checkpoint of a previous export
+    --batch-size <batch_size>        Maximum number of rrsets per PATCH request, override batch-size from config file
+    --dry-run                        Only print the differences, do not change the zone
+    --keep-extra                     Do not delete rrsets missing from the rrsets file
+    --no-override                    Do not replace existing records, changes on them are reported with code -1
+    --workers <workers>              Number of concurrent requests on different zones, override max-workers from config file
+    --interval <interval>            Seconds between two polls of the zones listing, override watch-interval from config file
+    --initial                        Print the content of the watched zones as added rrsets at start
+    --fix                            Send the PATCH requests fixing the PTR records found inconsistent
+    --servers <servers>              Run the command concurrently on the servers of the [server:<name>] config sections, comma separated names or all
+    --contents                       Also compare the rrsets of the zones found on several servers
+    --output <output>                Output format: pretty (one indented json document) or jsonl (a compact json line per item, written as soon as it is found) [default: pretty]
+    --socket <path>                  Unix socket of the daemon, default to $PYPDNS_SOCKET or pypdns-<uid>.sock in $XDG_RUNTIME_DIR (or the temporary directory)
 """
-import logging
+import sys
 import json
+import types
+import logging
 
 from docopt import docopt
 
 from . import __version__ as VERSION
-from .pypdns import PyPDNS
+
+# The library (and requests with it) is imported once options are parsed,
+# --help and --version do not pay for it.
+
+
+def _print(out, text):
+    out.write(text + '\n')
+
+
+def _line(out, data):
+    # Compact json line, encoded with the fast json backend when installed
+    from .jsonlib import dumps
+    _print(out, dumps(data, sort_keys=True))
+
+
+def _output(out, data, output='pretty', indent=True):
+    """
+    Print data as one json document, or with jsonl output a json line per
+    item of lists and generators, consumed as they are printed.
+    """
+    if output == 'jsonl':
+        if isinstance(data, (list, types.GeneratorType)):
+            for item in data:
+                _line(out, item)
+        else:
+            _line(out, data)
+    elif output != 'pretty':
+        raise ValueError('Unknown output %s, expected pretty or jsonl' %
+                         output)
+    elif indent:
+        _print(out, json.dumps(data, sort_keys=True, indent=4,
+                               separators=(',', ': ')))
+    else:
+        _print(out, json.dumps(data))
+    out.flush()
+
+
+def bulk(pdns_api, path, fmt=None, batch_size=None, concurrent=False,
+         override=True, out=None):
+    """
+    Apply changes read from path (- for stdin), print a json line per change.
+    """
+    out = out or sys.stdout
+    from .changes import read_changes, guess_format, open_changes
+
+    fmt = fmt or guess_format(path)
+    stream = sys.stdin if path == '-' else open_changes(path, fmt)
+    try:
+        changes = read_changes(stream, fmt)
+        batches = pdns_api.iter_apply_changes(changes, batch_size, concurrent,
+                                              override)
+        _print_batches(out, batches)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _print_batches(out, batches):
+    # A json line per change, batches of a cluster are tagged with their
+    # server and a server failing has no batch
+    for batch in batches:
+        if 'changes' not in batch:
+            _line(out, batch)
+            continue
+        for change in batch['changes']:
+            result = {'name': change.get('name'),
+                      'type': change.get('type'),
+                      'changetype': change.get('changetype', 'REPLACE'),
+                      'zone': batch['zone'],
+                      'code': batch['code'],
+                      'success': batch['success']}
+            if 'line' in change:
+                result['line'] = change['line']
+            if 'server' in batch:
+                result['server'] = batch['server']
+            if not batch['success']:
+                result['error'] = batch['result']
+            _line(out, result)
+        out.flush()
+
+
+def check_reverse(pdns_api, name='.*', fix=False, batch_size=None, out=None):
+    """
+    Print a json line per PTR inconsistency, then with fix a json line per
+    change sent to fix them.
+    """
+    out = out or sys.stdout
+
+    def report(issues):
+        for issue in issues:
+            _line(out, dict((k, v) for k, v in issue.items() if k != 'fix'))
+            yield issue
+
+    issues = report(pdns_api.iter_check_reverse(name))
+    if not fix:
+        for _ in issues:
+            pass
+        out.flush()
+        return
+    # Fixes are sent while the check goes on
+    _print_batches(out, pdns_api.fix_reverse(issues, batch_size))
 
 
 def main():
     options = docopt(__doc__, version=VERSION)
-    cfg = {
-        'config_path': options.get('--config'),
-        'endpoint': options.get('--endpoint'),
-        'apikey': options.get('--apikey')
-    }
+    if not options['serve']:
+        from .daemon import forward
+        code = forward(options)
+        if code is not None:
+            sys.exit(code)
+
+    from .api import PdnsError
+    try:
+        run(options)
+    except PdnsError as exc:
+        logging.getLogger(__name__).error('%s', exc)
+        sys.exit(1)
+
+
+def setup_logging(level):
     logging.basicConfig()
-    log_level = getattr(logging, options['--log'].upper(), None)
+    log_level = getattr(logging, level.upper(), None)
     if not isinstance(log_level, int):
         raise ValueError('Invalid log level: %s' % log_level)
 
@@ -64,63 +198,242 @@ def main():
         '%(asctime)s %(name)-12s %(levelname)-8s %(message)s')
     handler.setFormatter(formatter)
     logger.addHandler(handler)
-    logger.info('Start')
-    pdns_api = PyPDNS(cfg)
+
+
+def _ext_config(options):
+    return {
+        'config_path': options.get('--config'),
+        'endpoint': options.get('--endpoint'),
+        'apikey': options.get('--apikey'),
+        'max-workers': options.get('--workers')
+    }
+
+
+def run(options):
+    setup_logging(options['--log'])
+    logging.getLogger().info('Start')
+    if options.get('--servers') or options.get('compare'):
+        cluster(options)
+        return
+
+    from .pypdns import PyPDNS
+    pdns_api = PyPDNS(_ext_config(options))
+
+    if options['serve']:
+        import signal
+        from .daemon import PdnsDaemon
+
+        def terminate(signum, frame):
+            raise SystemExit(0)
+        signal.signal(signal.SIGTERM, terminate)
+        PdnsDaemon(pdns_api, options, options['--socket']).serve_forever()
+        return
+
     # We are in CLI mode
     pdns_api._interactive = True
+    try:
+        execute(pdns_api, options)
+    finally:
+        pdns_api.close()
+
+
+def cluster(options, out=None):
+    """
+    Run the command of options on the servers of --servers (default to all
+    servers), print the merged results.
+    """
+    from .cluster import PdnsCluster
+
+    out = out or sys.stdout
+    output = options.get('--output') or 'pretty'
+    servers = options.get('--servers')
+    servers = None if servers in (None, 'all') else servers.split(',')
+    pdns_cluster = PdnsCluster(_ext_config(options), servers)
+    try:
+        if options.get('compare'):
+            compare = (pdns_cluster.iter_compare_zones if output == 'jsonl'
+                       else pdns_cluster.compare_zones)
+            _output(out, compare(options['--name'],
+                                 contents=options['--contents']), output)
+        elif options.get('list'):
+            _output(out, pdns_cluster.zones_list(options['--name']), output)
+        elif options.get('get'):
+            _output(out, pdns_cluster.zones_get(options['<zone_name>'],
+                                                options['--name'],
+                                                options['--type']), output)
+        elif options.get('search'):
+            _output(out, pdns_cluster.search(
+                options['<term>'], object_type=options['--otype'],
+                zone=options['--zone'], rtype=options['--rtype'],
+                max_results=options['--max-results']), output)
+        elif options.get('bulk'):
+            _cluster_bulk(pdns_cluster, options, out)
+    finally:
+        pdns_cluster.close()
+
+
+def _cluster_bulk(pdns_cluster, options, out):
+    # Each server streams the changes file, stdin can only be read once and
+    # is spooled to a temporary file first
+    import os
+    from .changes import guess_format
+
+    path = options['<changes_file>']
+    fmt = options['--format'] or guess_format(path)
+    spool = None
+    if path == '-':
+        import shutil
+        import tempfile
 
+        fd, spool = tempfile.mkstemp(prefix='pypdns-', suffix='.' + fmt)
+        with os.fdopen(fd, 'w') as stream:
+            shutil.copyfileobj(sys.stdin, stream)
+        path = spool
+    try:
+        _print_batches(out, pdns_cluster.iter_apply_changes(
+            lambda: _iter_changes_file(path, fmt), options['--batch-size'],
+            concurrent=bool(options['--workers']),
+            override=not options['--no-override']))
+    finally:
+        if spool:
+            os.remove(spool)
+
+
+def _iter_changes_file(path, fmt):
+    from .changes import read_changes, open_changes
+
+    with open_changes(path, fmt) as stream:
+        for change in read_changes(stream, fmt):
+            yield change
+
+
+def execute(pdns_api, options, out=None):
+    """
+    Run the command of options with pdns_api, write its output to out
+    (default to stdout).
+    """
+    out = out or sys.stdout
+    output = options.get('--output') or 'pretty'
     if 'zones' in options and options['zones']:
         if 'list' in options and options['list']:
-            print(json.dumps(pdns_api.zones_list(options['--name']), sort_keys=True, indent=4, separators=(',', ': ')))
+            _output(out, pdns_api.zones_list(options['--name']), output)
 
         if 'get' in options and options['get']:
-            print(json.dumps(pdns_api.zones_get(options['<zone_name>'],
-                                                options['--name'], options['--type']),
-                             sort_keys=True, indent=4, separators=(',', ': ')))
+            # rrsets are printed while the zone downloads
+            get = (pdns_api.iter_zone if output == 'jsonl'
+                   else pdns_api.zones_get)
+            _output(out, get(options['<zone_name>'], options['--name'],
+                             options['--type']), output)
 
         if 'create' in options and options['create']:
             nameservers = options.get('--nameservers', [])
             nameservers = nameservers and nameservers.split(',')
 
-            print(json.dumps(pdns_api.zones_create(options['<zone_name>'],
-                                         kind=options['--kind'],
-                                         soa=options['--soa'],
-                                         nameservers=nameservers,
-                                         soa_edit=options['--soa-edit'],
-                                         soa_ttl=options['--soa-ttl']),
-                             sort_keys=True, indent=4, separators=(',', ': ')))
+            _output(out, pdns_api.zones_create(options['<zone_name>'],
+                                               kind=options['--kind'],
+                                               soa=options['--soa'],
+                                               nameservers=nameservers,
+                                               soa_edit=options['--soa-edit'],
+                                               soa_ttl=options['--soa-ttl']),
+                    output)
+
+        if 'export' in options and options['export']:
+            results = pdns_api.iter_export_zones(
+                options['<directory>'], options['--name'],
+                fmt=options['--format'] or 'jsonl',
+                resume=not options['--restart'])
+            for result in results:
+                _line(out, result)
+                out.flush()
+
+        if 'watch' in options and options['watch']:
+            events = pdns_api.iter_watch(options['--name'],
+                                         interval=options['--interval'],
+                                         initial=options['--initial'])
+            try:
+                for event in events:
+                    _line(out, event)
+                    out.flush()
+            except KeyboardInterrupt:
+                pass
+
+        if 'import' in options and options['import']:
+            results = pdns_api.iter_import_zone(
+                options['<zone_name>'], options['<zone_file>'],
+                max_rrsets=options['--batch-size'], kind=options['--kind'])
+            for result in results:
+                _line(out, result)
+                out.flush()
+
+        if 'reconcile' in options and options['reconcile']:
+            from .jsonlib import loads
+            with open(options['<rrsets_file>'], 'rb') as fh:
+                desired = loads(fh.read())
+            differences, results = pdns_api.reconcile(
+                options['<zone_name>'], desired,
+                dry_run=options['--dry-run'],
+                prune=not options['--keep-extra'],
+                max_rrsets=options['--batch-size'])
+            if not isinstance(results, list):
+                # Zone not found
+                _output(out, differences, output)
+            else:
+                result = {
+                    'differences': [dict((k, diff[k]) for k in
+                                         ('action', 'name', 'type', 'current',
+                                          'desired'))
+                                    for diff in differences],
+                    'results': [dict((k, result[k]) for k in
+                                     ('code', 'success', 'result'))
+                                for result in results]
+                }
+                _output(out, result, output)
 
     if options['record']:
         if options['add']:
-            print(json.dumps(pdns_api.add(options['<full_record_name>'],
-                                          options['<content>'],
-                                          options['<comment>'],
-                                          options['<rtype>'],
-                                          ttl=int(options['--ttl']),
-                                          reverse=options['--reverse'],
-                                          override=options['--override'])))
+            _output(out, pdns_api.add(options['<full_record_name>'],
+                                      options['<content>'],
+                                      options['<comment>'],
+                                      options['<rtype>'],
+                                      ttl=int(options['--ttl']),
+                                      reverse=options['--reverse'],
+                                      override=options['--override']),
+                    output, indent=False)
 
         if options['delete']:
-            print(json.dumps(pdns_api.delete(options['<full_record_name>'],
-                                             options['<comment>'],
-                                             options['<rtype>'],
-                                             options['--override'])))
+            _output(out, pdns_api.delete(options['<full_record_name>'],
+                                         options['<comment>'],
+                                         options['<rtype>'],
+                                         options['--override']),
+                    output, indent=False)
         if options['edit']:
-            print(json.dumps(pdns_api.record_add(options['<zone_name>'],
-                                                 options['<record_name>'],
-                                                 options['<content>'],
-                                                 options['<comment>'],
-                                                 type_=options['--rtype'],
-                                                 changetype=options['--changetype'],
-                                                 ttl=int(options['--ttl']),
-                                                 reverse=options['--reverse'],
-                                                 disabled=options['--disabled'],
-                                                 override=options['--override']),
-                             sort_keys=True, indent=4, separators=(',', ': ')))
+            _output(out, pdns_api.record_add(options['<zone_name>'],
+                                             options['<record_name>'],
+                                             options['<content>'],
+                                             options['<comment>'],
+                                             type_=options['--rtype'],
+                                             changetype=options['--changetype'],
+                                             ttl=int(options['--ttl']),
+                                             reverse=options['--reverse'],
+                                             disabled=options['--disabled'],
+                                             override=options['--override']),
+                    output)
+    if options['bulk']:
+        bulk(pdns_api, options['<changes_file>'], fmt=options['--format'],
+             batch_size=options['--batch-size'],
+             concurrent=bool(options['--workers']),
+             override=not options['--no-override'], out=out)
+
+    if options['reverse']:
+        check_reverse(pdns_api, options['--name'], fix=options['--fix'],
+                      batch_size=options['--batch-size'], out=out)
+
     if options['search']:
-        print(json.dumps(pdns_api.search(options['<term>'],
-                                         object_type=options['--otype'],
-                                         zone=options['--zone'],
-                                         rtype=options['--rtype'],
-                                         max_results=options['--max-results']),
-                         sort_keys=True, indent=4, separators=(',', ': ')))
+        # Results are printed while they download
+        search = pdns_api.iter_search if output == 'jsonl' else pdns_api.search
+        _output(out, search(options['<term>'],
+                            object_type=options['--otype'],
+                            zone=options['--zone'],
+                            rtype=options['--rtype'],
+                            max_results=options['--max-results']),
+                output)
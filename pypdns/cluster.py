@@ -0,0 +1,327 @@
+"""
+Fan-out client: an operation run on several PowerDNS API servers
+concurrently, results merged and tagged with the server name.
+
+Servers are named by [server:<name>] sections of the configuration file,
+their values (endpoint, apikey, ...) override the [pypdns] ones:
+
+    [pypdns]
+    apikey = shared-key
+
+    [server:eu]
+    endpoint = http://pdns-eu:8081/api/v1/servers/localhost
+
+    [server:us]
+    endpoint = http://pdns-us:8081/api/v1/servers/localhost
+"""
+import logging
+import collections
+
+from .api import PdnsError
+from .compat import iteritems
+from .diff import IGNORED_TYPES, rrset_key, rrset_signature
+from .pypdns import PyPDNS, filter_zones, load_config, server_names
+
+
+log = logging.getLogger(__name__)
+
+# Overrides of a single server, not applied to the servers of a cluster
+SERVER_OPTIONS = ('endpoint', 'apikey', 'server')
+
+
+class PdnsCluster(object):
+    """
+    PyPDNS instances of the configured servers, operations are run on all
+    of them or on the servers given, one thread per server.
+
+    Merged results are lists of dicts tagged with a server key, a server
+    failing is reported as {'server': ..., 'error': response body or
+    message}.
+    """
+
+    _executor = None
+
+    def __init__(self, ext_config={}, servers=None):
+        """
+        :param ext_config: PyPDNS configuration overrides applied to every
+        server, endpoint and apikey excepted
+        :type ext_config: dict
+        :param servers: Names of the servers used, default to every server
+        configured
+        :type servers: list
+        """
+        names = server_names(load_config(ext_config.get('config_path')))
+        if not names:
+            raise ValueError('No server configured, add [server:<name>] '
+                             'sections to the configuration file')
+        if servers:
+            unknown = [name for name in servers if name not in names]
+            if unknown:
+                raise ValueError('Unknown servers %s, configured servers: %s'
+                                 % (', '.join(unknown), ', '.join(names)))
+            names = list(servers)
+
+        config = dict((key, value) for key, value in iteritems(ext_config)
+                      if key not in SERVER_OPTIONS)
+        self.servers = collections.OrderedDict(
+            (name, PyPDNS(dict(config, server=name))) for name in names)
+
+    @property
+    def executor(self):
+        """
+        Thread pool running operations on the servers, sized by the number
+        of servers and max-workers of the first one.
+        """
+        if self._executor is None:
+            from .executor import ApiExecutor
+            first = next(iter(self.servers.values()))
+            self._executor = ApiExecutor(max(len(self.servers),
+                                             int(first.config['max-workers'])))
+        return self._executor
+
+    def close(self):
+        for pdns in self.servers.values():
+            pdns.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def fan_out(self, fn, servers=None):
+        """
+        Call fn(pdns) for each server concurrently, yield (server name,
+        result) pairs in server order. A PdnsError raised for a server is
+        returned as its result.
+
+        :param servers: Names of the servers, default to all servers
+        :type servers: list
+        """
+        names = list(servers or self.servers)
+
+        def call(name):
+            try:
+                return name, fn(self.servers[name])
+            except PdnsError as exc:
+                log.error('Server %s failed: %s', name, exc)
+                return name, exc
+
+        return self.executor.imap(call, names)
+
+    @staticmethod
+    def merge(results):
+        """
+        Return the items of the list results of (server, result) pairs
+        tagged with their server, other results are server errors.
+        """
+        merged = []
+        for name, result in results:
+            if isinstance(result, list):
+                merged.extend(dict(item, server=name) for item in result)
+            else:
+                if isinstance(result, Exception):
+                    result = str(result)
+                merged.append({'server': name, 'error': result})
+        return merged
+
+    def zones_list(self, name='.*', servers=None):
+        return self.merge(self.fan_out(
+            lambda pdns: pdns.zones_list(name), servers))
+
+    def zones_get(self, zone_id, name='.*', _type='.*', servers=None):
+        return self.merge(self.fan_out(
+            lambda pdns: pdns.zones_get(zone_id, name, _type), servers))
+
+    def search(self, term, object_type=None, zone=None, rtype=None,
+               max_results=None, servers=None):
+        return self.merge(self.fan_out(
+            lambda pdns: pdns.search(term, object_type, zone, rtype,
+                                     max_results), servers))
+
+    def apply_changes(self, changes, max_rrsets=None, concurrent=False,
+                      override=True, servers=None):
+        """
+        Same as iter_apply_changes, return the list of batch results.
+        """
+        return list(self.iter_apply_changes(changes, max_rrsets, concurrent,
+                                            override, servers))
+
+    def iter_apply_changes(self, changes, max_rrsets=None, concurrent=False,
+                           override=True, servers=None):
+        """
+        Apply changes on every server (see PyPDNS.iter_apply_changes), yield
+        the batch results of all servers tagged with their server, as they
+        complete. A server failing is reported as {'server': ...,
+        'error': ...}.
+
+        changes is either a callable returning a new iterable of changes,
+        called once per server so that each server streams them, or an
+        iterable loaded in memory once. Results wait in a bounded queue,
+        servers pause while it is full: memory does not grow with the
+        number of changes.
+        """
+        import threading
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+
+        if not callable(changes):
+            changes_list = list(changes)
+            changes = lambda: changes_list
+        names = list(servers or self.servers)
+        results = queue.Queue(maxsize=len(names) * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            # Gives up once the consumer stopped reading
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(name):
+            try:
+                for batch in self.servers[name].iter_apply_changes(
+                        changes(), max_rrsets, concurrent, override):
+                    if not put(dict(batch, server=name)):
+                        return
+            except PdnsError as exc:
+                log.error('Server %s failed: %s', name, exc)
+                put({'server': name, 'error': str(exc)})
+            except BaseException as exc:
+                put(exc)
+            finally:
+                put(done)
+
+        for name in names:
+            self.executor.submit(run, name)
+        running = len(names)
+        try:
+            while running:
+                item = results.get()
+                if item is done:
+                    running -= 1
+                elif isinstance(item, BaseException):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+
+    def compare_zones(self, name='.*', contents=False, servers=None):
+        """
+        Same as iter_compare_zones, return the list of divergences.
+        """
+        return list(self.iter_compare_zones(name, contents, servers))
+
+    def iter_compare_zones(self, name='.*', contents=False, servers=None):
+        """
+        Compare the zones matching name across servers, yield a dict per
+        zone diverging, in zone name order :
+        {'zone': ..., 'issues': ['missing', 'serial', 'content'],
+         'serials': {server: serial or None if missing},
+         'rrsets': [{'name': ..., 'type': ..., 'servers': {server:
+                     {'ttl': ..., 'records': [...]} or None}}]}
+
+        missing: the zone is absent from some servers, serial: serials
+        differ. With contents set, zones found on several servers are
+        fetched from each of them (zones concurrently) and their rrsets
+        compared on ttl and records, SOA and comments excluded: the
+        differing rrsets are listed and the content issue is reported when
+        there are some. A server whose listing fails is reported as
+        {'zone': None, 'server': ..., 'error': ...} and left out.
+        """
+        listings = collections.OrderedDict()
+        for server, result in self.fan_out(
+                lambda pdns: self._listing(pdns, name), servers):
+            if isinstance(result, list):
+                listings[server] = dict((zone['name'], zone)
+                                        for zone in result)
+                continue
+            yield {'zone': None, 'server': server,
+                   'error': str(result) if isinstance(result, Exception)
+                   else result}
+
+        zone_names = sorted(set(zone_name for zones in listings.values()
+                                for zone_name in zones))
+        jobs = ((zone_name, listings, contents) for zone_name in zone_names)
+        for divergence in self.executor.imap(self._compare_zone, jobs):
+            if divergence['issues']:
+                yield divergence
+
+    @staticmethod
+    def _listing(pdns, name):
+        zones, code = pdns._list_zones(name)
+        if code != 200:
+            return zones
+        return filter_zones(zones, name)
+
+    def _compare_zone(self, job):
+        zone_name, listings, contents = job
+        serials = collections.OrderedDict(
+            (server, zones[zone_name].get('serial')
+             if zone_name in zones else None)
+            for server, zones in iteritems(listings))
+        issues = []
+        present = [server for server, zones in iteritems(listings)
+                   if zone_name in zones]
+        if len(present) < len(listings):
+            issues.append('missing')
+        if len(set(serials[server] for server in present)) > 1:
+            issues.append('serial')
+
+        divergence = {'zone': zone_name, 'issues': issues, 'serials': serials}
+        if contents and len(present) > 1:
+            zone_ids = dict((server, listings[server][zone_name].get('id') or
+                             zone_name) for server in present)
+            rrsets, errors = self._compare_contents(zone_ids)
+            divergence['rrsets'] = rrsets
+            if rrsets:
+                issues.append('content')
+            if errors:
+                divergence['errors'] = errors
+        return divergence
+
+    def _compare_contents(self, zone_ids):
+        """
+        Return 2-tuple : rrsets differing between the servers of zone_ids
+        (server -> zone id), errors by server.
+        """
+        contents = collections.OrderedDict()
+        errors = {}
+        for server, zone_id in iteritems(zone_ids):
+            try:
+                rrsets, code = self.servers[server].zones_api.iter_rrsets(
+                    zone_id)
+                if code == 200:
+                    contents[server] = dict(
+                        (rrset_key(rrset), rrset) for rrset in rrsets
+                        if rrset['type'] not in IGNORED_TYPES)
+                    continue
+            except (PdnsError, ValueError) as exc:
+                rrsets = str(exc)
+            errors[server] = rrsets
+        if len(contents) < 2:
+            return [], errors
+
+        keys = sorted(set(key for rrsets in contents.values()
+                          for key in rrsets))
+        differing = []
+        for key in keys:
+            found = [rrsets.get(key) for rrsets in contents.values()]
+            signatures = set(rrset_signature(rrset, comments=False)
+                             if rrset is not None else None
+                             for rrset in found)
+            if len(signatures) == 1:
+                continue
+            differing.append({
+                'name': key[0], 'type': key[1],
+                'servers': collections.OrderedDict(
+                    (server, {'ttl': rrset['ttl'],
+                              'records': rrset['records']}
+                     if rrset is not None else None)
+                    for server, rrset in zip(contents, found))})
+        return differing, errors
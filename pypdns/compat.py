@@ -0,0 +1,23 @@
+"""
+Python 2 compatibility names, resolved from the standard library.
+"""
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+if PY2:
+    import ConfigParser as configparser
+    string_types = basestring  # noqa: F821
+    input = raw_input  # noqa: F821
+    range = xrange  # noqa: F821
+    intern = intern
+else:
+    import configparser
+    string_types = str
+    input = input
+    range = range
+    intern = sys.intern
+
+
+def iteritems(mapping):
+    return mapping.iteritems() if PY2 else iter(mapping.items())
@@ -0,0 +1,300 @@
+"""
+Daemon mode: pypdns serve keeps a PyPDNS instance, with its connection pool
+and caches, behind a Unix socket. The cli forwards commands to it when it runs
+with the same configuration and falls back to direct mode otherwise.
+
+Messages are json lines. The client sends {'options': docopt options, 'cwd':
+working directory}, the daemon answers with {'out': text} lines followed by
+{'exit': code, 'error': message or None}, or {'fallback': true} when the
+command must run in direct mode.
+
+This module is imported by every cli invocation, the library is only imported
+by the daemon.
+"""
+import os
+import sys
+import json
+import stat
+import socket
+import struct
+import logging
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+log = logging.getLogger(__name__)
+
+SOCKET_ENV = 'PYPDNS_SOCKET'
+
+# Options naming files, made absolute before being forwarded
+PATH_OPTIONS = ('--config', '<changes_file>', '<rrsets_file>', '<directory>',
+                '<zone_file>')
+
+
+def socket_path(path=None):
+    """
+    Return the daemon socket path: path, the PYPDNS_SOCKET environment
+    variable or pypdns-<uid>.sock in XDG_RUNTIME_DIR (default to the
+    temporary directory).
+    """
+    path = path or os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        import tempfile
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, 'pypdns-%d.sock' % os.getuid())
+
+
+def config_key(options, cwd):
+    """
+    Return what identifies the configuration of a command run from cwd: the
+    configuration files read, with their modification time, and the options
+    overriding them.
+    """
+    from .pypdns import config_paths
+
+    files = []
+    for path in config_paths(options.get('--config'), cwd):
+        try:
+            files.append((os.path.realpath(path), os.path.getmtime(path)))
+        except OSError:
+            continue
+    return (tuple(files), options.get('--endpoint'), options.get('--apikey'))
+
+
+def forwardable(options):
+    """
+    Return True if the command of options can run in the daemon: it does not
+    read stdin nor prompt for confirmation on a terminal, and runs on the
+    daemon server only.
+    """
+    if options.get('serve') or options.get('<changes_file>') == '-':
+        return False
+    if options.get('--servers') or options.get('compare'):
+        return False
+    if options.get('record') and not options.get('--override'):
+        return not sys.stdin.isatty()
+    return True
+
+
+def trusted_socket(path):
+    """
+    Return True if path is a socket owned by the current user that other
+    users cannot write to. In a shared directory such as /tmp, another user
+    could create the socket first and receive the forwarded commands.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(info.st_mode):
+        log.warning('Not forwarding to %s: not a socket', path)
+        return False
+    if info.st_uid != os.getuid():
+        log.warning('Not forwarding to %s: owned by user %d', path,
+                    info.st_uid)
+        return False
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        log.warning('Not forwarding to %s: writable by other users', path)
+        return False
+    return True
+
+
+def _peer_uid(sock):
+    # User of the process listening on sock, None when the platform does
+    # not tell (SO_PEERCRED is Linux only)
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def forward(options, path=None, out=None, err=None):
+    """
+    Run the command of options in the daemon listening on path, write its
+    output to out (default to stdout). Return the command exit code, None when
+    no daemon is running or it must run in direct mode. Commands are only
+    forwarded to a socket of the current user (see trusted_socket) and,
+    where the platform tells, to a daemon run by this user.
+    """
+    path = socket_path(path)
+    if not forwardable(options) or not os.path.exists(path):
+        return None
+    if not trusted_socket(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        uid = _peer_uid(sock)
+    except socket.error as exc:
+        log.debug('No daemon on %s: %s', path, exc)
+        sock.close()
+        return None
+    if uid is not None and uid != os.getuid():
+        log.warning('Not forwarding to %s: daemon run by user %d', path, uid)
+        sock.close()
+        return None
+
+    out = out or sys.stdout
+    err = err or sys.stderr
+    cwd = os.getcwd()
+    options = dict(options)
+    for key in PATH_OPTIONS:
+        if options.get(key):
+            options[key] = os.path.join(cwd, options[key])
+    request = {'options': options, 'cwd': cwd}
+    try:
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        for line in sock.makefile('rb'):
+            message = json.loads(line.decode('utf-8'))
+            if 'out' in message:
+                out.write(message['out'])
+            elif message.get('fallback'):
+                log.debug('Daemon runs another configuration')
+                return None
+            else:
+                out.flush()
+                if message.get('error'):
+                    err.write('%s\n' % message['error'])
+                return message['exit']
+    finally:
+        sock.close()
+    # The command may have been applied, it must not run again
+    err.write('Connection to the daemon on %s lost\n' % path)
+    return 1
+
+
+class _Writer(object):
+    """
+    File like object sending written text to the client.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def send(self, **message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def write(self, text):
+        if text:
+            self.send(out=text)
+
+    def flush(self):
+        pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            self.server.daemon.handle(json.loads(line.decode('utf-8')),
+                                      _Writer(self.wfile))
+        except (IOError, socket.error) as exc:
+            log.warning('Client disconnected: %s', exc)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PdnsDaemon(object):
+    """
+    Run commands forwarded by the cli on a shared PyPDNS instance.
+
+    Commands never prompt: existing records are only replaced with
+    --override. The executor is sized by max-workers of the daemon
+    configuration, --workers and --log of forwarded commands are ignored.
+    """
+
+    def __init__(self, pdns_api, options, path=None):
+        """
+        :param options: docopt options of the serve command
+        :type options: dict
+        """
+        self.pdns_api = pdns_api
+        self.path = socket_path(path)
+        self.config = config_key(options, os.getcwd())
+        self._server = None
+
+    def handle(self, request, writer):
+        from .api import PdnsError
+        from .cli import execute
+
+        options = request['options']
+        if config_key(options, request['cwd']) != self.config:
+            writer.send(fallback=True)
+            return
+        try:
+            execute(self.pdns_api, options, writer)
+        except PdnsError as exc:
+            log.error('%s', exc)
+            writer.send(exit=1, error=str(exc))
+        except Exception as exc:
+            log.exception('Command failed')
+            writer.send(exit=1, error='%s: %s' % (type(exc).__name__, exc))
+        else:
+            writer.send(exit=0, error=None)
+
+    def bind(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                log.info('Removing stale socket %s', self.path)
+                os.unlink(self.path)
+            else:
+                raise RuntimeError('A daemon already listens on %s' %
+                                   self.path)
+            finally:
+                probe.close()
+
+        # The daemon holds the API key, only its user may connect
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon = self
+
+    def serve_forever(self):
+        """
+        Serve until interrupted or shutdown() is called.
+        """
+        if self._server is None:
+            self.bind()
+
+        log.info('Listening on %s', self.path)
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """
+        Stop serve_forever, to be called from another thread.
+        """
+        self._server.shutdown()
+
+    def close(self):
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self.pdns_api.close()
@@ -0,0 +1,108 @@
+"""
+Compute the changes turning a zone content into a desired one.
+
+rrsets are compared by (lower case name, type) and by a hashable signature of their
+ttl, records and comments, the diff is linear in the number of rrsets.
+"""
+import collections
+
+from .pypdns import record_key
+
+
+IGNORED_TYPES = ('SOA',)
+
+
+def rrset_key(rrset):
+    # Names are case insensitive, as on the server
+    return record_key(rrset['name'], rrset['type'])
+
+
+def _record(record):
+    # Records may be given as plain contents
+    if isinstance(record, dict):
+        return (record['content'], bool(record.get('disabled', False)))
+    return (record, False)
+
+
+def rrset_signature(rrset, comments=True):
+    """
+    Return a hashable representation of rrset content, comments are
+    compared on content and account only.
+    """
+    records = frozenset(_record(record) for record in rrset.get('records', ()))
+    signature = (int(rrset.get('ttl') or 0), records)
+    if comments:
+        signature += (frozenset((comment.get('content'), comment.get('account'))
+                                for comment in rrset.get('comments', ())),)
+    return signature
+
+
+def api_rrset(rrset, changetype):
+    """
+    Return rrset as expected in a PATCH request.
+    """
+    name, type_ = rrset_key(rrset)
+    data = {'name': name, 'type': type_, 'changetype': changetype}
+    if changetype == 'DELETE':
+        return data
+
+    data['ttl'] = int(rrset['ttl'])
+    data['records'] = [{'content': content, 'disabled': disabled}
+                       for content, disabled in (_record(record) for record
+                                                 in rrset.get('records', ()))]
+    if 'comments' in rrset:
+        data['comments'] = [{'content': comment.get('content'),
+                             'account': comment.get('account')}
+                            for comment in rrset['comments']]
+    return data
+
+
+def diff_rrsets(current, desired, prune=True, ignore_types=IGNORED_TYPES):
+    """
+    Return the list of differences between current and desired rrsets, each
+    difference is a dict : {'action': 'add' | 'change' | 'delete',
+    'name': ..., 'type': ..., 'current': rrset or None, 'desired': rrset
+    or None, 'rrset': rrset to send in a PATCH request}
+
+    Comments are only compared when the desired rrset holds a comments key.
+
+    :param prune: Delete current rrsets missing from desired
+    :type prune: bool
+    :param ignore_types: Types never changed, SOA is managed by PowerDNS
+    :type ignore_types: tuple
+    """
+    ignore_types = set(ignore_types or ())
+    existing = collections.OrderedDict(
+        (rrset_key(rrset), rrset) for rrset in current)
+
+    result = []
+    wanted = set()
+    for rrset in desired:
+        key = rrset_key(rrset)
+        if key in wanted:
+            raise ValueError('Duplicated rrset %s %s in desired rrsets' % key)
+        wanted.add(key)
+        if key[1] in ignore_types:
+            continue
+
+        old = existing.get(key)
+        if old is None:
+            action = 'add'
+        else:
+            compare_comments = 'comments' in rrset
+            if (rrset_signature(old, compare_comments) ==
+                    rrset_signature(rrset, compare_comments)):
+                continue
+            action = 'change'
+        result.append({'action': action, 'name': key[0], 'type': key[1],
+                       'current': old, 'desired': rrset,
+                       'rrset': api_rrset(rrset, 'REPLACE')})
+
+    if prune:
+        for key, rrset in existing.items():
+            if key in wanted or key[1] in ignore_types:
+                continue
+            result.append({'action': 'delete', 'name': key[0],
+                           'type': key[1], 'current': rrset, 'desired': None,
+                           'rrset': api_rrset(rrset, 'DELETE')})
+    return result
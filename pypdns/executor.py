@@ -0,0 +1,102 @@
+"""
+Thread pool running PowerDNS API calls concurrently.
+"""
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ApiExecutor(object):
+    """
+    Run API calls on a bounded pool of threads.
+
+    Calls submitted with the same ordering key run one after the other in
+    submission order, so PATCH requests on a zone are never reordered while
+    requests on different zones run concurrently.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs), return a Future.
+        """
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def submit_ordered(self, key, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) after every call previously submitted
+        with the same key, return a Future.
+
+        :param key: Ordering key, a zone name for instance
+        :type key: hashable
+        """
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            start = queue is None
+            if start:
+                queue = self._queues[key] = collections.deque()
+            queue.append((future, fn, args, kwargs))
+        if start:
+            self._pool.submit(self._drain, key)
+        return future
+
+    def _drain(self, key):
+        # A single worker runs the calls queued for a key, one at a time.
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                future, fn, args, kwargs = queue.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def imap(self, fn, iterable, key=None, max_pending=None):
+        """
+        Call fn on every item of iterable concurrently, yield the results in
+        input order. The iterable is consumed lazily, at most max_pending
+        calls are in flight or waiting for their result to be yielded.
+
+        :param key: Callable returning the ordering key of an item, items
+        with the same key are processed sequentially
+        :type key: callable
+        :param max_pending: Maximum number of pending calls, default to twice
+        the number of workers
+        :type max_pending: int
+        """
+        max_pending = max_pending or self.max_workers * 2
+        pending = collections.deque()
+        for item in iterable:
+            if key is None:
+                pending.append(self.submit(fn, item))
+            else:
+                pending.append(self.submit_ordered(key(item), fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        return False
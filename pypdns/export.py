@@ -0,0 +1,129 @@
+"""
+Zones export to a directory, one file per zone, with a checkpoint so an
+interrupted export resumes where it stopped.
+
+The checkpoint is a JSONL file appended with a line for each exported zone:
+{"zone": ..., "version": ..., "format": ..., "file": ..., "rrsets": ...}.
+A zone is exported again when its version (serials) changed since. A zone
+whose export failed is recorded with {"zone": ..., "version": ...,
+"format": ..., "error": ...}, it is exported again by the next run.
+"""
+import os
+import json
+import logging
+import tempfile
+import threading
+
+from .zonefile import FORMATS, write_zone
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT = '.pypdns-export.jsonl'
+
+
+def zone_path(directory, name, fmt):
+    """
+    Return the export file of zone name: example.com. is exported as
+    example.com.jsonl or example.com.zone
+    """
+    return os.path.join(directory, quote(name.rstrip('.'), safe='') +
+                        FORMATS[fmt])
+
+
+def write_zone_file(path, rrsets, origin, fmt):
+    """
+    Write rrsets to path, return the number of rrsets written. The file is
+    written aside then renamed, an interrupted export never leaves a
+    partial file.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            count = write_zone(rrsets, fh, origin, fmt)
+        os.rename(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return count
+
+
+class Checkpoint(object):
+    """
+    Zones already exported to directory, see module documentation.
+    """
+
+    def __init__(self, directory, resume=True):
+        """
+        :param resume: Load the existing checkpoint, otherwise it is removed
+        and every zone is exported
+        :type resume: bool
+        """
+        self.path = os.path.join(directory, CHECKPOINT)
+        self._done = {}
+        self._lock = threading.Lock()
+        if not resume:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+
+        try:
+            with open(self.path) as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Line cut by an interruption
+                        continue
+                    self._done[(entry['zone'], entry['format'])] = entry
+        except (IOError, OSError):
+            pass
+
+    def get(self, name, version, fmt):
+        """
+        Return the checkpoint entry of zone name exported at version in
+        format fmt, None if it must be exported.
+        """
+        entry = self._done.get((name, fmt))
+        if (entry is None or entry.get('version') != version or
+                entry.get('error') is not None):
+            return None
+        if not os.path.exists(os.path.join(os.path.dirname(self.path),
+                                           entry['file'])):
+            return None
+        return entry
+
+    def add(self, name, version, fmt, path, rrsets):
+        self._write({'zone': name, 'version': version, 'format': fmt,
+                     'file': os.path.basename(path), 'rrsets': rrsets})
+
+    def fail(self, name, version, fmt, error):
+        """
+        Record that zone name could not be exported, an entry of a previous
+        export is superseded.
+        """
+        self._write({'zone': name, 'version': version, 'format': fmt,
+                     'error': str(error)})
+
+    def _write(self, entry):
+        name, fmt = entry['zone'], entry['format']
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        with self._lock:
+            self._done[(name, fmt)] = entry
+            with open(self.path, 'a') as fh:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise ValueError('Unknown zone file format %s, expected one of %s' %
+                         (fmt, ', '.join(sorted(FORMATS))))
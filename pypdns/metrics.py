@@ -0,0 +1,266 @@
+"""
+Request hooks and in process metrics.
+
+Hooks are objects implementing some of the RequestHook methods, they are
+called for every API request and for PyPDNS client side operations:
+
+    pdns = PyPDNS(config)
+    metrics = MetricsCollector()
+    pdns.add_hook(metrics)
+    ...
+    print(metrics.prometheus())
+"""
+import time
+import logging
+import threading
+import contextlib
+import collections
+
+
+log = logging.getLogger(__name__)
+
+now = getattr(time, 'monotonic', time.time)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+class RequestInfo(object):
+    """
+    Data about an API request, filled as the request goes.
+
+    endpoint is the url template called (/zones/{}), sizes are in bytes and
+    durations in seconds, response_bytes is None for streamed responses
+    without Content-Length.
+    """
+
+    __slots__ = ('verb', 'endpoint', 'url', 'attempt', 'status',
+                 'request_bytes', 'response_bytes', 'elapsed', 'decode_time',
+                 'error')
+
+    def __init__(self, verb, endpoint, url, attempt=0):
+        self.verb = verb
+        self.endpoint = endpoint
+        self.url = url
+        self.attempt = attempt
+        self.status = None
+        self.request_bytes = 0
+        self.response_bytes = None
+        self.elapsed = None
+        self.decode_time = None
+        self.error = None
+
+
+class RequestHook(object):
+    """
+    Base class of hooks, every method does nothing.
+    """
+
+    def before_request(self, info):
+        """
+        Called before a request (and each of its retries) is sent.
+        """
+
+    def after_request(self, info):
+        """
+        Called once the response headers are received or the request failed
+        (info.error is set).
+        """
+
+    def after_decode(self, info):
+        """
+        Called once the json body of a response is decoded.
+        """
+
+    def operation(self, name, elapsed):
+        """
+        Called after a client side operation, e.g. zones_get.filter.
+        """
+
+
+def emit(hooks, event, *args):
+    """
+    Call event on every hook, a failing hook never breaks the call.
+    """
+    for hook in hooks:
+        try:
+            getattr(hook, event)(*args)
+        except Exception:
+            log.exception('Hook %r failed on %s', hook, event)
+
+
+@contextlib.contextmanager
+def trace(hooks, name):
+    """
+    Time the enclosed block and report it as operation name to hooks.
+    """
+    if not hooks:
+        yield
+        return
+    start = now()
+    try:
+        yield
+    finally:
+        emit(hooks, 'operation', name, now() - start)
+
+
+class Histogram(object):
+    """
+    Cumulative histogram with sum and count, as exposed by Prometheus.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min,
+                'max': self.max,
+                'avg': self.sum / self.count if self.count else None}
+
+
+class _EndpointStats(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.latency = Histogram(buckets)
+        self.decode = Histogram(buckets)
+        self.statuses = collections.Counter()
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (key, str(value).replace('"', '\\"'))
+                    for key, value in sorted(labels.items()))
+
+
+class MetricsCollector(RequestHook):
+    """
+    Hook aggregating latency, sizes, decode time and status codes by
+    endpoint and verb, and durations of client side operations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = collections.defaultdict(
+                lambda: _EndpointStats(self.buckets))
+            self._operations = collections.defaultdict(
+                lambda: Histogram(self.buckets))
+
+    def after_request(self, info):
+        with self._lock:
+            stats = self._endpoints[(info.endpoint, info.verb)]
+            stats.request_bytes += info.request_bytes or 0
+            if info.error is not None:
+                stats.errors += 1
+                stats.statuses['error'] += 1
+                return
+            stats.latency.observe(info.elapsed)
+            stats.statuses[info.status] += 1
+            stats.response_bytes += info.response_bytes or 0
+
+    def after_decode(self, info):
+        with self._lock:
+            self._endpoints[(info.endpoint, info.verb)].decode.observe(
+                info.decode_time)
+
+    def operation(self, name, elapsed):
+        with self._lock:
+            self._operations[name].observe(elapsed)
+
+    def summary(self):
+        """
+        Return the metrics as a dict: {'requests': {'GET /zones': {...}},
+        'operations': {'zones_get.filter': {...}}}
+        """
+        with self._lock:
+            requests = {}
+            for (endpoint, verb), stats in self._endpoints.items():
+                requests['%s %s' % (verb, endpoint)] = {
+                    'latency': stats.latency.summary(),
+                    'decode': stats.decode.summary(),
+                    'statuses': dict((str(status), count) for status, count
+                                     in stats.statuses.items()),
+                    'errors': stats.errors,
+                    'request_bytes': stats.request_bytes,
+                    'response_bytes': stats.response_bytes,
+                }
+            operations = dict((name, histogram.summary())
+                              for name, histogram in self._operations.items())
+        return {'requests': requests, 'operations': operations}
+
+    def prometheus(self, prefix='pypdns'):
+        """
+        Return the metrics in Prometheus text exposition format.
+        """
+        lines = []
+
+        def histogram(name, labels, hist):
+            # Bucket counts are already cumulative
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append('%s_bucket{%s} %d' % (
+                    name, _labels(le=bound, **labels), count))
+            lines.append('%s_bucket{%s} %d' % (
+                name, _labels(le='+Inf', **labels), hist.count))
+            lines.append('%s_sum{%s} %r' % (name, _labels(**labels),
+                                            hist.sum))
+            lines.append('%s_count{%s} %d' % (name, _labels(**labels),
+                                              hist.count))
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            operations = sorted(self._operations.items())
+
+            name = prefix + '_request_duration_seconds'
+            lines.append('# TYPE %s histogram' % name)
+            for (endpoint, verb), stats in endpoints:
+                histogram(name, {'endpoint': endpoint, 'verb': verb},
+                          stats.latency)
+
+            name = prefix + '_decode_duration_seconds'
+            lines.append('# TYPE %s histogram' % name)
+            for (endpoint, verb), stats in endpoints:
+                histogram(name, {'endpoint': endpoint, 'verb': verb},
+                          stats.decode)
+
+            name = prefix + '_requests_total'
+            lines.append('# TYPE %s counter' % name)
+            for (endpoint, verb), stats in endpoints:
+                for status, count in sorted(stats.statuses.items(),
+                                            key=lambda item: str(item[0])):
+                    lines.append('%s{%s} %d' % (name, _labels(
+                        endpoint=endpoint, verb=verb, status=status), count))
+
+            for kind in ('request', 'response'):
+                name = '%s_%s_bytes_total' % (prefix, kind)
+                lines.append('# TYPE %s counter' % name)
+                for (endpoint, verb), stats in endpoints:
+                    lines.append('%s{%s} %d' % (name, _labels(
+                        endpoint=endpoint, verb=verb),
+                        getattr(stats, kind + '_bytes')))
+
+            name = prefix + '_operation_duration_seconds'
+            lines.append('# TYPE %s histogram' % name)
+            for operation, hist in operations:
+                histogram(name, {'operation': operation}, hist)
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,137 @@
+"""
+Compact representation of zone data.
+
+rrsets, records, comments and search results are kept in __slots__ objects
+instead of dicts, names and types are interned so the many rrsets sharing
+them hold a single string. Objects can be read like the API dicts
+(rrset['name'], rrset.get('comments')) and converted back with to_dict().
+"""
+from .compat import intern
+
+
+_TTLS = {}
+
+
+def _intern(value):
+    return intern(str(value)) if value is not None else None
+
+
+def _shared_ttl(ttl):
+    # Zones use a handful of distinct TTLs, share the int objects
+    return _TTLS.setdefault(ttl, ttl)
+
+
+class _Model(object):
+    """
+    Base __slots__ model, every slot is an API field, fields set to None are
+    left out of the dict representation.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__
+                    if getattr(self, field) is not None)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field)
+            for field in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (field, getattr(self, field))
+            for field in self.__slots__ if getattr(self, field) is not None))
+
+
+class Comment(_Model):
+    __slots__ = ('content', 'account', 'modified_at')
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(content=data.get('content'),
+                   account=_intern(data.get('account')),
+                   modified_at=data.get('modified_at'))
+
+
+class Record(_Model):
+    __slots__ = ('content', 'disabled')
+
+
+class RRSet(_Model):
+    """
+    A rrset, records and comments are tuples of Record and Comment, item
+    access returns them as API dicts.
+    """
+
+    __slots__ = ('name', 'type', 'ttl', 'records', 'comments')
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(name=_intern(data['name']),
+                   type=_intern(data['type']),
+                   ttl=_shared_ttl(data.get('ttl')),
+                   records=tuple(Record.from_dict(record)
+                                 for record in data.get('records', ())),
+                   comments=tuple(Comment.from_dict(comment)
+                                  for comment in data.get('comments', ())))
+
+    def to_dict(self):
+        data = super(RRSet, self).to_dict()
+        data['records'] = [record.to_dict() for record in self.records or ()]
+        data['comments'] = [comment.to_dict()
+                            for comment in self.comments or ()]
+        return data
+
+    def __getitem__(self, key):
+        if key in ('records', 'comments'):
+            return [item.to_dict() for item in getattr(self, key) or ()]
+        return super(RRSet, self).__getitem__(key)
+
+
+class SearchResult(_Model):
+    """
+    A search-data result, zone, record or comment.
+    """
+
+    __slots__ = ('object_type', 'name', 'type', 'content', 'ttl', 'disabled',
+                 'zone', 'zone_id')
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(object_type=_intern(data.get('object_type')),
+                   name=_intern(data.get('name')),
+                   type=_intern(data.get('type')),
+                   content=data.get('content'),
+                   ttl=_shared_ttl(data.get('ttl')),
+                   disabled=data.get('disabled'),
+                   zone=_intern(data.get('zone')),
+                   zone_id=_intern(data.get('zone_id')))
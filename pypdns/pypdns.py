@@ -1,12 +1,16 @@
 import os
 import re
+import time
 import logging
 import datetime
-from six.moves import configparser as ConfigParser
-from six import iteritems
-from builtins import range, input
+import threading
+import collections
 
-from . import api
+from .compat import configparser as ConfigParser
+from .compat import iteritems, string_types, range, input
+from .metrics import trace
+from .models import RRSet, SearchResult
+from .zone import Zone
 
 
 log = logging.getLogger(__name__)
@@ -14,20 +18,125 @@ log = logging.getLogger(__name__)
 
 DEFAULT_CONFIG = {
     'endpoint': 'http://localhost:8081/api/v1/servers/localhost',
+    'zones-cache-ttl': 300,
+    'batch-size': 1000,
+    'max-pending-changes': 10000,
+    'max-workers': 8,
+    'connect-timeout': 5,
+    'read-timeout': 60,
+    'snapshot-cache': False,
+    'search-fetch-limit': 10000,
+    'watch-interval': 30,
 }
 
+# Sections of the named servers, their values override [pypdns] ones
+SERVER_SECTION = 'server:'
 
-def load_config(custom_path=''):
-    config = ConfigParser.ConfigParser()
-    paths = ['./pypdns.ini',
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+def build_rrset(name, type_, contents, comment, changetype='REPLACE',
+                ttl=3600, reverse=False, disabled=False):
+    """
+    Build a rrset as expected by a zone PATCH request.
+
+    :param contents: Contents of the records, comma separated or as a list
+    :type contents: String or list
+    """
+    if isinstance(contents, string_types):
+        contents = contents.split(',')
+
+    records = []
+    for content in contents:
+        record = {
+            'content':  content,
+            'set-ptr':  reverse,
+            'disabled': disabled
+        }
+        records.append(record)
+
+    return {'name': name,
+            'type': type_,
+            'ttl': ttl,
+            'changetype': changetype,
+            'records': records,
+            'comments': [{'account': os.environ['USER'],
+                          'content': comment,
+                          }
+                         ]
+            }
+
+
+CHANGETYPES = ('REPLACE', 'DELETE')
+
+
+def change_error(change):
+    """
+    Return why change cannot be applied (see PyPDNS.iter_apply_changes),
+    None if it is valid. Lines the changes readers cannot read are yielded
+    as {'line': ..., 'error': ...}, their error is returned.
+    """
+    if not isinstance(change, dict):
+        return 'Invalid change %r, expected a dict' % (change,)
+    if change.get('error') and not change.get('name'):
+        return change['error']
+    for key in ('name', 'type'):
+        if not isinstance(change.get(key), string_types) or not change[key]:
+            return 'Invalid change, missing %s' % key
+    if str(change.get('changetype', 'REPLACE')).upper() not in CHANGETYPES:
+        return 'Invalid changetype %s, expected one of %s' % (
+            change['changetype'], ', '.join(CHANGETYPES))
+    content = change.get('content', '')
+    if not (isinstance(content, string_types) or
+            isinstance(content, list) and
+            all(isinstance(item, string_types) for item in content)):
+        return 'Invalid content %r' % (content,)
+    try:
+        int(change.get('ttl', 3600))
+    except (TypeError, ValueError):
+        return 'Invalid ttl %r' % (change['ttl'],)
+    return None
+
+
+def config_paths(custom_path='', directory='.'):
+    """
+    Return the configuration files read, in order, by load_config.
+
+    :param directory: Directory looked up for pypdns.ini
+    :type directory: String
+    """
+    paths = [os.path.join(directory, 'pypdns.ini'),
              '~/.config/pypdns.ini']
     if custom_path:
         paths.insert(0, os.path.realpath(custom_path))
-    config.read(paths)
+    return paths
+
+
+def load_config(custom_path=''):
+    config = ConfigParser.ConfigParser()
+    config.read(config_paths(custom_path))
     return config
 
 
+def server_names(cfg):
+    """
+    Return the names of the servers configured in [server:<name>] sections,
+    in file order.
+    """
+    return [section[len(SERVER_SECTION):] for section in cfg.sections()
+            if section.startswith(SERVER_SECTION)]
+
+
 def parse_config(cfg, ext_config={}):
+    """
+    Return the configuration dict: [pypdns] section values, overridden by
+    the [server:<name>] section of ext_config server value if any, then by
+    ext_config values.
+    """
     config = {}
     try:
         options = cfg.options('pypdns')
@@ -38,13 +147,22 @@ def parse_config(cfg, ext_config={}):
     for option in options:
         config[option] = cfg.get('pypdns', option)
 
+    server = ext_config.get('server')
+    if server:
+        section = SERVER_SECTION + server
+        if not cfg.has_section(section):
+            raise ValueError('Unknown server %s, configured servers: %s' %
+                             (server, ', '.join(server_names(cfg)) or None))
+        for option in cfg.options(section):
+            config[option] = cfg.get(section, option)
+
     for ckey, cvalue in iteritems(DEFAULT_CONFIG):
         if ckey not in config:
             config[ckey] = cvalue
 
-    for k in ('endpoint', 'apikey'):
-        if ext_config.get(k) is not None:
-            config[k] = ext_config[k]
+    for k, v in iteritems(ext_config):
+        if k != 'config_path' and v is not None:
+            config[k] = v
 
     assert (config.get('endpoint') is not None and
             config.get('apikey') is not None), 'Configuration not found'
@@ -52,37 +170,243 @@ def parse_config(cfg, ext_config={}):
     return config
 
 
+def record_fqdn(zone_name, record_name, type_):
+    """
+    Return the full name of record_name in zone_name, the zone itself for
+    SOA records and for the '.' record name.
+    """
+    record_name = (record_name if record_name.endswith('.')
+                   else record_name + '.')
+    name = (record_name + zone_name if (type_ not in ('SOA',) and
+                                        record_name != '.')
+            else zone_name)
+    return name
+
+
+def filter_zones(zones, name='.*'):
+    """
+    Return zones whose name match the name regular expression.
+    """
+    result = []
+    name = re.compile(name)
+    for zone in zones:
+        match = name.match(zone['name'])
+        if match:
+            result.append(zone)
+    return result
+
+
+def filter_rrsets(rrsets, name='.*', _type='.*'):
+    """
+    Return rrsets matching the name and _type regular expressions, comments
+    modification timestamps are converted to iso format.
+    """
+    return list(iter_filter_rrsets(rrsets, name, _type))
+
+
+def iter_filter_rrsets(rrsets, name='.*', _type='.*'):
+    """
+    Generator version of filter_rrsets, rrsets is consumed lazily.
+    """
+    for record_set in iter_match_rrsets(rrsets, name, _type):
+        yield format_rrset(record_set)
+
+
+def iter_match_rrsets(rrsets, name='.*', _type='.*'):
+    """
+    Yield rrsets matching the name and _type regular expressions, as is.
+    """
+    patterns = {}
+    patterns['name'] = re.compile(name)
+
+    patterns['type'] = re.compile(_type)
+
+    for record_set in rrsets:
+        match = True
+        for key, pattern in iteritems(patterns):
+            match &= bool(pattern.match(record_set[key]))
+
+        if match:
+            yield record_set
+
+
+def format_rrset(record_set):
+    """
+    Return a copy of record_set with comments modification timestamps
+    converted to iso format, record_set is left untouched.
+    """
+    comments = []
+    for comment in record_set.get('comments', []):
+        if comment['modified_at']:
+            comment = dict(comment)
+            comment['modified_at'] = datetime.datetime.fromtimestamp(
+                comment['modified_at']).isoformat()
+        comments.append(comment)
+
+    record_set = dict(record_set)
+    if comments:
+        record_set['comments'] = comments
+    return record_set
+
+
+def filter_search(results, object_type=None, zone=None, rtype=None):
+    """
+    Filter search results on object type, zone and record type, zone and
+    rtype imply object_type = record.
+    """
+    object_type = 'record' if zone or rtype else object_type
+    if not object_type:
+        return results
+    return list(iter_filter_search(results, object_type, zone, rtype))
+
+
+def iter_filter_search(results, object_type=None, zone=None, rtype=None):
+    """
+    Generator version of filter_search, results is consumed lazily.
+    """
+    object_type = 'record' if zone or rtype else object_type
+    if zone:
+        zone = zone + '.' if not zone.endswith('.') else zone
+
+    for rec in results:
+        if object_type and rec['object_type'] != object_type:
+            continue
+        if zone and rec.get('zone') != zone:
+            continue
+        if rtype and rec.get('type') != rtype:
+            continue
+        yield rec
+
+
+def zone_key(name):
+    """
+    Return the key of a zone in the caches: absolute lower case name.
+    """
+    name = name.lower()
+    return name if name.endswith('.') else name + '.'
+
+
+def record_key(name, type_):
+    """
+    Return the (name, type) key of a record compared with those returned by
+    the server: absolute lower case name, upper case type.
+    """
+    name = name if name.endswith('.') else name + '.'
+    return name.lower(), type_.upper()
+
+
 class PyPDNS(object):
 
     _interactive = False
+    _zones_cache = None
+    _zones_cache_time = 0
+    _executor = None
+    _zones_api = None
+    _search_api = None
 
     def __init__(self, ext_config={}):
         cfg = load_config(ext_config.get('config_path'))
 
         self.config = parse_config(cfg, ext_config)
-        self.zones_api = api.ZonesAPI(self.config)
-        self.search_api = api.SearchAPI(self.config)
+        self.hooks = []
+        self._api_lock = threading.Lock()
+
+        self.snapshots = None
+        self._zone_models = {}
+        snapshot_dir = self.config.get('snapshot-dir')
+        if snapshot_dir or to_bool(self.config.get('snapshot-cache')):
+            from .cache import ZoneSnapshotCache
+            self.snapshots = ZoneSnapshotCache(snapshot_dir)
+
+    # The API objects, and requests with them, are only loaded on first use
+    # so commands failing early or not calling the API start fast.
+
+    def _build_apis(self):
+        from . import api
+        with self._api_lock:
+            if self._zones_api is not None:
+                return
+            # Both APIs count against the same rate limit and share hooks
+            rate_limiter = api.build_rate_limiter(self.config)
+            self._search_api = api.SearchAPI(self.config, rate_limiter,
+                                             self.hooks)
+            self._zones_api = api.ZonesAPI(self.config, rate_limiter,
+                                           self.hooks)
+
+    @property
+    def zones_api(self):
+        if self._zones_api is None:
+            self._build_apis()
+        return self._zones_api
+
+    @property
+    def search_api(self):
+        if self._search_api is None:
+            self._build_apis()
+        return self._search_api
+
+    def add_hook(self, hook):
+        """
+        Register a request hook (see metrics.RequestHook), called for every
+        API request and client side operation of this instance.
+        """
+        self.hooks.append(hook)
+
+    @property
+    def executor(self):
+        """
+        Thread pool used for concurrent API calls, sized by max-workers.
+        """
+        if self._executor is None:
+            from .executor import ApiExecutor
+            self._executor = ApiExecutor(int(self.config['max-workers']))
+        return self._executor
+
+    def close(self):
+        """
+        Stop the executor threads, if any.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
     def zones_list(self, name='.*'):
         """
         Get all zone from remote pdns API
 
+        The listing is narrowed server side when name can only match a few
+        zones, see _list_zones.
+
         :return: List of zone
         :rtype:
         """
-        ret, code = self.zones_api.get_zones()
+        ret, code = self._list_zones(name)
         if code != 200:
             return ret
+        with trace(self.hooks, 'zones_list.filter'):
+            return filter_zones(ret, name)
 
-        result = []
-        name = re.compile(name)
-        for zone in ret:
-            match = name.match(zone['name'])
-            if match:
-                result.append(zone)
-        return result
+    def _list_zones(self, name):
+        """
+        Return the zones listing holding at least the zones matching the
+        name regular expression, and the response code, see
+        query.ZoneListingPlan.
+        """
+        from .query import ZoneListingPlan
 
-    def zones_get(self, zone_id, name='.*', _type='.*'):
+        plan = ZoneListingPlan(name)
+        if plan.zone:
+            return self.zones_api.get_zones(zone=plan.zone)
+        names = None
+        if plan.search is not None:
+            names = plan.lookups(*self.search_api.search(**plan.search))
+        if names is None:
+            return self.zones_api.get_zones()
+        # Listed one by one until a lookup fails
+        return plan.merge(self.zones_api.get_zones(zone=zone)
+                          for zone in names)
+
+    def zones_get(self, zone_id, name='.*', _type='.*', objects=False):
         """
         Return zone data.
 
@@ -92,31 +416,104 @@ class PyPDNS(object):
         :type name: String
         :param _type: Filter rrsets of given zone on type
         :type _type: String
+        :param objects: Return RRSet objects, comments timestamps are left
+        as is
+        :type objects: bool
         :return: zone data as dict or False if not found.
         :rtype: dict
         """
-        ret, code = self.zones_api.get_zone(zone_id)
-        patterns = {}
-        result = []
+        if self.snapshots is None:
+            # The zone is not kept, indexing it would cost more than the
+            # single pass filter
+            data, code = self._get_zone(zone_id)
+            if code != 200:
+                return data
+            rrsets = data['rrsets']
+            with trace(self.hooks, 'zones_get.filter'):
+                if objects:
+                    return [RRSet.from_dict(rrset) for rrset in
+                            iter_match_rrsets(rrsets, name, _type)]
+                return filter_rrsets(rrsets, name, _type)
+
+        zone, code = self._zone(zone_id)
         if code != 200:
-            return ret
-        patterns['name'] = re.compile(name)
+            return zone
+        with trace(self.hooks, 'zones_get.filter'):
+            if objects:
+                return [RRSet.from_dict(rrset)
+                        for rrset in zone.filter(name, _type)]
+            return [format_rrset(rrset)
+                    for rrset in zone.filter(name, _type)]
 
-        patterns['type'] = re.compile(_type)
+    def iter_zone(self, zone_id, name='.*', _type='.*', objects=False):
+        """
+        Same as zones_get but rrsets are parsed and filtered while the zone
+        is downloaded (requires ijson, otherwise the body is decoded at once),
+        Return a generator of rrsets or the error response body.
 
-        for record_set in ret['rrsets']:
-            match = True
-            for key, pattern in iteritems(patterns):
-                match &= bool(pattern.match(record_set[key]))
+        :param zone_id: Zone name
+        :type zone_id: String
+        :param name: Filter rrsets of given zone on name
+        :type name: String
+        :param _type: Filter rrsets of given zone on type
+        :type _type: String
+        :param objects: Yield RRSet objects, comments timestamps are left
+        as is
+        :type objects: bool
+        """
+        rrsets, code = self.zones_api.iter_rrsets(zone_id)
+        if code != 200:
+            return rrsets
+        if objects:
+            return (RRSet.from_dict(rrset)
+                    for rrset in iter_match_rrsets(rrsets, name, _type))
+        return iter_filter_rrsets(rrsets, name, _type)
+
+    def zone(self, zone_id):
+        """
+        Return zone data as an indexed Zone, None if the zone cannot be
+        fetched. With the snapshot cache enabled, the same Zone is returned
+        as long as the zone serial does not change.
 
-            for comment in record_set.get('comments', []):
-                if comment['modified_at']:
-                    comment['modified_at'] = datetime.datetime.fromtimestamp(
-                        comment['modified_at']).isoformat()
-            if match:
-                result.append(record_set)
+        :param zone_id: Zone name
+        :type zone_id: String
+        :rtype: Zone
+        """
+        zone, code = self._zone(zone_id)
+        if code != 200:
+            log.error('Cannot get zone %s: %s', zone_id, zone)
+            return None
+        return zone
 
-        return result
+    def _zone(self, zone_id):
+        data, code = self._get_zone(zone_id)
+        if code != 200:
+            return data, code
+
+        # Snapshots return the same data until the zone changes, the Zone
+        # built from it is kept as long as they do.
+        key = zone_key(zone_id)
+        cached = self._zone_models.get(key)
+        if cached is not None and cached.data is data:
+            return cached, code
+        with trace(self.hooks, 'zone.index'):
+            zone = Zone(data)
+        if self.snapshots is not None:
+            self._zone_models[key] = zone
+        return zone, code
+
+    def _zone_written(self, zone_id):
+        """
+        Drop the snapshot and the Zone of zone_id once this instance sent it
+        a change: the serial of a zone without SOA-EDIT-API does not move,
+        they would be served stale. A failed request may still have been
+        applied, they are dropped whatever its result.
+        """
+        if self.snapshots is None:
+            return
+        key = zone_key(zone_id)
+        self.snapshots.invalidate(key)
+        self._zone_models.pop(key, None)
 
     def zones_create(self, name, kind='NATIVE', soa=None, nameservers=[],
                      soa_edit='INCEPTION-INCREMENT', soa_ttl=7200):
@@ -150,6 +547,8 @@ class PyPDNS(object):
             ]
         }
         ret, code = self.zones_api.create_zone(data)
+        if code in (200, 201):
+            self.invalidate_zones_cache()
         return ret, code
 
     def record_add(self, zone_name, record_name, contents, comment, type_='A',
@@ -158,7 +557,8 @@ class PyPDNS(object):
         """
         Add or replace a record, Return 2-tuple : response body, response code
         if record exists and override is set to False : return error message
-        and -1 error code.
+        and -1 error code. If its existence cannot be checked, return the
+        error of the lookup and its code, nothing is sent.
 
         :param zone_name: Zone to add record to
         :type zone_name: String
@@ -177,18 +577,15 @@ class PyPDNS(object):
         :param disabled: Disable record, default to False
         :type disabled: bool
         """
-        record_name = (record_name if record_name.endswith('.')
-                       else record_name + '.')
-
         type_ = type_.upper()
-
-        name = (record_name + zone_name if (type_ not in ('SOA',) and
-                                            record_name != '.')
-                else zone_name)
+        name = record_fqdn(zone_name, record_name, type_)
 
         if not override:
-            # record already exists ?
-            existing_record = self._get_record(name, type_)
+            # record already exists ? The record is not sent when it cannot
+            # be told
+            existing_record, code = self._get_record(name, type_, zone_name)
+            if code != 200:
+                return existing_record, code
             if existing_record:
                 if not self._interactive:
                     return ('Specify override=True for erasing existing record',
@@ -201,35 +598,834 @@ class PyPDNS(object):
         if not name.endswith('.'):
             name += '.'
 
-        records = []
-
-        for content in contents.split(','):
-            record = {
-                'content':  content,
-                'set-ptr':  reverse,
-                'disabled': disabled
-            }
-            records.append(record)
-
         data = {
-            'rrsets': [
-                {'name': name,
-                 'type': type_,
-                 'ttl': ttl,
-                 'changetype': changetype,
-                 'records': records,
-                 'comments': [{'account': os.environ['USER'],
-                               'content': comment,
-                               }
-                              ]
-                 }
-            ]
+            'rrsets': [build_rrset(name, type_, contents, comment,
+                                   changetype=changetype, ttl=ttl,
+                                   reverse=reverse, disabled=disabled)]
         }
-        ret, code = self.zones_api.update_records(zone_name, data)
+        try:
+            ret, code = self.zones_api.update_records(zone_name, data)
+        finally:
+            self._zone_written(zone_name)
         return ret, code
 
+    def apply_changes(self, changes, max_rrsets=None, concurrent=False,
+                      override=True):
+        """
+        Apply many record changes with as few PATCH requests as possible,
+        Return the list of batch results (see iter_apply_changes).
+
+        :param changes: Iterable of changes dict
+        :type changes: iterable
+        :param max_rrsets: Maximum number of rrsets per PATCH, default to
+        batch-size config value
+        :type max_rrsets: int
+        :param concurrent: Send requests on different zones concurrently
+        :type concurrent: bool
+        :param override: Replace existing records, if False they are
+        reported with code -1 and not sent
+        :type override: bool
+        """
+        return list(self.iter_apply_changes(changes, max_rrsets, concurrent,
+                                            override))
+
+    def iter_apply_changes(self, changes, max_rrsets=None, concurrent=False,
+                           override=True):
+        """
+        Group changes by zone and send them as PATCH requests holding up to
+        max_rrsets rrsets, yield a result dict for each request sent :
+        {'zone': ..., 'code': ..., 'result': ..., 'success': bool,
+         'changes': [...]}
+
+        A change is a dict with the keys name (full record name), type,
+        content (comma separated string or list), comment, ttl, changetype,
+        reverse, disabled and optionally zone (resolved from name if missing).
+        Changes on the same record are never sent in the same request, so
+        they are applied in order. Invalid changes (see change_error) and
+        changes whose zone cannot be found are reported with code -1 and
+        never sent, the other changes are still applied. When the zones
+        cannot be listed, changes without zone key are reported with the
+        error of the listing, sent once. At most
+        max-pending-changes changes are kept waiting for their batch to
+        fill.
+
+        With concurrent set, requests are run on the executor, requests on a
+        same zone are still sent one after the other, in order.
+
+        With override set to False, REPLACE changes on existing rrsets are
+        not sent but reported with code -1, existence is checked with a
+        request per rrset, concurrently (see existing_records). When the
+        check fails the whole batch is reported with its error code and not
+        sent.
+
+        :param changes: Iterable of changes dict
+        :type changes: iterable
+        :param max_rrsets: Maximum number of rrsets per PATCH, default to
+        batch-size config value
+        :type max_rrsets: int
+        :param concurrent: Send requests on different zones concurrently
+        :type concurrent: bool
+        :param override: Replace existing records
+        :type override: bool
+        """
+        max_rrsets = int(max_rrsets or self.config.get('batch-size'))
+        if max_rrsets < 1:
+            raise ValueError('max_rrsets must be a positive integer')
+
+        batches = self._iter_batches(changes, max_rrsets, override)
+        if concurrent:
+            return self.executor.imap(self._send_batch, batches,
+                                      key=lambda batch: batch[0])
+        return (self._send_batch(batch) for batch in batches)
+
+    def export_zones(self, directory, name='.*', fmt='jsonl', resume=True,
+                     concurrent=True):
+        """
+        Same as iter_export_zones, return the list of results.
+        """
+        return list(self.iter_export_zones(directory, name, fmt, resume,
+                                           concurrent))
+
+    def iter_export_zones(self, directory, name='.*', fmt='jsonl',
+                          resume=True, concurrent=True):
+        """
+        Export the zones matching name to directory, one file per zone, yield
+        a result dict per zone, in zone name order :
+        {'zone': ..., 'code': ..., 'success': bool, 'skipped': bool,
+         'file': ..., 'rrsets': number of rrsets, 'result': error or None}
+
+        Zones are streamed to their file while they are downloaded, on the
+        executor when concurrent is set. Exported zones are recorded in a
+        checkpoint file (see export module): with resume set, zones exported
+        by a previous run at the same serials are skipped. A failure to list
+        zones is reported as a result with zone None.
+
+        :param name: Regular expression on zone names, see zones_list
+        :type name: String
+        :param fmt: jsonl (API rrsets, one per line) or bind (master file,
+        without comments)
+        :type fmt: String
+        :param resume: Skip zones found in the checkpoint, otherwise export
+        all zones and start a new checkpoint
+        :type resume: bool
+        """
+        from .cache import zone_version
+        from .export import Checkpoint, check_format, zone_path
+
+        check_format(fmt)
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        checkpoint = Checkpoint(directory, resume)
+
+        zones, code = self._list_zones(name)
+        if code != 200:
+            log.error('Cannot list zones: %s', zones)
+            yield {'zone': None, 'code': code, 'success': False,
+                   'skipped': False, 'file': None, 'rrsets': None,
+                   'result': zones}
+            return
+
+        jobs = ((zone.get('id') or zone['name'], zone['name'],
+                 zone_version(zone), zone_path(directory, zone['name'], fmt),
+                 fmt, checkpoint)
+                for zone in sorted(filter_zones(zones, name),
+                                   key=lambda zone: zone['name']))
+        if concurrent:
+            results = self.executor.imap(self._export_zone, jobs)
+        else:
+            results = (self._export_zone(job) for job in jobs)
+        for result in results:
+            yield result
+
+    def _export_zone(self, job):
+        from .api import PdnsError
+        from .export import write_zone_file
+
+        zone_id, name, version, path, fmt, checkpoint = job
+        result = {'zone': name, 'code': 200, 'success': True,
+                  'skipped': False, 'file': path, 'rrsets': None,
+                  'result': None}
+        entry = checkpoint.get(name, version, fmt)
+        if entry is not None:
+            result.update(skipped=True, rrsets=entry['rrsets'])
+            return result
+
+        try:
+            rrsets, code = self.zones_api.iter_rrsets(zone_id)
+            if code == 200:
+                result['rrsets'] = write_zone_file(path, rrsets, name, fmt)
+        except (PdnsError, EnvironmentError, ValueError) as exc:
+            # Connection lost or body cut while the zone streams (see
+            # api._stream_items), or file not written: this zone failed,
+            # other zones are exported
+            rrsets, code = str(exc), -1
+        if code != 200:
+            log.error('Cannot export zone %s: %s', name, rrsets)
+            result.update(code=code, success=False, file=None, result=rrsets)
+            checkpoint.fail(name, version, fmt, rrsets)
+            return result
+
+        checkpoint.add(name, version, fmt, path, result['rrsets'])
+        return result
+
+    def import_zone(self, zone_name, path, max_rrsets=None, kind='NATIVE',
+                    concurrent=True):
+        """
+        Same as iter_import_zone, return the list of results.
+        """
+        return list(self.iter_import_zone(zone_name, path, max_rrsets, kind,
+                                          concurrent))
+
+    def iter_import_zone(self, zone_name, path, max_rrsets=None,
+                         kind='NATIVE', concurrent=True):
+        """
+        Import the BIND master file at path into zone_name, yield a result
+        dict per request sent :
+        {'zone': ..., 'code': ..., 'success': bool, 'created': bool,
+         'rrsets': number of rrsets sent, 'result': ...}
+
+        The file is read as it is sent: records are grouped by (name, type)
+        into chunks of max_rrsets rrsets, each chunk replaces its rrsets with
+        one PATCH request. A zone missing on the server is created with the
+        first chunk, so a file holding up to max_rrsets rrsets is imported
+        with a single create_zone call. The SOA of an existing zone is kept,
+        as its rrsets missing from the file (see reconcile to remove them).
+
+        Memory holds the chunks being sent and a hash per rrset: the records
+        of an rrset found more than a chunk apart in the file are merged with
+        those already imported, fetched back from the server.
+
+        With concurrent set, the file is parsed while the previous chunks are
+        sent on the executor, requests are still sent one after the other.
+
+        An invalid line stops the import: once the chunks read before it are
+        sent, a failed result (code -1) holding the file and line number of
+        the error is yielded last.
+
+        :param zone_name: Zone to import to, origin of the relative names
+        :type zone_name: String
+        :param max_rrsets: Maximum number of rrsets per request, default to
+        batch-size config value
+        :type max_rrsets: int
+        :param kind: Kind of the zone when it is created
+        :type kind: String
+        """
+        from .api import PdnsError
+        from .zonefile import (ZoneFileError, iter_bind_records,
+                               iter_rrset_chunks)
+
+        max_rrsets = int(max_rrsets or self.config.get('batch-size'))
+        if max_rrsets < 1:
+            raise ValueError('max_rrsets must be a positive integer')
+        zone_name = zone_name if zone_name.endswith('.') else zone_name + '.'
+
+        try:
+            zones, code = self.zones_api.get_zones(zone=zone_name)
+        except PdnsError as exc:
+            zones, code = str(exc), -1
+        if code != 200:
+            log.error('Cannot list zones: %s', zones)
+            yield {'zone': zone_name, 'code': code, 'success': False,
+                   'created': False, 'rrsets': None, 'result': zones}
+            return
+        exists = any(zone['name'].lower() == zone_name.lower()
+                     for zone in zones)
+        # SOA of a zone created by the import comes from the file
+        state = {'exists': exists, 'keep_soa': exists, 'kind': kind,
+                 'error': None}
+
+        def jobs(fh):
+            # Hashes keep memory low on large zones, a collision only costs
+            # a merge with the records on the server
+            imported = set()
+            records = iter_bind_records(fh, zone_name, source=path)
+            try:
+                for chunk in iter_rrset_chunks(records, max_rrsets):
+                    split = set()
+                    for key in chunk:
+                        key_hash = hash(key)
+                        if key_hash in imported:
+                            split.add(key)
+                        imported.add(key_hash)
+                    yield zone_name, chunk, split, state
+            except ZoneFileError as exc:
+                log.error('Cannot import %s: %s', zone_name, exc)
+                failed.append({'zone': zone_name, 'code': -1,
+                               'success': False, 'created': False,
+                               'rrsets': None, 'result': str(exc)})
+
+        failed = []
+
+        with open(path) as fh:
+            if concurrent:
+                results = self.executor.imap(self._import_chunk, jobs(fh),
+                                             key=lambda job: job[0])
+            else:
+                results = (self._import_chunk(job) for job in jobs(fh))
+            for result in results:
+                if result['created']:
+                    self.invalidate_zones_cache()
+                yield result
+        # Reported after the chunks read before the invalid line
+        for result in failed:
+            yield result
+
+    def _import_chunk(self, job):
+        from .api import PdnsError
+
+        zone_name, chunk, split, state = job
+        rrsets = [rrset for key, rrset in iteritems(chunk)
+                  if not (state['keep_soa'] and key[1] == 'SOA')]
+        result = {'zone': zone_name, 'code': -1, 'success': False,
+                  'created': False, 'rrsets': len(rrsets), 'result': None}
+        if state['error']:
+            result['result'] = state['error']
+            return result
+
+        try:
+            for rrset in rrsets:
+                if (rrset['name'].lower(), rrset['type']) in split:
+                    self._merge_imported(zone_name, rrset)
+            if state['exists']:
+                data = {'rrsets': [dict(rrset, changetype='REPLACE')
+                                   for rrset in rrsets]}
+                try:
+                    ret, code = self.zones_api.update_records(zone_name,
+                                                              data)
+                finally:
+                    self._zone_written(zone_name)
+            else:
+                ret, code = self.zones_api.create_zone(
+                    self._import_zone_data(zone_name, state['kind'], rrsets))
+                result['created'] = code in (200, 201)
+        except PdnsError as exc:
+            ret, code = str(exc), -1
+
+        result.update(code=code, success=code in (200, 201, 204), result=ret)
+        if not result['success']:
+            log.error('Import of %d rrsets on zone %s failed: %s',
+                      len(rrsets), zone_name, ret)
+            if not state['exists']:
+                # Following chunks would fail on the missing zone
+                state['error'] = 'Zone %s creation failed' % zone_name
+        state['exists'] = state['exists'] or result['created']
+        return result
+
+    def _merge_imported(self, zone_name, rrset):
+        """
+        Add to rrset the records already imported by a previous chunk.
+        """
+        ret, code = self.zones_api.get_rrset(zone_name, rrset['name'],
+                                             rrset['type'])
+        if code != 200:
+            return
+        # The server may ignore the rrset filter and return the whole zone
+        name = '(?i)' + re.escape(rrset['name']) + '$'
+        for current in iter_match_rrsets(ret.get('rrsets', ()), name,
+                                         re.escape(rrset['type']) + '$'):
+            contents = set(record['content'] for record in rrset['records'])
+            rrset['records'][:0] = [record for record in current['records']
+                                    if record['content'] not in contents]
+            rrset['ttl'] = min(rrset['ttl'], current['ttl'])
+
+    def _import_zone_data(self, zone_name, kind, rrsets):
+        data = {'name': zone_name, 'kind': kind, 'rrsets': rrsets,
+                'nameservers': []}
+        if not any(rrset['type'] == 'NS' and
+                   rrset['name'].lower() == zone_name.lower()
+                   for rrset in rrsets):
+            nameservers = self.config.get('nameservers') or []
+            if isinstance(nameservers, string_types):
+                nameservers = nameservers.split(',')
+            data['nameservers'] = nameservers
+        return data
+
+    def check_reverse(self, name='.*', concurrent=True):
+        """
+        Same as iter_check_reverse, return the list of issues.
+        """
+        return list(self.iter_check_reverse(name, concurrent))
+
+    def iter_check_reverse(self, name='.*', concurrent=True):
+        """
+        Check the A and AAAA records of the forward zones matching name
+        against the PTR records of all reverse zones, yield an issue dict per
+        inconsistency (see reverse module) :
+        {'issue': 'missing', 'mismatched', 'dangling' or 'out-of-scope',
+         'address': ...,
+         'ptr': PTR name, 'zone': reverse zone, 'names': forward names,
+         'targets': PTR targets, 'fix': change or None}
+
+        Every zone is downloaded once, reverse zones first to build the PTR
+        index, then forward zones, on the executor when concurrent is set.
+        Missing PTRs are reported while forward zones are checked, only for
+        addresses covered by a reverse zone. Mismatched and dangling PTRs are
+        reported at the end, and not at all if a forward zone could not be
+        fetched. A PTR is only judged when one of its targets belongs to a
+        forward zone checked, PTRs whose targets all belong to other zones
+        or to no zone on the server are reported out-of-scope, without fix.
+        A zone that cannot be fetched is reported with issue error.
+
+        The fix of an issue is a change for apply_changes, see fix_reverse:
+        missing and mismatched PTRs are pointed to the forward name (the
+        first one in name order if the address has several), with the TTL
+        of its record, dangling PTRs are deleted.
+
+        :param name: Regular expression on forward zone names
+        :type name: String
+        """
+        from .reverse import ReverseIndex, is_reverse_zone
+
+        zones, code = self._list_zones('.*')
+        if code != 200:
+            log.error('Cannot list zones: %s', zones)
+            yield self._reverse_error(None, code, zones)
+            return
+        zones = sorted(zones, key=lambda zone: zone['name'])
+        reverse_zones = [zone for zone in zones
+                         if is_reverse_zone(zone['name'])]
+        forward_zones = [zone for zone in filter_zones(zones, name)
+                         if not is_reverse_zone(zone['name'])]
+
+        index = ReverseIndex()
+        jobs = ((zone.get('id') or zone['name'], zone['name'])
+                for zone in reverse_zones)
+        for zone_name, code, ptrs in self._map(self._fetch_ptrs, jobs,
+                                               concurrent):
+            if code != 200:
+                yield self._reverse_error(zone_name, code, ptrs)
+                continue
+            # Addresses of a zone not indexed are never reported missing
+            index.add_zone(zone_name)
+            for ptr, targets in ptrs:
+                index.add_ptr(ptr, targets)
+        log.info('%d PTR records indexed, %d ignored', len(index),
+                 index.ignored)
+
+        # Forward names and TTL of the addresses having a PTR
+        forward = {4: {}, 6: {}}
+        reported = {4: set(), 6: set()}
+        complete = True
+        jobs = ((zone.get('id') or zone['name'], zone['name'], index)
+                for zone in forward_zones)
+        for zone_name, code, result in self._map(self._check_forward_zone,
+                                                 jobs, concurrent):
+            if code != 200:
+                complete = False
+                yield self._reverse_error(zone_name, code, result)
+                continue
+            missing, names = result
+            for (version, address), issue in missing:
+                if address not in reported[version]:
+                    reported[version].add(address)
+                    yield issue
+            for version in (4, 6):
+                for address, entries in iteritems(names[version]):
+                    forward[version].setdefault(address, []).extend(entries)
+
+        if not complete:
+            log.warning('Forward zones missing, mismatched and dangling PTRs '
+                        'are not checked')
+            return
+        # The zone holding a PTR target tells if it was checked
+        scope = (set(zone['name'].lower() for zone in zones
+                     if not is_reverse_zone(zone['name'])),
+                 set(zone['name'].lower() for zone in forward_zones))
+        for issue in self._check_ptrs(index, forward, scope):
+            yield issue
+
+    def fix_reverse(self, issues, max_rrsets=None, concurrent=True):
+        """
+        Apply the fixes of issues found by iter_check_reverse with as few
+        PATCH requests as possible, return an iterator over the batch results
+        (see iter_apply_changes). issues is consumed lazily.
+        """
+        changes = (issue['fix'] for issue in issues if issue.get('fix'))
+        return self.iter_apply_changes(changes, max_rrsets, concurrent)
+
+    def _map(self, fn, jobs, concurrent):
+        if concurrent:
+            return self.executor.imap(fn, jobs)
+        return (fn(job) for job in jobs)
+
+    @staticmethod
+    def _reverse_error(zone_name, code, result):
+        return {'issue': 'error', 'zone': zone_name, 'code': code,
+                'result': result, 'fix': None}
+
+    def _fetch_rrsets(self, zone_id, consume):
+        """
+        Stream the rrsets of zone_id to consume, return 2-tuple : its result
+        or the error, response code. A zone that cannot be fetched or whose
+        stream is interrupted returns the error message and -1.
+        """
+        from .api import PdnsError
+
+        try:
+            rrsets, code = self.zones_api.iter_rrsets(zone_id)
+            if code == 200:
+                return consume(rrsets), code
+        except (PdnsError, ValueError) as exc:
+            # Connection lost or body cut while the zone streams, see
+            # api._stream_items
+            rrsets, code = str(exc), -1
+        log.error('Cannot fetch zone %s: %s', zone_id, rrsets)
+        return rrsets, code
+
+    def _fetch_ptrs(self, job):
+        from .reverse import ptr_targets
+
+        zone_id, zone_name = job
+        # Collected first, a zone failing midway is not indexed at all
+        ptrs, code = self._fetch_rrsets(
+            zone_id, lambda rrsets: list(ptr_targets(rrsets)))
+        return zone_name, code, ptrs
+
+    def _check_forward_zone(self, job):
+        from .reverse import fix_change, forward_addresses, issue
+
+        zone_id, zone_name, index = job
+
+        def consume(rrsets):
+            missing = []
+            names = {4: {}, 6: {}}
+            for name, ttl, version, address in forward_addresses(rrsets):
+                if address in index.ptrs[version]:
+                    names[version].setdefault(address, []).append((name, ttl))
+                    continue
+                zone = index.zone(version, address)
+                if zone is None:
+                    continue
+                missing.append(((version, address), issue(
+                    'missing', version, address, zone, [name],
+                    fix=fix_change(version, address, zone, name, ttl))))
+            return missing, names
+
+        result, code = self._fetch_rrsets(zone_id, consume)
+        return zone_name, code, result
+
+    def _check_ptrs(self, index, forward, scope):
+        from .reverse import covering_zone, fix_change, issue
+
+        zones, checked = scope
+        for version in (4, 6):
+            for address in list(index.ptrs[version]):
+                targets = index.targets(version, address)
+                entries = sorted(set(forward[version].get(address, ())))
+                names = set(name for name, _ in entries)
+                if names and names.intersection(targets):
+                    continue
+                zone = index.zone(version, address)
+                if not any(covering_zone(target, zones) in checked
+                           for target in targets):
+                    # Its targets may exist, in zones not checked
+                    yield issue('out-of-scope', version, address, zone,
+                                names, targets)
+                elif not names:
+                    yield issue('dangling', version, address, zone,
+                                targets=targets,
+                                fix=fix_change(version, address, zone))
+                else:
+                    name, ttl = entries[0]
+                    yield issue('mismatched', version, address, zone, names,
+                                targets, fix=fix_change(version, address,
+                                                        zone, name, ttl))
+
+    def watch(self, callback, name='.*', interval=None, initial=False,
+              concurrent=True, cycles=None):
+        """
+        Call callback with each event of iter_watch, until interrupted or
+        cycles polls are done.
+        """
+        for event in self.iter_watch(name, interval, initial, concurrent,
+                                     cycles):
+            callback(event)
+
+    def iter_watch(self, name='.*', interval=None, initial=False,
+                   concurrent=True, cycles=None):
+        """
+        Poll the zones matching name every interval seconds, yield an event
+        dict per change (see watch module): rrsets added, changed or deleted,
+        zones added or deleted, and errors.
+
+        A poll lists the zones (narrowed as in zones_list) and only fetches
+        the zones whose serials changed, on the executor when concurrent is
+        set. The first poll fetches every zone to know its content, with
+        initial set its rrsets are reported as added. A zone that cannot be
+        fetched is reported with an error event and fetched again at the
+        next poll. Servers not exposing serials in the listing get every
+        zone fetched at each poll.
+
+        :param name: Regular expression on zone names, see zones_list
+        :type name: String
+        :param interval: Seconds between polls, default to watch-interval
+        config value
+        :type interval: float
+        :param initial: Report the content of the zones found by the first
+        poll
+        :type initial: bool
+        :param cycles: Number of polls, default to polling forever
+        :type cycles: int
+        """
+        interval = float(interval if interval is not None
+                         else self.config.get('watch-interval'))
+        # zone name -> (version, state), state is None for a zone listed by
+        # the first poll but not fetched yet
+        states = {}
+        listed = False
+        cycle = 0
+        while cycles is None or cycle < cycles:
+            start = time.time()
+            failed = False
+            # Zones are news once a listing succeeded
+            for event in self._watch_poll(name, states, initial or listed,
+                                          concurrent):
+                failed = failed or (event['event'] == 'error' and
+                                    event['zone'] is None)
+                yield event
+            listed = listed or not failed
+            cycle += 1
+            if cycles is None or cycle < cycles:
+                time.sleep(max(0, interval - (time.time() - start)))
+
+    def _watch_poll(self, name, states, emit, concurrent):
+        from .api import PdnsError
+        from .cache import zone_version
+        from .watch import error_event, zone_event
+
+        try:
+            zones, code = self._list_zones(name)
+        except PdnsError as exc:
+            # The API is down, polls go on
+            zones, code = str(exc), -1
+        if code != 200:
+            log.error('Cannot list zones: %s', zones)
+            yield error_event(None, code, zones)
+            return
+        listed = dict((zone['name'], zone)
+                      for zone in filter_zones(zones, name))
+
+        for zone_name in sorted(set(states) - set(listed)):
+            del states[zone_name]
+            yield zone_event('zone_delete', zone_name, None)
+
+        jobs = []
+        for zone_name in sorted(listed):
+            zone = listed[zone_name]
+            version = zone_version(zone)
+            version_state = states.get(zone_name)
+            if (version_state is not None and version is not None and
+                    version_state[0] == version):
+                continue
+            if version_state is not None and version_state[1] is None:
+                # Listed by the first poll, its content is not news
+                zone_emit = False
+            else:
+                zone_emit = emit or version_state is not None
+            jobs.append((zone.get('id') or zone_name, zone_name, version,
+                         version_state and version_state[1], zone_emit))
+        silent = set(job[1] for job in jobs if not job[4])
+
+        for zone_name, version, code, result in self._map(self._watch_zone,
+                                                          jobs, concurrent):
+            if code != 200:
+                if zone_name in silent:
+                    states[zone_name] = (None, None)
+                yield error_event(zone_name, code, result)
+                continue
+            events, state = result
+            states[zone_name] = (version, state)
+            for event in events:
+                yield event
+
+    def _watch_zone(self, job):
+        from .watch import zone_events
+
+        zone_id, zone_name, version, previous, emit = job
+        result, code = self._fetch_rrsets(
+            zone_id, lambda rrsets: zone_events(zone_name, version, rrsets,
+                                                previous, emit))
+        return zone_name, version, code, result
+
+    def reconcile(self, zone_name, desired_rrsets, dry_run=False, prune=True,
+                  max_rrsets=None):
+        """
+        Make zone_name content match desired_rrsets with the fewest PATCH
+        requests: changed and missing rrsets are replaced, rrsets missing
+        from desired_rrsets are deleted (unless prune is False). SOA is never
+        changed. Return 2-tuple : differences (see diff.diff_rrsets), list of
+        batch results (empty on dry run), or the error response body and
+        code if the zone cannot be fetched.
+
+        :param zone_name: Zone to reconcile
+        :type zone_name: String
+        :param desired_rrsets: Full zone content, rrsets as returned by
+        zones_get (records may be given as plain contents)
+        :type desired_rrsets: iterable
+        :param dry_run: Only compute the differences
+        :type dry_run: bool
+        :param prune: Delete rrsets missing from desired_rrsets
+        :type prune: bool
+        :param max_rrsets: Maximum number of rrsets per PATCH, default to
+        batch-size config value
+        :type max_rrsets: int
+        """
+        max_rrsets = int(max_rrsets or self.config.get('batch-size'))
+        if max_rrsets < 1:
+            raise ValueError('max_rrsets must be a positive integer')
+
+        data, code = self._get_zone(zone_name)
+        if code != 200:
+            return data, code
+
+        from .diff import diff_rrsets
+        with trace(self.hooks, 'reconcile.diff'):
+            differences = diff_rrsets(data['rrsets'], desired_rrsets,
+                                      prune=prune)
+        if dry_run or not differences:
+            return differences, []
+
+        zone_name = zone_name if zone_name.endswith('.') else zone_name + '.'
+        results = []
+        for start in range(0, len(differences), max_rrsets):
+            batch = collections.OrderedDict(
+                ((diff['name'], diff['type']), (diff, diff['rrset']))
+                for diff in differences[start:start + max_rrsets])
+            results.append(self._send_batch((zone_name, batch, None, None)))
+        return differences, results
+
+    def _iter_batches(self, changes, max_rrsets, override=True):
+        for zone, batch, error, code in self._group_changes(changes,
+                                                            max_rrsets):
+            if error:
+                yield zone, batch, error, code
+                continue
+
+            if not override:
+                existing, code = self.existing_records(
+                    zone, [key for key, (_, rrset) in iteritems(batch)
+                           if rrset['changetype'] == 'REPLACE'])
+                if code != 200:
+                    # Records may exist, the batch is not sent
+                    yield (zone, batch,
+                           'Cannot check existing records: %s' % (existing,),
+                           code)
+                    continue
+                if existing:
+                    keys = [key for key in batch
+                            if record_key(*key) in existing]
+                    yield (zone,
+                           collections.OrderedDict((key, batch.pop(key))
+                                                   for key in keys),
+                           'Specify override=True for erasing existing record',
+                           -1)
+                if not batch:
+                    continue
+
+            yield zone, batch, None, None
+
+    def _group_changes(self, changes, max_rrsets):
+        """
+        Yield (zone, batch, error, code) : batches of at most max_rrsets
+        changes on a zone, or a single change that cannot be applied, its
+        error and code (-1, or the status of a failed zones listing).
+
+        A batch is pending per zone until it is full, once the changes
+        pending on all zones reach max-pending-changes the largest batch is
+        yielded: memory does not grow with the number of zones.
+
+        The zones are listed once: when the listing fails, the changes whose
+        zone must be found from their name all fail with its error.
+        """
+        from .api import PdnsError, PdnsResponseError
+
+        max_pending = max(int(self.config.get('max-pending-changes') or 0),
+                          max_rrsets)
+        pending = collections.OrderedDict()
+        count = 0
+        listing_error = None
+        for change in changes:
+            error, code = change_error(change), -1
+            if error is None and listing_error and not change.get('zone'):
+                error, code = listing_error
+            elif error is None:
+                try:
+                    zone, rrset = self._change_rrset(change)
+                except PdnsResponseError as exc:
+                    error, code = listing_error = str(exc), exc.code
+                except PdnsError as exc:
+                    error, code = listing_error = str(exc), -1
+                else:
+                    if not zone:
+                        error = 'Cannot find zone for record'
+            if error:
+                log.info('Cannot apply change %s: %s', change, error)
+                yield None, {None: (change, None)}, error, code
+                continue
+
+            batch = pending.setdefault(zone, collections.OrderedDict())
+            key = record_key(rrset['name'], rrset['type'])
+            if key in batch or len(batch) >= max_rrsets:
+                count -= len(batch)
+                yield zone, pending.pop(zone), None, None
+                batch = pending[zone] = collections.OrderedDict()
+            batch[key] = (change, rrset)
+            count += 1
+
+            if count >= max_pending:
+                largest = max(pending, key=lambda name: len(pending[name]))
+                count -= len(pending[largest])
+                yield largest, pending.pop(largest), None, None
+
+        for zone, batch in iteritems(pending):
+            yield zone, batch, None, None
+
+    def _change_rrset(self, change):
+        name = change['name']
+        zone = change.get('zone')
+        if not zone:
+            _, zone = self._construct_names(name)
+            if not zone:
+                return None, None
+
+        name = name if name.endswith('.') else name + '.'
+        # Names are case insensitive, changes on a same zone are batched
+        # together whatever their case
+        zone = zone.lower() if zone.endswith('.') else zone.lower() + '.'
+        rrset = build_rrset(name, change['type'].upper(),
+                            change.get('content', ''),
+                            change.get('comment', ''),
+                            changetype=str(change.get('changetype',
+                                                      'REPLACE')).upper(),
+                            ttl=int(change.get('ttl', 3600)),
+                            reverse=change.get('reverse', False),
+                            disabled=change.get('disabled', False))
+        return zone, rrset
+
+    def _send_batch(self, zone_batch):
+        zone, batch, error, code = zone_batch
+        changes = [change for change, _ in batch.values()]
+        if error:
+            return {'zone': zone, 'code': code, 'success': False,
+                    'result': error, 'changes': changes}
+
+        from .api import PdnsError
+        data = {'rrsets': [rrset for _, rrset in batch.values()]}
+        try:
+            ret, code = self.zones_api.update_records(zone, data)
+        except PdnsError as exc:
+            # Reported like other failures, remaining batches are still sent
+            ret, code = str(exc), -1
+        self._zone_written(zone)
+        if code not in (200, 204):
+            log.error('Batch of %d rrsets on zone %s failed: %s',
+                      len(changes), zone, ret)
+        return {'zone': zone, 'code': code, 'success': code in (200, 204),
+                'result': ret, 'changes': changes}
+
     def search(self, term, object_type=None, zone=None, rtype=None,
-               max_results=None):
+               max_results=None, objects=False):
         """
         Search for data in zone & record
 
@@ -242,26 +1438,69 @@ class PyPDNS(object):
         :param rtype: filter on the given record's type (implies object_type = record)
         :param max_results: Limit number of results, default to None
         :rtype max_results: int
+        :param objects: Return SearchResult objects
+        :type objects: bool
         """
-        results, sts_code = self.search_api.search(term, max_results)
-        object_type = 'record' if zone or rtype else object_type
-        if not object_type or sts_code != 200:
-            return results
+        from .query import SearchPlan
 
-        filtered = [rec for rec in results if rec['object_type'] == object_type]
+        plan = SearchPlan(term, object_type, zone, rtype, max_results,
+                          self.config.get('search-fetch-limit'))
+        results, sts_code = self.search_api.search(**plan.params())
+        if sts_code != 200:
+            return results
+        with trace(self.hooks, 'search.filter'):
+            results = list(self._search_pages(plan, results,
+                                              self.search_api.search))
+        if objects:
+            return [SearchResult.from_dict(result) for result in results]
+        return results
 
-        if zone:
-            zone = zone + '.' if not zone.endswith('.') else zone
-            filtered = [rec for rec in filtered if rec.get('zone') == zone]
+    def iter_search(self, term, object_type=None, zone=None, rtype=None,
+                    max_results=None, objects=False):
+        """
+        Same as search but results are parsed and filtered while they are
+        downloaded (requires ijson, otherwise the body is decoded at once),
+        Return a generator of results or the error response body.
+        """
+        from .query import SearchPlan
 
-        if rtype:
-            filtered = [rec for rec in filtered if rec.get('type') == rtype]
+        plan = SearchPlan(term, object_type, zone, rtype, max_results,
+                          self.config.get('search-fetch-limit'))
+        results, sts_code = self.search_api.iter_search(**plan.params())
+        if sts_code != 200:
+            return results
+        results = self._search_pages(plan, results,
+                                     self.search_api.iter_search)
+        if objects:
+            return (SearchResult.from_dict(result) for result in results)
+        return results
 
-        return filtered
+    def _search_pages(self, plan, results, search):
+        """
+        Yield the results of plan (see query.SearchPlan), results is the
+        response to its first request, larger ones are sent with search
+        while the filters leave fewer than max_results.
+        """
+        while True:
+            for result in plan.filter(results):
+                yield result
+            if not plan.pending:
+                return
+            log.debug('Search %s: %d results after filters, fetching %d',
+                      plan.term, plan.matched, plan.fetch)
+            results, sts_code = search(**plan.params())
+            if sts_code != 200:
+                log.error('Search %s failed: %s', plan.term, results)
+                return
 
     def add(self, record_name, content, comment, rtype,ttl=3600, reverse=False,
             override=False):
-        record, zone = self._construct_names(record_name)
+        from .api import PdnsResponseError
+
+        try:
+            record, zone = self._construct_names(record_name)
+        except PdnsResponseError as exc:
+            return exc.result, exc.code
         if not zone:
             log.info('Cannot find zone for record : %s', record_name)
             return False
@@ -270,7 +1509,12 @@ class PyPDNS(object):
                                ttl=ttl, reverse=reverse, override=override)
 
     def delete(self, record_name, comment, rtype, override=False):
-        record, zone = self._construct_names(record_name)
+        from .api import PdnsResponseError
+
+        try:
+            record, zone = self._construct_names(record_name)
+        except PdnsResponseError as exc:
+            return exc.result, exc.code
         if not zone:
             log.info('Cannot find zone for record : %s', record_name)
             return False
@@ -278,16 +1522,71 @@ class PyPDNS(object):
         return self.record_add(zone, record, '', comment, type_=rtype,
                                override=override, changetype='DELETE')
 
-    def _get_record(self, name, rtype):
-        if name.endswith('.'):
-            sname = name[:-1]
+    def existing_records(self, zone_name, keys):
+        """
+        Return 2-tuple : dict of the rrsets of zone_name found for the given
+        (name, type) keys, response code. Each key is looked up with a
+        request for its rrset only, several keys on the executor: the zone
+        is never downloaded for them.
+
+        Names are compared case insensitively, found rrsets are keyed by
+        (lower case name, type). When a lookup fails the error response
+        body and code are returned (-1 if the API cannot be reached): the
+        records may exist, callers must not replace them.
+
+        :param zone_name: Zone name
+        :type zone_name: String
+        :param keys: (full record name, type) couples
+        :type keys: iterable
+        :rtype: tuple
+        """
+        from .api import PdnsError
+
+        keys = [record_key(name, type_) for name, type_ in keys]
+        if not keys:
+            return {}, 200
+
+        def lookup(key):
+            return key, self.zones_api.get_rrset(zone_name, *key)
+
+        if len(keys) == 1:
+            lookups = (lookup(key) for key in keys)
         else:
-            sname = name
-            name += '.'
-        search = self.search(sname)
-        return next((rr for rr in search if rr.get('name') == name and
-                                            rr.get('type') == rtype),
-                    None)
+            lookups = self.executor.imap(lookup, keys)
+        wanted = set(keys)
+        found = {}
+        try:
+            for key, (ret, code) in lookups:
+                if code != 200:
+                    log.error('Cannot get rrset %s %s: %s', key[0], key[1],
+                              ret)
+                    return ret, code
+                whole_zone = False
+                for rrset in ret.get('rrsets', ()):
+                    rrset_key = record_key(rrset['name'], rrset['type'])
+                    if rrset_key in wanted:
+                        found[rrset_key] = rrset
+                    whole_zone = whole_zone or rrset_key != key
+                if whole_zone:
+                    # The server ignored the rrset filter (PowerDNS before
+                    # 4.6), this zone answers every key
+                    break
+        except PdnsError as exc:
+            log.error('Cannot check records of zone %s: %s', zone_name, exc)
+            return str(exc), -1
+        return found, 200
+
+    def _get_record(self, name, rtype, zone_name):
+        """
+        Return 2-tuple : the rrset name/rtype of zone_name formatted as in
+        zones_get or None if it does not exist, response code, or the error
+        response body and code (see existing_records).
+        """
+        found, code = self.existing_records(zone_name, [(name, rtype)])
+        if code != 200:
+            return found, code
+        rrset = next(iter(found.values()), None)
+        return rrset and format_rrset(rrset), code
 
     def _validate_override(self, record):
         valid = False
@@ -305,25 +1604,82 @@ class PyPDNS(object):
                 valid = True
         return valid
 
-    def _zone_exists(self, zone):
-        resp = self.zones_get(zone)
-        if 'error' in resp:
-            res = None
-        else:
-            res = resp
-        return res
+    def invalidate_zones_cache(self):
+        """
+        Drop the cached zone index, next lookup will fetch the zone list again.
+        """
+        self._zones_cache = None
+        self._zones_cache_time = 0
+
+    def _zone_names(self):
+        """
+        Return the set of zone names hosted on the server.
+
+        The set is built from a single zones listing and kept for
+        zones-cache-ttl seconds (0 disables caching). Raise
+        PdnsResponseError when the listing fails.
+        """
+        from .api import PdnsResponseError
+
+        ttl = int(self.config.get('zones-cache-ttl') or 0)
+        if (self._zones_cache is None or
+                time.time() - self._zones_cache_time >= ttl):
+            ret, code = self.zones_api.get_zones()
+            if code != 200:
+                log.error('Cannot list zones: %s', ret)
+                raise PdnsResponseError('Cannot list zones: %s' % (ret,),
+                                        code, ret, verb='GET')
+            self._index_zones(ret)
+        return self._zones_cache
+
+    def _index_zones(self, zones):
+        self._zones_cache = set(zone['name'].lower() for zone in zones)
+        self._zones_cache_time = time.time()
+
+    def _get_zone(self, zone_id):
+        """
+        Return zone data and response code, from the snapshot cache when
+        enabled and the zone serials did not change since it was fetched.
+        """
+        if self.snapshots is None:
+            return self.zones_api.get_zone(zone_id)
+
+        # Only the listing entry of the zone is needed for its serials
+        name = zone_id if zone_id.endswith('.') else zone_id + '.'
+        zones, code = self.zones_api.get_zones(zone=name)
+        if code != 200:
+            return zones, code
+        listed = next((zone for zone in zones
+                       if zone['name'].lower() == name.lower()), None)
+        from .cache import zone_version
+        version = listed and zone_version(listed)
+        if version is None:
+            return self.zones_api.get_zone(zone_id)
+
+        data = self.snapshots.get(listed['name'], version)
+        if data is not None:
+            log.debug('Zone %s unchanged, serving snapshot', name)
+            return data, 200
+
+        data, code = self.zones_api.get_zone(zone_id)
+        if code == 200:
+            self.snapshots.set(listed['name'], version, data)
+        return data, code
 
     def _construct_names(self, name):
+        with trace(self.hooks, 'construct_names'):
+            return self._lookup_names(name)
+
+    def _lookup_names(self, name):
         sub_names = name.split('.')
-        # Iterates on sub domains to find record name & zone, use api to find
-        # the first name matching a zone.
-        zone = []
-        record = []
+        zones = self._zone_names()
+        # Iterates on sub domains, longest suffix first, the first one found
+        # in the zone index is the most specific zone holding the record.
         for i in range(0, len(sub_names)):
             sub_zone = '.'.join(sub_names[i:])
-            search = self._zone_exists(sub_zone)
-            if search:
-                zone = sub_names[i:]
-                record = [rr for rr in sub_names if rr not in sub_names[i:]]
+            if not sub_zone:
                 break
-        return ('.'.join(record), '.'.join(zone))
+            fqdn = sub_zone if sub_zone.endswith('.') else sub_zone + '.'
+            if fqdn.lower() in zones:
+                return ('.'.join(sub_names[:i]), sub_zone)
+        return ('', '')
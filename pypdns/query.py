@@ -0,0 +1,253 @@
+"""
+Query planning: client side filters are turned into parameters of the zones
+and search-data endpoints. Server side parameters only narrow the results,
+they are still filtered client side, so a plan must fetch a superset of the
+wanted objects.
+"""
+from .pypdns import filter_search, filter_zones, iter_filter_search
+
+
+# Over-fetch factor of the first request of a search filtered client side
+OVER_FETCH = 2
+# Search results fetched at most by a plan, over this the results are
+# returned as is
+DEFAULT_FETCH_LIMIT = 10000
+# Zones listed one by one at most, over this one listing of all zones is
+# cheaper
+MAX_ZONE_LOOKUPS = 10
+
+_QUANTIFIERS = frozenset('*+?{')
+
+
+def _atom(pattern, i):
+    """
+    Return 2-tuple : glob token matching the regex atom at i (a literal char
+    or ?), index following the atom. The token is None when the atom cannot
+    be translated.
+    """
+    char = pattern[i]
+    if char == '\\' and i + 1 < len(pattern):
+        escaped = pattern[i + 1]
+        return (escaped if not escaped.isalnum() else '?'), i + 2
+    if char == '.':
+        return '?', i + 1
+    if char == '[':
+        end = pattern.find(']', i + 2)
+        if end == -1 or '\\' in pattern[i:end]:
+            return None, i
+        return '?', end + 1
+    if char in '()|^$*+?{}]':
+        return None, i
+    return char, i + 1
+
+
+def _skip_quantifier(pattern, i):
+    if pattern[i] == '{':
+        end = pattern.find('}', i)
+        i = len(pattern) if end == -1 else end + 1
+    else:
+        i += 1
+    # Lazy or possessive quantifier
+    if i < len(pattern) and pattern[i] in '?+':
+        i += 1
+    return i
+
+
+def regex_glob(pattern):
+    """
+    Return a search-data pattern (* and ? wildcards) matching, without their
+    trailing dot, at least the names re.match(pattern) matches. None when
+    the pattern holds no literal char or cannot be translated.
+
+    'example\\.com\\.$' -> 'example.com', 'web.*\\.example' -> 'web*.example*'
+    """
+    if not pattern or '|' in pattern:
+        return None
+
+    tokens = []
+    i = 1 if pattern.startswith('^') else 0
+    anchored = False
+    while i < len(pattern):
+        if pattern[i] == '$' and i == len(pattern) - 1:
+            anchored = True
+            break
+        token, next_i = _atom(pattern, i)
+        if token is None:
+            break
+        if next_i < len(pattern) and pattern[next_i] in _QUANTIFIERS:
+            token = '*'
+            next_i = _skip_quantifier(pattern, next_i)
+        tokens.append(token)
+        i = next_i
+
+    if not anchored:
+        tokens.append('*')
+    # Names are searched without their trailing dot
+    end = len(tokens) - 1 if tokens[-1:] == ['*'] else len(tokens)
+    while end > 0 and tokens[end - 1] in ('.', '?'):
+        del tokens[end - 1]
+        end -= 1
+
+    glob = []
+    for token in tokens:
+        if token != '*' or glob[-1:] != ['*']:
+            glob.append(token)
+    glob = ''.join(glob)
+    if not glob.replace('*', '').replace('?', ''):
+        return None
+    return glob
+
+
+def exact_name(pattern):
+    """
+    Return the only zone name pattern can match, None if it may match more.
+    """
+    glob = regex_glob(pattern)
+    if glob is None or '*' in glob or '?' in glob:
+        return None
+    return glob + '.'
+
+
+class ZoneListingPlan(object):
+    """
+    Requests listing at least the zones matching a name regular expression.
+
+    A name matching a single zone is listed with the zone parameter.
+    Otherwise its literal parts are searched as zone names (search-data)
+    and, if few zones match, they are listed one by one. Any other case
+    lists all zones.
+
+        plan = ZoneListingPlan(name)
+        if plan.zone:
+            return zones_api.get_zones(zone=plan.zone)
+        names = None
+        if plan.search is not None:
+            names = plan.lookups(*search_api.search(**plan.search))
+        if names is None:
+            return zones_api.get_zones()
+        return plan.merge(zones_api.get_zones(zone=n) for n in names)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.zone = exact_name(name)
+        glob = None if self.zone else regex_glob(name)
+        # Keyword arguments of the SearchAPI.search call finding the zones
+        self.search = None
+        if glob is not None:
+            self.search = {'term': glob, 'max_results': MAX_ZONE_LOOKUPS + 1,
+                           'object_type': 'zone'}
+
+    def lookups(self, results, code):
+        """
+        Return the names of the zones to list one by one found by the
+        search, None if all zones must be listed.
+        """
+        if code != 200 or len(results) > MAX_ZONE_LOOKUPS:
+            return None
+        return [result['name'] for result in
+                filter_zones(filter_search(results, 'zone'), self.name)]
+
+    @staticmethod
+    def merge(responses):
+        """
+        Return 2-tuple : zones of the (zones, code) responses of the lookups,
+        200, or the first failed response.
+        """
+        zones = []
+        for ret, code in responses:
+            if code != 200 or len(ret) > 1:
+                # Error, or the server ignores the zone parameter
+                return ret, code
+            zones.extend(ret)
+        return zones, 200
+
+
+class SearchPlan(object):
+    """
+    Server side parameters and adaptive over-fetch of a search filtered on
+    object type, zone and record type.
+
+    object_type is sent to the server, zone and rtype filters are applied
+    client side: while fewer than max_results results pass them and the
+    server returned a full page, the search is sent again with a larger max
+    (the API has no paging), from the selectivity seen so far. Results
+    already returned are skipped.
+
+        plan = SearchPlan(term, zone='example.com.', max_results=10)
+        while plan.pending:
+            results, code = search_api.search(**plan.params())
+            found.extend(plan.filter(results))
+    """
+
+    def __init__(self, term, object_type=None, zone=None, rtype=None,
+                 max_results=None, fetch_limit=DEFAULT_FETCH_LIMIT):
+        self.object_type = 'record' if zone or rtype else object_type
+        self.zone = zone
+        self.rtype = rtype
+        self.max_results = int(max_results) if max_results else None
+        self.fetch_limit = max(int(fetch_limit), self.max_results or 0)
+        self.term = term
+        if zone and term == '*':
+            # Names of a zone records end with the zone name
+            self.term = '*' + zone.rstrip('.')
+
+        self.client_side = bool(zone or rtype)
+        self.fetch = self.max_results
+        if self.fetch and self.client_side:
+            self.fetch = min(self.fetch * OVER_FETCH, self.fetch_limit)
+        self.pending = True
+        self.requests = 0
+        self.matched = 0
+        self._seen = set()
+
+    def params(self):
+        """
+        Return the keyword arguments of the next SearchAPI.search call.
+        """
+        return {'term': self.term, 'max_results': self.fetch,
+                'object_type': self.object_type}
+
+    def filter(self, results):
+        """
+        Yield the results of a response not returned yet that pass the
+        filters, up to max_results, then plan the next request.
+        """
+        self.pending = False
+        self.requests += 1
+        received = [0]
+
+        def count(results):
+            for result in results:
+                received[0] += 1
+                yield result
+
+        matched = 0
+        try:
+            for result in iter_filter_search(count(results), self.object_type,
+                                             self.zone, self.rtype):
+                matched += 1
+                if self.max_results:
+                    # A larger request returns these results again
+                    key = tuple(sorted(result.items()))
+                    if key in self._seen:
+                        continue
+                    self._seen.add(key)
+                self.matched += 1
+                yield result
+                if self.max_results and self.matched >= self.max_results:
+                    return
+        finally:
+            self._plan_next(received[0], matched)
+
+    def _plan_next(self, received, matched):
+        if (not self.max_results or self.matched >= self.max_results or
+                received < self.fetch or self.fetch >= self.fetch_limit):
+            # Everything the server has was returned, or enough of it
+            return
+        # Estimate the page size holding max_results matches
+        ratio = float(matched) / received if received else 0
+        wanted = (self.max_results / ratio * 1.25 if ratio
+                  else self.fetch * 4)
+        self.fetch = int(min(self.fetch_limit, max(self.fetch * 2, wanted)))
+        self.pending = True
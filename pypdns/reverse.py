@@ -0,0 +1,224 @@
+"""
+Forward / reverse consistency: the PTR records of the in-addr.arpa and
+ip6.arpa zones are indexed by address, then the A and AAAA records of the
+forward zones are checked against the index.
+
+Addresses are kept as integers. A reverse zone is a prefix of the address
+space (2.0.192.in-addr.arpa. is 192.0.2.0/24), the zones are stored in a
+dict per prefix length so finding the zone of an address costs one dict
+lookup per prefix length in use.
+
+Issues found:
+    missing     an A or AAAA record in a reverse zone range has no PTR
+    mismatched  a PTR exists but targets none of the names of the address
+    dangling    a PTR exists for an address no forward record uses
+    out-of-scope  a PTR targets names outside the forward zones checked,
+                it cannot be judged
+"""
+import ipaddress
+
+from .compat import intern, iteritems
+
+
+REVERSE_SUFFIXES = {4: 'in-addr.arpa.', 6: 'ip6.arpa.'}
+
+_BITS = {4: 32, 6: 128}
+_LABEL_BITS = {4: 8, 6: 4}
+_ADDRESS_CLASSES = {4: ipaddress.IPv4Address, 6: ipaddress.IPv6Address}
+
+
+def is_reverse_zone(name):
+    name = name.lower()
+    return any(name == suffix or name.endswith('.' + suffix)
+               for suffix in REVERSE_SUFFIXES.values())
+
+
+def covering_zone(name, zones):
+    """
+    Return the most specific of the zones (a set of lower case names) holding
+    name, None if none does.
+    """
+    labels = name.lower().rstrip('.').split('.')
+    for i in range(len(labels)):
+        zone = '.'.join(labels[i:]) + '.'
+        if zone in zones:
+            return zone
+    return None
+
+
+def reverse_network(name):
+    """
+    Return 3-tuple : IP version, prefix, prefix length of a reverse zone or
+    PTR name, None if name is not a reverse name (RFC 2317 classless names
+    such as 0/26.2.0.192.in-addr.arpa. are not).
+
+    '2.0.192.in-addr.arpa.' -> (4, 0xc00002, 24)
+    """
+    name = name.lower().rstrip('.') + '.'
+    for version, suffix in iteritems(REVERSE_SUFFIXES):
+        if name == suffix:
+            labels = []
+        elif name.endswith('.' + suffix):
+            labels = name[:-len(suffix) - 1].split('.')
+        else:
+            continue
+
+        bits = _LABEL_BITS[version]
+        if len(labels) * bits > _BITS[version]:
+            return None
+        prefix = 0
+        for label in reversed(labels):
+            try:
+                value = int(label) if version == 4 else int(label, 16)
+            except ValueError:
+                return None
+            if value >= 1 << bits or (version == 6 and len(label) != 1):
+                return None
+            prefix = prefix << bits | value
+        return version, prefix, len(labels) * bits
+    return None
+
+
+def ptr_name(version, address):
+    """
+    Return the PTR record name of an address integer.
+    """
+    bits = _LABEL_BITS[version]
+    mask = (1 << bits) - 1
+    fmt = '%d' if version == 4 else '%x'
+    return '.'.join(fmt % (address >> shift & mask)
+                    for shift in range(0, _BITS[version], bits)) + \
+        '.' + REVERSE_SUFFIXES[version]
+
+
+def parse_address(content):
+    """
+    Return 2-tuple : IP version, address integer of an A or AAAA record
+    content, None if it is not a valid address.
+    """
+    try:
+        address = ipaddress.ip_address(u'%s' % content)
+    except ValueError:
+        return None
+    return address.version, int(address)
+
+
+def address_text(version, address):
+    return str(_ADDRESS_CLASSES[version](address))
+
+
+class ReverseIndex(object):
+    """
+    PTR targets by address, and reverse zones by prefix.
+    """
+
+    def __init__(self):
+        # version -> address -> target name, or tuple of names
+        self.ptrs = {4: {}, 6: {}}
+        # PTR names that are not an address (RFC 2317, wrong length)
+        self.ignored = 0
+        # version -> prefix length -> prefix -> zone name
+        self._zones = {4: {}, 6: {}}
+        self._lengths = {4: [], 6: []}
+
+    def __len__(self):
+        return len(self.ptrs[4]) + len(self.ptrs[6])
+
+    def add_zone(self, name):
+        """
+        Register a reverse zone, return False if name is not one.
+        """
+        network = reverse_network(name)
+        if network is None:
+            return False
+        version, prefix, length = network
+        self._zones[version].setdefault(length, {})[prefix] = name
+        # Longest prefix first
+        self._lengths[version] = sorted(self._zones[version], reverse=True)
+        return True
+
+    def zone(self, version, address):
+        """
+        Return the reverse zone holding the PTR of address, None if no zone
+        covers it.
+        """
+        bits = _BITS[version]
+        zones = self._zones[version]
+        for length in self._lengths[version]:
+            zone = zones[length].get(address >> (bits - length))
+            if zone is not None:
+                return zone
+        return None
+
+    def add_ptr(self, name, targets):
+        """
+        Index the targets of the PTR rrset name, return False if name is not
+        the PTR name of an address.
+        """
+        network = reverse_network(name)
+        if network is None or network[2] != _BITS[network[0]] or not targets:
+            self.ignored += 1
+            return False
+        version, address, _ = network
+        targets = sorted(set(intern(str(target.lower())) for target in targets))
+        # Most PTR rrsets hold a single record, stored without a tuple
+        self.ptrs[version][address] = (targets[0] if len(targets) == 1
+                                       else tuple(targets))
+        return True
+
+    def targets(self, version, address):
+        """
+        Return the tuple of PTR targets of address, empty if it has no PTR.
+        """
+        value = self.ptrs[version].get(address, ())
+        return (value,) if isinstance(value, str) else value
+
+
+def forward_addresses(rrsets):
+    """
+    Yield (name, ttl, version, address) for the enabled records of the A and
+    AAAA rrsets, invalid contents are skipped.
+    """
+    for rrset in rrsets:
+        if rrset['type'] not in ('A', 'AAAA'):
+            continue
+        name = rrset['name'].lower()
+        for record in rrset['records']:
+            if record.get('disabled'):
+                continue
+            parsed = parse_address(record['content'])
+            if parsed is not None:
+                yield name, rrset['ttl'], parsed[0], parsed[1]
+
+
+def ptr_targets(rrsets):
+    """
+    Yield (name, targets) for the PTR rrsets, disabled records excluded.
+    """
+    for rrset in rrsets:
+        if rrset['type'] != 'PTR':
+            continue
+        targets = [record['content'] for record in rrset['records']
+                   if not record.get('disabled')]
+        if targets:
+            yield rrset['name'], targets
+
+
+def issue(kind, version, address, zone, names=(), targets=(), fix=None):
+    return {'issue': kind, 'address': address_text(version, address),
+            'ptr': ptr_name(version, address), 'zone': zone,
+            'names': sorted(names), 'targets': list(targets), 'fix': fix}
+
+
+def fix_change(version, address, zone, name=None, ttl=None):
+    """
+    Return the change (see PyPDNS.apply_changes) pointing the PTR of address
+    to name, or deleting it when name is None.
+    """
+    change = {'name': ptr_name(version, address), 'type': 'PTR',
+              'zone': zone, 'comment': ''}
+    if name is None:
+        change['changetype'] = 'DELETE'
+    else:
+        change.update(changetype='REPLACE', content=[name], ttl=ttl)
+    return change
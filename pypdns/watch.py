@@ -0,0 +1,60 @@
+"""
+Change feed: zones are polled through the zones listing, only the zones
+whose serials changed are fetched and compared rrset by rrset with their
+previous content.
+
+The previous content of a zone is kept as a hash of each rrset signature
+(see diff.rrset_signature), events hold the new rrsets:
+
+    {'event': 'add' | 'change' | 'delete', 'zone': ..., 'version': ...,
+     'name': ..., 'type': ..., 'rrset': rrset or None on delete}
+    {'event': 'zone_add' | 'zone_delete', 'zone': ..., 'version': ...}
+    {'event': 'error', 'zone': ... or None, 'code': ..., 'result': ...}
+"""
+from .diff import rrset_key, rrset_signature
+
+
+def zone_event(event, zone, version):
+    return {'event': event, 'zone': zone, 'version': version}
+
+
+def error_event(zone, code, result):
+    return {'event': 'error', 'zone': zone, 'code': code, 'result': result}
+
+
+def rrset_event(event, zone, version, key, rrset=None):
+    return {'event': event, 'zone': zone, 'version': version,
+            'name': key[0], 'type': key[1], 'rrset': rrset}
+
+
+def zone_events(zone, version, rrsets, previous=None, emit=True):
+    """
+    Compare rrsets, the content of zone at version, with its previous state,
+    return 2-tuple : list of events, new state. A zone without previous
+    state is new: with emit set its rrsets are reported as added, otherwise
+    no event is returned.
+
+    :param previous: State returned by the previous call on zone
+    :type previous: dict
+    """
+    events = []
+    if previous is None and emit:
+        events.append(zone_event('zone_add', zone, version))
+    state = {}
+    for rrset in rrsets:
+        key = rrset_key(rrset)
+        state[key] = hash(rrset_signature(rrset))
+        if previous is None:
+            if emit:
+                events.append(rrset_event('add', zone, version, key, rrset))
+            continue
+        old = previous.get(key)
+        if old is None:
+            events.append(rrset_event('add', zone, version, key, rrset))
+        elif old != state[key]:
+            events.append(rrset_event('change', zone, version, key, rrset))
+
+    for key in previous or ():
+        if key not in state:
+            events.append(rrset_event('delete', zone, version, key))
+    return events, state
@@ -0,0 +1,145 @@
+"""
+In memory zone model, rrsets are indexed once so lookups do not scan the
+whole zone.
+"""
+import re
+import bisect
+import collections
+
+
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+_QUANTIFIERS = frozenset('*?{')
+
+
+def literal_prefix(pattern):
+    """
+    Return the literal string any match of pattern (re.match semantics)
+    starts with, '' when it cannot be told.
+    """
+    if '|' in pattern:
+        return ''
+
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern) and \
+                not pattern[i + 1].isalnum():
+            # Escaped punctuation, e.g. \.
+            char = pattern[i + 1]
+            i += 1
+        elif char in _REGEX_SPECIAL:
+            if char in _QUANTIFIERS and prefix:
+                # The previous char may be repeated 0 times
+                prefix.pop()
+            break
+        elif i + 1 < len(pattern) and pattern[i + 1] in _QUANTIFIERS:
+            break
+        prefix.append(char)
+        i += 1
+    return ''.join(prefix)
+
+
+def reversed_name(name):
+    """
+    Return name labels in reverse order: www.example.com. -> com.example.www
+    """
+    return '.'.join(reversed(name.rstrip('.').lower().split('.')))
+
+
+class Zone(object):
+    """
+    Zone rrsets indexed by (name, type), by type, by name and by reversed
+    name for subtree queries. Queries return rrsets in zone order.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.name = data.get('name')
+        self.rrsets = data['rrsets']
+
+        self._by_key = {}
+        self._by_name = collections.defaultdict(list)
+        self._by_type = collections.defaultdict(list)
+        for position, rrset in enumerate(self.rrsets):
+            self._by_key[(rrset['name'], rrset['type'])] = rrset
+            self._by_name[rrset['name']].append(position)
+            self._by_type[rrset['type']].append(position)
+
+        self._names = sorted(self._by_name)
+        self._reversed = sorted((reversed_name(name), name)
+                                for name in self._names)
+
+    def __len__(self):
+        return len(self.rrsets)
+
+    def __iter__(self):
+        return iter(self.rrsets)
+
+    def get(self, name, type_):
+        """
+        Return the rrset name/type_, None if it does not exist.
+        """
+        name = name if name.endswith('.') else name + '.'
+        return self._by_key.get((name, type_.upper()))
+
+    def by_name(self, name):
+        name = name if name.endswith('.') else name + '.'
+        return [self.rrsets[pos] for pos in self._by_name.get(name, [])]
+
+    def by_type(self, type_):
+        return [self.rrsets[pos] for pos in self._by_type.get(type_.upper(),
+                                                               [])]
+
+    def types(self):
+        return list(self._by_type)
+
+    def subtree(self, name):
+        """
+        Return rrsets of name and of every name below it.
+        """
+        key = reversed_name(name)
+        positions = []
+        # Children keys are in [key + '.', key + '/'), '/' follows '.'
+        for low, high in ((key, key + '\0'), (key + '.', key + '/')):
+            start = bisect.bisect_left(self._reversed, (low,))
+            end = bisect.bisect_left(self._reversed, (high,))
+            for _, rname in self._reversed[start:end]:
+                positions.extend(self._by_name[rname])
+        return [self.rrsets[pos] for pos in sorted(positions)]
+
+    def filter(self, name='.*', _type='.*'):
+        """
+        Return rrsets whose name and type match the regular expressions
+        (re.match semantics). Candidates are narrowed with the indexes
+        before any regular expression is run on names.
+        """
+        name_re = re.compile(name)
+        type_re = re.compile(_type)
+
+        types = [rtype for rtype in self._by_type if type_re.match(rtype)]
+        if len(types) == len(self._by_type):
+            types = None
+
+        prefix = literal_prefix(name)
+        if prefix:
+            start = bisect.bisect_left(self._names, prefix)
+            positions = []
+            for rname in self._names[start:]:
+                if not rname.startswith(prefix):
+                    break
+                positions.extend(self._by_name[rname])
+            if types is not None:
+                types = set(types)
+                positions = [pos for pos in positions
+                             if self.rrsets[pos]['type'] in types]
+            positions.sort()
+        elif types is not None:
+            positions = sorted(pos for rtype in types
+                               for pos in self._by_type[rtype])
+        else:
+            positions = range(len(self.rrsets))
+
+        rrsets = self.rrsets
+        return [rrsets[pos] for pos in positions
+                if name_re.match(rrsets[pos]['name'])]
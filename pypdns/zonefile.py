@@ -0,0 +1,329 @@
+"""
+Zone contents on disk: JSONL (one API rrset per line) and BIND master file
+formats.
+"""
+import os
+import re
+import collections
+
+from .jsonlib import dumps
+
+
+# File extension of each format
+FORMATS = {
+    'jsonl': '.jsonl',
+    'bind': '.zone',
+}
+
+# Disabled records are written commented out, and read back as disabled
+DISABLED_PREFIX = '; disabled: '
+
+
+def write_jsonl(rrsets, fh):
+    """
+    Write rrsets to fh, one json rrset per line, return the number of
+    rrsets written.
+    """
+    count = 0
+    for rrset in rrsets:
+        fh.write(dumps(rrset, sort_keys=True) + '\n')
+        count += 1
+    return count
+
+
+def bind_lines(rrset):
+    """
+    Return the master file lines of rrset, disabled records are commented
+    out.
+    """
+    lines = []
+    for record in rrset.get('records', ()):
+        line = '%s\t%d\tIN\t%s\t%s' % (rrset['name'], int(rrset['ttl']),
+                                       rrset['type'], record['content'])
+        if record.get('disabled'):
+            line = DISABLED_PREFIX + line
+        lines.append(line)
+    return lines
+
+
+def write_bind(rrsets, fh, origin):
+    """
+    Write rrsets to fh as a BIND master file with absolute names, return
+    the number of rrsets written. rrset comments are not kept.
+    """
+    fh.write('$ORIGIN %s\n' % origin)
+    count = 0
+    for rrset in rrsets:
+        for line in bind_lines(rrset):
+            fh.write(line + '\n')
+        count += 1
+    return count
+
+
+def write_zone(rrsets, fh, origin, fmt='jsonl'):
+    """
+    Write rrsets to fh in format fmt (jsonl or bind), return the number of
+    rrsets written.
+    """
+    if fmt == 'jsonl':
+        return write_jsonl(rrsets, fh)
+    if fmt == 'bind':
+        return write_bind(rrsets, fh, origin)
+    raise ValueError('Unknown zone file format %s, expected one of %s' %
+                     (fmt, ', '.join(sorted(FORMATS))))
+
+
+# Master file parsing
+
+CLASSES = frozenset(('IN', 'CH', 'HS', 'CS'))
+
+_TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Index of the domain name fields of rdata, relative names are made absolute
+_NAME_FIELDS = {
+    'NS': (0,), 'CNAME': (0,), 'PTR': (0,), 'DNAME': (0,), 'MX': (1,),
+    'SRV': (3,), 'SOA': (0, 1), 'AFSDB': (1,), 'KX': (1,), 'RT': (1,),
+}
+
+
+_SPECIAL = re.compile(r'["\\();]')
+
+
+class ZoneFileError(ValueError):
+    """
+    Invalid master file, the message holds the file and line number.
+    """
+
+
+def parse_ttl(value):
+    """
+    Return the number of seconds of a TTL: 3600, 1h, 1h30m, 2W
+    """
+    if value.isdigit():
+        return int(value)
+    total = 0
+    number = ''
+    for char in value.lower():
+        if char.isdigit():
+            number += char
+        elif char in _TTL_UNITS and number:
+            total += int(number) * _TTL_UNITS[char]
+            number = ''
+        else:
+            raise ValueError('Invalid TTL %s' % value)
+    if number:
+        raise ValueError('Invalid TTL %s' % value)
+    return total
+
+
+def _is_ttl(token):
+    if not token[:1].isdigit():
+        # Record types and classes, without raising
+        return False
+    try:
+        parse_ttl(token)
+    except ValueError:
+        return False
+    return True
+
+
+def _split(line):
+    """
+    Return 2-tuple : tokens of line up to its comment, change of
+    parentheses depth. Quoted strings are single tokens, quotes kept.
+    """
+    if not _SPECIAL.search(line):
+        # Most lines of large zones
+        return line.split(), 0
+    tokens = []
+    depth = 0
+    token = []
+    quoted = False
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if char == '\\' and i + 1 < len(line):
+            token.append(line[i:i + 2])
+            i += 2
+            continue
+        if quoted:
+            token.append(char)
+            if char == '"':
+                quoted = False
+        elif char == '"':
+            token.append(char)
+            quoted = True
+        elif char == ';':
+            break
+        elif char in '()' or char.isspace():
+            if token:
+                tokens.append(''.join(token))
+                token = []
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+        else:
+            token.append(char)
+        i += 1
+    if token:
+        tokens.append(''.join(token))
+    return tokens, depth
+
+
+def _entries(fh, source):
+    """
+    Yield (line number, tokens, starts with blank, disabled) for each entry
+    of a master file, entries split on several lines by parentheses are
+    joined. Lines commented out by write_bind (; disabled: ...) are yielded
+    as disabled entries.
+    """
+    tokens = []
+    depth = 0
+    start = None
+    blank = False
+    disabled = False
+    for lineno, line in enumerate(fh, 1):
+        line = line.rstrip('\r\n')
+        if not depth:
+            disabled = line.startswith(DISABLED_PREFIX)
+            if disabled:
+                line = line[len(DISABLED_PREFIX):]
+            start = lineno
+            blank = line[:1].isspace()
+        line_tokens, delta = _split(line)
+        tokens.extend(line_tokens)
+        depth += delta
+        if depth < 0:
+            raise ZoneFileError('%s:%d: unbalanced parentheses' %
+                                (source, lineno))
+        if depth or not tokens:
+            continue
+        yield start, tokens, blank, disabled
+        tokens = []
+    if depth:
+        raise ZoneFileError('%s:%d: unclosed parenthesis' % (source, start))
+
+
+def absolute_name(name, origin):
+    """
+    Return name made absolute relative to origin, @ is the origin itself.
+    """
+    if name == '@':
+        return origin
+    if name.endswith('.') and not name.endswith('\\.'):
+        return name
+    return name + '.' + origin if origin != '.' else name + '.'
+
+
+def _content(type_, rdata, origin):
+    rdata = list(rdata)
+    for index in _NAME_FIELDS.get(type_, ()):
+        if index < len(rdata):
+            rdata[index] = absolute_name(rdata[index], origin)
+    if type_ in ('TXT', 'SPF'):
+        # PowerDNS expects quoted character strings
+        rdata = [part if part.startswith('"') else '"%s"' % part
+                 for part in rdata]
+    return ' '.join(rdata)
+
+
+def iter_bind_records(fh, origin, default_ttl=3600, source='<zone>'):
+    """
+    Parse a master file, yield its records as dicts : {'name': ...,
+    'type': ..., 'ttl': ..., 'content': ..., 'disabled': bool}, names and
+    name fields of the common types are absolute.
+
+    $ORIGIN, $TTL and $INCLUDE are supported, $GENERATE is not. A record
+    without TTL takes the $TTL value, the TTL of the previous record or
+    default_ttl.
+
+    :param origin: Zone name, initial origin of relative names
+    :type origin: String
+    :param source: File name used in error messages and to resolve
+    $INCLUDE paths
+    :type source: String
+    """
+    origin = origin if origin.endswith('.') else origin + '.'
+    ttl = None
+    zone_ttl = None
+    owner = None
+    for lineno, tokens, blank, disabled in _entries(fh, source):
+        where = '%s:%d' % (source, lineno)
+        directive = tokens[0].upper()
+        if not blank and directive == '$ORIGIN':
+            origin = absolute_name(tokens[1], origin)
+            continue
+        if not blank and directive == '$TTL':
+            zone_ttl = parse_ttl(tokens[1])
+            continue
+        if not blank and directive == '$INCLUDE':
+            path = os.path.join(os.path.dirname(source), tokens[1])
+            include_origin = (absolute_name(tokens[2], origin)
+                              if len(tokens) > 2 else origin)
+            with open(path) as include:
+                for record in iter_bind_records(include, include_origin,
+                                                zone_ttl or ttl or default_ttl,
+                                                path):
+                    yield record
+            continue
+        if not blank and directive.startswith('$'):
+            raise ZoneFileError('%s: unsupported directive %s' %
+                                (where, tokens[0]))
+
+        if not blank:
+            owner = absolute_name(tokens[0], origin)
+            tokens = tokens[1:]
+        elif owner is None:
+            raise ZoneFileError('%s: record without owner name' % where)
+
+        record_ttl = None
+        # TTL and class, both optional, in any order
+        for _ in range(2):
+            if not tokens:
+                break
+            field = tokens[0].upper()
+            if field in CLASSES:
+                if field != 'IN':
+                    raise ZoneFileError('%s: unsupported class %s' %
+                                        (where, tokens[0]))
+                tokens = tokens[1:]
+            elif record_ttl is None and _is_ttl(tokens[0]):
+                record_ttl = parse_ttl(tokens[0])
+                tokens = tokens[1:]
+        if len(tokens) < 2:
+            raise ZoneFileError('%s: missing record type or data' % where)
+
+        type_ = tokens[0].upper()
+        if record_ttl is None:
+            record_ttl = zone_ttl if zone_ttl is not None else ttl
+        ttl = record_ttl if record_ttl is not None else default_ttl
+        yield {'name': owner, 'type': type_, 'ttl': ttl,
+               'content': _content(type_, tokens[1:], origin),
+               'disabled': disabled}
+
+
+def iter_rrset_chunks(records, max_rrsets):
+    """
+    Group records by (name, type) into rrsets, yield them in chunks of at
+    most max_rrsets rrsets, as OrderedDicts of (name, type) -> rrset. Only
+    one chunk is kept in memory: the records of an rrset found further than
+    a chunk apart in the file are yielded in several chunks.
+    """
+    chunk = collections.OrderedDict()
+    for record in records:
+        key = (record['name'].lower(), record['type'])
+        rrset = chunk.get(key)
+        if rrset is None:
+            if len(chunk) >= max_rrsets:
+                yield chunk
+                chunk = collections.OrderedDict()
+            rrset = chunk[key] = {'name': record['name'],
+                                  'type': record['type'],
+                                  'ttl': record['ttl'], 'records': []}
+        # Records of an rrset share its TTL, the lowest one is kept
+        rrset['ttl'] = min(rrset['ttl'], record['ttl'])
+        rrset['records'].append({'content': record['content'],
+                                 'disabled': record['disabled']})
+    if chunk:
+        yield chunk
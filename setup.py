@@ -1,4 +1,21 @@
+import sys
+
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+# Modules written with python 3 only syntax, not installed on python 2
+PY3_MODULES = ('aio',)
+
+
+class BuildPy(build_py):
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] < 3:
+            modules = [module for module in modules
+                       if module[1] not in PY3_MODULES]
+        return modules
 
 
 config = {
@@ -9,12 +26,16 @@ config = {
     'version': '0.17',
     'install_requires': ['docopt',
                          'requests',
-                         'six',
-                         'future'],
+                         'futures; python_version < "3.0"',
+                         'ipaddress; python_version < "3.0"'],
     'extras_require': {
         'test': ['nose'],
+        'async': ['aiohttp; python_version >= "3.5"'],
+        'stream': ['ijson'],
+        'fast': ['orjson'],
     },
     'packages': ['pypdns'],
+    'cmdclass': {'build_py': BuildPy},
     'name': 'pypdns',
     'entry_points': {
         'console_scripts': [
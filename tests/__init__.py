@@ -0,0 +1,40 @@
+"""
+Tests run against the PowerDNS API stub of the benchmarks (see
+benchmarks.stub), with nose: nosetests tests
+"""
+import os
+import logging
+import unittest
+
+from benchmarks.stub import PdnsStub, generate_zone
+
+
+# Expected failures are logged by pypdns
+logging.getLogger('pypdns').addHandler(logging.NullHandler())
+
+
+class StubTestCase(unittest.TestCase):
+    """
+    Starts a stub holding zones (name -> number of rrsets) for each test,
+    self.config is a PyPDNS configuration using it.
+    """
+
+    zones = {'example.com.': 20}
+
+    def setUp(self):
+        # Changes comments hold the user name
+        os.environ.setdefault('USER', 'tests')
+        self.stub = PdnsStub()
+        for name, size in self.zones.items():
+            self.stub.add_zone(name, generate_zone(name, size))
+        self.config = {'endpoint': self.stub.start(), 'apikey': 'tests',
+                       'config_path': os.devnull, 'backoff': 0}
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def pdns(self, **config):
+        from pypdns import PyPDNS
+        pdns = PyPDNS(dict(self.config, **config))
+        self.addCleanup(pdns.close)
+        return pdns
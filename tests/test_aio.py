@@ -0,0 +1,83 @@
+import socket
+import unittest
+
+try:
+    import asyncio
+    from pypdns.aio import AsyncPyPDNS
+except (ImportError, SyntaxError):
+    # python 2, or aiohttp is not installed
+    AsyncPyPDNS = None
+
+from pypdns.api import PdnsConnectionError
+
+from . import StubTestCase
+
+
+@unittest.skipIf(AsyncPyPDNS is None, 'requires aiohttp')
+class AsyncPyPDNSTest(StubTestCase):
+
+    zones = {'example.com.': 20, 'example.org.': 20, 'other.net.': 5}
+
+    def setUp(self):
+        super(AsyncPyPDNSTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def pdns(self, **config):
+        pdns = AsyncPyPDNS(dict(self.config, **config))
+        self.addCleanup(self.run_async, pdns.close())
+        return pdns
+
+    def test_zones_list(self):
+        pdns = self.pdns()
+        zones = self.run_async(pdns.zones_list(r'example\.'))
+        self.assertEqual(sorted(zone['name'] for zone in zones),
+                         ['example.com.', 'example.org.'])
+        zones = self.run_async(pdns.zones_list(r'other\.net\.$'))
+        self.assertEqual([zone['name'] for zone in zones], ['other.net.'])
+        self.assertEqual(len(self.run_async(pdns.zones_list())), 3)
+
+    def test_zones_get(self):
+        rrsets = self.run_async(self.pdns().zones_get('example.com.',
+                                                      _type='SOA'))
+        self.assertEqual([rrset['type'] for rrset in rrsets], ['SOA'])
+
+    def test_search(self):
+        results = self.run_async(self.pdns().search(
+            '*', zone='example.com.', max_results=3))
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['zone'] == 'example.com.'
+                            for result in results))
+
+    def test_record_add(self):
+        pdns = self.pdns()
+        existing = next(rrset['name']
+                        for rrset in self.stub.zones['example.com.']['rrsets']
+                        if rrset['type'] == 'A')
+        label = existing[:-len('.example.com.')].upper()
+        result, code = self.run_async(pdns.record_add(
+            'example.com.', label, ['192.0.2.1'], ''))
+        self.assertEqual(code, -1)
+        result, code = self.run_async(pdns.record_add(
+            'example.com.', 'new', ['192.0.2.1'], ''))
+        self.assertEqual(code, 204)
+        found, code = self.run_async(pdns.existing_records(
+            'example.com.', [('NEW.example.com', 'a'), (existing, 'AAAA')]))
+        self.assertEqual((code, list(found)), (200, [('new.example.com.',
+                                                      'A')]))
+
+    def test_unreachable(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        pdns = self.pdns(endpoint='http://127.0.0.1:%d/api/v1' % port)
+        with self.assertRaises(PdnsConnectionError):
+            self.run_async(pdns.zones_list())
+        # Lookups failing to reach the API fail closed
+        result, code = self.run_async(pdns.record_add(
+            'example.com.', 'new', ['192.0.2.1'], ''))
+        self.assertEqual(code, -1)
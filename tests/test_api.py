@@ -0,0 +1,112 @@
+import time
+
+from pypdns import api
+from pypdns.api import PdnsConnectionError
+
+from . import StubTestCase
+
+
+class StreamTest(StubTestCase):
+
+    zones = {'example.com.': 500}
+
+    def test_iter_zone(self):
+        rrsets = list(self.pdns().iter_zone('example.com.'))
+        self.assertEqual(len(rrsets), 500)
+
+    def test_truncated_zone(self):
+        self.stub.fail('GET', '/zones/example.com.', truncate=2000)
+        rrsets = self.pdns().iter_zone('example.com.')
+        with self.assertRaises((PdnsConnectionError, ValueError)):
+            list(rrsets)
+
+    def test_truncated_zone_without_ijson(self):
+        ijson, api._ijson_module = api._ijson_module, None
+        self.addCleanup(setattr, api, '_ijson_module', ijson)
+        self.stub.fail('GET', '/zones/example.com.', truncate=2000)
+        with self.assertRaises((PdnsConnectionError, ValueError)):
+            list(self.pdns(retries=0).iter_zone('example.com.'))
+
+    def test_truncated_search(self):
+        self.stub.fail('GET', '/search-data', truncate=100)
+        with self.assertRaises((PdnsConnectionError, ValueError)):
+            list(self.pdns().iter_search('*'))
+
+
+class RetryTest(StubTestCase):
+
+    def test_server_error(self):
+        self.stub.fail('GET', 'localhost/zones', status=503, times=2)
+        self.stub.reset_stats()
+        zones, code = self.pdns(retries=2).zones_api.get_zones()
+        self.assertEqual(code, 200)
+        self.assertEqual(self.stub.stats()['requests'], 3)
+
+    def test_retries_exhausted(self):
+        self.stub.fail('GET', 'localhost/zones', status=503, times=2)
+        zones, code = self.pdns(retries=1).zones_api.get_zones()
+        self.assertEqual(code, 503)
+
+    def test_patch_not_retried(self):
+        self.stub.fail('PATCH', '/zones/example.com.', status=503)
+        self.stub.reset_stats()
+        results = self.pdns().apply_changes(
+            [{'name': 'www.example.com.', 'type': 'A',
+              'content': '192.0.2.1'}])
+        self.assertEqual([result['code'] for result in results], [503])
+        # The zones listing and a single PATCH
+        self.assertEqual(self.stub.stats()['requests'], 2)
+
+    def test_throttled_patch(self):
+        self.stub.fail('PATCH', '/zones/example.com.', status=429)
+        results = self.pdns().apply_changes(
+            [{'name': 'www.example.com.', 'type': 'A',
+              'content': '192.0.2.1'}])
+        self.assertEqual([result['code'] for result in results], [204])
+
+    def test_unreachable(self):
+        self.stub.fail('GET', 'localhost/zones', truncate=0, times=2)
+        with self.assertRaises(PdnsConnectionError) as context:
+            self.pdns(retries=1).zones_api.get_zones()
+        self.assertEqual(context.exception.attempts, 2)
+
+
+class RateLimitTest(StubTestCase):
+
+    def test_rate_limit(self):
+        pdns = self.pdns(**{'rate-limit': 20, 'rate-burst': 1})
+        start = time.time()
+        for _ in range(5):
+            pdns.zones_api.get_zones()
+        # The first request is sent at once, the others 50ms apart
+        self.assertGreaterEqual(time.time() - start, 0.19)
+
+    def test_burst(self):
+        limiter = api.RateLimiter(1, burst=3)
+        start = time.time()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_disabled(self):
+        self.assertIsNone(api.build_rate_limiter({'rate-limit': '0'}))
+
+
+class SearchTest(StubTestCase):
+
+    def test_iter_search(self):
+        pdns = self.pdns()
+        results = list(pdns.iter_search('h1*', rtype='A'))
+        self.assertTrue(results)
+        self.assertTrue(all(result['type'] == 'A' for result in results))
+        self.assertEqual(results, pdns.search('h1*', rtype='A'))
+
+    def test_max_results(self):
+        results = list(self.pdns().iter_search('*', max_results=3))
+        self.assertEqual(len(results), 3)
+        # Filtered client side, the search is sent again until enough
+        # results pass the filters
+        results = self.pdns().search('*', zone='example.com.', rtype='A',
+                                     max_results=3)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['type'] == 'A' for result in results))
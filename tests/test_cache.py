@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.stub import generate_zone
+from pypdns.cache import ZoneSnapshotCache, zone_version
+
+from . import StubTestCase
+
+
+class ZoneSnapshotCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_versions(self):
+        cache = ZoneSnapshotCache()
+        cache.set('Example.com.', '1-1', {'rrsets': []})
+        self.assertEqual(cache.get('example.com.', '1-1'), {'rrsets': []})
+        self.assertIsNone(cache.get('example.com.', '2-2'))
+        cache.invalidate('EXAMPLE.com.')
+        self.assertIsNone(cache.get('example.com.', '1-1'))
+
+    def test_directory(self):
+        ZoneSnapshotCache(self.directory).set('example.com.', '1-1',
+                                              {'rrsets': [1]})
+        cache = ZoneSnapshotCache(self.directory)
+        self.assertEqual(cache.get('example.com.', '1-1'), {'rrsets': [1]})
+
+    def test_invalidate_all(self):
+        other = os.path.join(self.directory, 'notes.json')
+        open(other, 'w').close()
+        cache = ZoneSnapshotCache(self.directory)
+        cache.set('a.example.', '1-1', {})
+        cache.set('b.example.', '1-1', {})
+        cache.invalidate()
+        # Only the snapshots are removed
+        self.assertEqual(os.listdir(self.directory), ['notes.json'])
+        self.assertIsNone(cache.get('a.example.', '1-1'))
+
+    def test_zone_version(self):
+        self.assertEqual(zone_version({'serial': 3, 'edited_serial': 4}),
+                         '3-4')
+        self.assertIsNone(zone_version({'name': 'example.com.'}))
+
+
+class SnapshotTest(StubTestCase):
+
+    zones = {}
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        # Serials of a zone without SOA-EDIT-API do not move on changes
+        self.stub.add_zone('example.com.', generate_zone('example.com.', 20),
+                           soa_edit_api=False)
+
+    def test_own_changes(self):
+        pdns = self.pdns(**{'snapshot-cache': True})
+        zone = pdns.zone('example.com.')
+        self.assertIsNone(zone.get('new.example.com.', 'A'))
+        change = {'name': 'new.example.com.', 'type': 'A',
+                  'content': '192.0.2.1'}
+        results = pdns.apply_changes([change], override=False)
+        self.assertEqual([result['code'] for result in results], [204])
+
+        self.assertIsNotNone(pdns.zone('example.com.').get('new.example.com.',
+                                                            'A'))
+        self.assertEqual(len(pdns.zones_get('example.com.')), 21)
+        # The existence check sees the record just created
+        results = pdns.apply_changes([change, dict(change, name='new2.' +
+                                                   'example.com.')],
+                                     override=False)
+        self.assertEqual([result['code'] for result in results], [-1, 204])
+
+    def test_record_add(self):
+        pdns = self.pdns(**{'snapshot-cache': True})
+        pdns.zone('example.com.')
+        ret, code = pdns.record_add('example.com.', 'www', '192.0.2.1', '',
+                                    override=True)
+        self.assertEqual(code, 204)
+        zone = pdns.zone('example.com.')
+        self.assertIsNotNone(zone.get('www.example.com.', 'A'))
+
+    def test_served_from_snapshot(self):
+        pdns = self.pdns(**{'snapshot-cache': True})
+        pdns.zone('example.com.')
+        self.stub.reset_stats()
+        self.assertIs(pdns.zone('example.com.'), pdns.zone('example.com.'))
+        # The listings only
+        self.assertEqual(self.stub.stats()['requests'], 2)
@@ -0,0 +1,223 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+
+from pypdns import cli
+
+from . import StubTestCase
+
+
+def change(name, content='192.0.2.1', **kwargs):
+    return dict({'name': name, 'type': 'A', 'content': content}, **kwargs)
+
+
+class ApplyChangesTest(StubTestCase):
+
+    zones = {'example.com.': 20, 'example.org.': 20}
+
+    def keys(self, zone):
+        return set((rrset['name'], rrset['type'])
+                   for rrset in self.stub.zones[zone]['rrsets'])
+
+    def test_batches(self):
+        changes = [change('a%d.example.com.' % i) for i in range(5)]
+        changes += [change('a%d.example.org.' % i) for i in range(2)]
+        self.stub.reset_stats()
+        results = self.pdns().apply_changes(changes, max_rrsets=2)
+        self.assertEqual([(result['zone'], len(result['changes']))
+                          for result in results],
+                         [('example.com.', 2), ('example.com.', 2),
+                          ('example.com.', 1), ('example.org.', 2)])
+        self.assertTrue(all(result['code'] == 204 for result in results))
+        # The zones listing and the PATCH requests only
+        self.assertEqual(self.stub.stats()['requests'], 1 + len(results))
+        self.assertIn(('a4.example.com.', 'A'), self.keys('example.com.'))
+        self.assertIn(('a1.example.org.', 'A'), self.keys('example.org.'))
+
+    def test_same_record(self):
+        changes = [change('www.example.com.'),
+                   change('WWW.Example.com.', changetype='DELETE')]
+        results = self.pdns().apply_changes(changes)
+        # Sent in order, in two requests
+        self.assertEqual([result['changes'] for result in results],
+                         [[changes[0]], [changes[1]]])
+        self.assertNotIn(('www.example.com.', 'A'),
+                         self.keys('example.com.'))
+
+    def test_concurrent(self):
+        changes = [change('a%d.example.%s.' % (i, tld))
+                   for i in range(10) for tld in ('com', 'org')]
+        results = self.pdns().apply_changes(changes, max_rrsets=3,
+                                            concurrent=True)
+        self.assertEqual(sum(len(result['changes']) for result in results),
+                         20)
+        self.assertTrue(all(result['success'] for result in results))
+
+    def test_invalid_changes(self):
+        changes = [{'name': 'www.example.com.'},
+                   change('www.example.com.', changetype='UPDATE'),
+                   change('www.example.com.', ttl='never'),
+                   change('www.example.invalid.'),
+                   'www.example.com.',
+                   change('ok.example.com.')]
+        results = self.pdns().apply_changes(changes)
+        self.assertEqual([(result['code'], len(result['changes']))
+                          for result in results],
+                         [(-1, 1)] * 5 + [(204, 1)])
+        self.assertIn(('ok.example.com.', 'A'), self.keys('example.com.'))
+
+    def test_max_pending_changes(self):
+        def changes():
+            for i in range(10):
+                for tld in ('com', 'org'):
+                    consumed.append(i)
+                    yield change('a%d.example.%s.' % (i, tld))
+        consumed = []
+        results = self.pdns(**{'max-pending-changes': 4}).iter_apply_changes(
+            changes(), max_rrsets=3)
+        # The largest batch is sent once 4 changes are pending, before it
+        # is full
+        self.assertEqual(len(next(results)['changes']), 2)
+        self.assertEqual(len(consumed), 4)
+        results = list(results)
+        self.assertEqual(sum(len(result['changes']) for result in results),
+                         18)
+        self.assertTrue(all(result['success'] for result in results))
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            self.pdns().apply_changes([change('www.example.com.')],
+                                      max_rrsets=-1)
+
+
+class ZoneLookupTest(StubTestCase):
+
+    def test_listing_failure(self):
+        self.stub.fail('GET', 'localhost/zones', status=401)
+        self.stub.reset_stats()
+        changes = [change('a%d.example.com.' % i) for i in range(50)]
+        changes.append(change('b.example.com.', zone='example.com.'))
+        results = self.pdns().apply_changes(changes)
+        # Listed once, changes with a zone are still applied
+        self.assertEqual(self.stub.stats()['requests'], 2)
+        self.assertEqual([result['code'] for result in results],
+                         [401] * 50 + [204])
+        self.assertIn('Cannot list zones', results[0]['result'])
+
+    def test_add(self):
+        self.stub.fail('GET', 'localhost/zones', status=401)
+        result, code = self.pdns().add('www.example.com.', '192.0.2.1', '',
+                                       'A')
+        self.assertEqual(code, 401)
+        self.assertEqual(self.pdns().add('www.example.net.', '192.0.2.1', '',
+                                         'A'), False)
+
+
+class OverrideTest(StubTestCase):
+
+    def existing(self):
+        return next(rrset['name']
+                    for rrset in self.stub.zones['example.com.']['rrsets']
+                    if rrset['type'] == 'A')
+
+    def test_existing_records(self):
+        name = self.existing()
+        changes = [change(name), change(name.upper()),
+                   change('new.example.com.')]
+        results = self.pdns().apply_changes(changes, override=False)
+        self.assertEqual([(c['name'], result['code']) for result in results
+                          for c in result['changes']],
+                         [(name, -1), (name.upper(), -1),
+                          ('new.example.com.', 204)])
+
+    def test_targeted_lookups(self):
+        changes = [change('new%d.example.com.' % i) for i in range(3)]
+        self.stub.reset_stats()
+        results = self.pdns().apply_changes(changes, override=False)
+        self.assertEqual([result['code'] for result in results], [204])
+        # The zones listing, a lookup per rrset and the PATCH, the zone is
+        # not downloaded
+        stats = self.stub.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertLess(stats['bytes'],
+                        len(self.stub.zone_body('example.com.')))
+
+    def test_single_lookup_failure(self):
+        self.stub.fail('GET', 'rrset_name', status=503)
+        self.stub.reset_stats()
+        results = self.pdns(retries=0).apply_changes(
+            [change('new.example.com.')], override=False)
+        self.assertEqual([result['code'] for result in results], [503])
+        # The lookup only, nothing is sent
+        self.assertEqual(self.stub.stats()['requests'], 2)
+
+    def test_zone_lookup_failure(self):
+        self.stub.fail('GET', '/zones/example.com.', status=404)
+        changes = [change('new.example.com.'), change('new2.example.com.')]
+        results = self.pdns().apply_changes(changes, override=False)
+        self.assertEqual([result['code'] for result in results], [404])
+        self.assertEqual(len(self.stub.zones['example.com.']['rrsets']), 20)
+
+    def test_unreachable(self):
+        self.stub.fail('GET', 'rrset_name', truncate=0)
+        results = self.pdns(retries=0).apply_changes(
+            [change('new.example.com.')], override=False)
+        self.assertEqual([result['code'] for result in results], [-1])
+        self.assertFalse(results[0]['success'])
+
+
+class BulkTest(StubTestCase):
+
+    def setUp(self):
+        super(BulkTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def bulk(self, name, content, **kwargs):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as fh:
+            fh.write(content.encode('utf-8'))
+        out = io.StringIO()
+        cli.bulk(self.pdns(), path, out=out, **kwargs)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_jsonl(self):
+        lines = self.bulk('changes.jsonl', '\n'.join([
+            json.dumps(change('www.example.com.')),
+            '{"name": ',
+            '[]',
+            json.dumps(change('ftp.example.com.'))]) + '\n')
+        self.assertEqual([(line['name'], line.get('line'), line['code'])
+                          for line in lines],
+                         [(None, 2, -1), (None, 3, -1),
+                          ('www.example.com.', 1, 204),
+                          ('ftp.example.com.', 4, 204)])
+
+    def test_csv(self):
+        lines = self.bulk('changes.csv',
+                          'name,type,content,ttl,reverse\n'
+                          'www.example.com.,A,192.0.2.1,60,no\n'
+                          'mx.example.com.,A,192.0.2.2,,\n')
+        self.assertEqual([(line['name'], line['code']) for line in lines],
+                         [('www.example.com.', 204),
+                          ('mx.example.com.', 204)])
+        rrset = next(rrset
+                     for rrset in self.stub.zones['example.com.']['rrsets']
+                     if rrset['name'] == 'www.example.com.')
+        self.assertEqual(rrset['ttl'], 60)
+
+    def test_csv_line_breaks(self):
+        lines = self.bulk('changes.csv',
+                          'name,type,content,comment\r\n'
+                          'www.example.com.,A,192.0.2.1,"first\r\nsecond"\r\n'
+                          'mx.example.com.,A,192.0.2.2,\r\n')
+        self.assertEqual([(line['name'], line['line'], line['code'])
+                          for line in lines],
+                         [('www.example.com.', 2, 204),
+                          ('mx.example.com.', 4, 204)])
+        rrset = next(rrset
+                     for rrset in self.stub.zones['example.com.']['rrsets']
+                     if rrset['name'] == 'www.example.com.')
+        self.assertEqual(rrset['comments'][0]['content'], 'first\r\nsecond')
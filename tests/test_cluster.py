@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+
+from docopt import docopt
+
+from benchmarks.stub import PdnsStub, generate_zone
+from pypdns import cli
+from pypdns.cluster import PdnsCluster
+
+from . import StubTestCase
+
+
+CHANGES = [{'name': 'www.example.com.', 'type': 'A', 'content': '192.0.2.1'},
+           {'name': 'ftp.example.com.', 'type': 'A', 'content': '192.0.2.2'}]
+
+
+class ClusterTest(StubTestCase):
+
+    def setUp(self):
+        super(ClusterTest, self).setUp()
+        self.other = PdnsStub()
+        self.other.add_zone('example.com.', generate_zone('example.com.', 20))
+        endpoints = {'eu': self.config['endpoint'], 'us': self.other.start()}
+        self.addCleanup(self.other.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config_path = os.path.join(self.directory, 'pypdns.ini')
+        with open(self.config_path, 'w') as fh:
+            fh.write('[pypdns]\napikey = tests\nbackoff = 0\n')
+            for name, endpoint in sorted(endpoints.items()):
+                fh.write('[server:%s]\nendpoint = %s\n' % (name, endpoint))
+        self.changes_path = os.path.join(self.directory, 'changes.jsonl')
+        with open(self.changes_path, 'w') as fh:
+            for change in CHANGES:
+                fh.write(json.dumps(change) + '\n')
+            fh.write('not json\n')
+
+    def bulk(self, path):
+        out = io.StringIO()
+        cli.cluster(docopt(cli.__doc__, ['bulk', path, '--servers', 'all',
+                                         '-c', self.config_path]), out)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def assertApplied(self, results):
+        # The invalid line is reported once per server
+        self.assertEqual(sorted((result['server'], result['line'],
+                                 result['code']) for result in results),
+                         [('eu', 1, 204), ('eu', 2, 204), ('eu', 3, -1),
+                          ('us', 1, 204), ('us', 2, 204), ('us', 3, -1)])
+        for stub in (self.stub, self.other):
+            names = set(rrset['name']
+                        for rrset in stub.zones['example.com.']['rrsets'])
+            self.assertTrue(set(['www.example.com.', 'ftp.example.com.'])
+                            <= names)
+
+    def test_bulk_file(self):
+        self.assertApplied(self.bulk(self.changes_path))
+
+    def test_bulk_stdin(self):
+        stdin, tempdir = sys.stdin, tempfile.tempdir
+        sys.stdin = open(self.changes_path)
+        # The spool file is created there
+        tempfile.tempdir = self.directory
+        try:
+            results = self.bulk('-')
+        finally:
+            sys.stdin.close()
+            sys.stdin, tempfile.tempdir = stdin, tempdir
+        self.assertApplied(results)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['changes.jsonl', 'pypdns.ini'])
+
+    def test_changes_callable(self):
+        calls = []
+
+        def changes():
+            calls.append(1)
+            return iter(CHANGES)
+        cluster = PdnsCluster({'config_path': self.config_path})
+        self.addCleanup(cluster.close)
+        results = cluster.apply_changes(changes)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sorted(result['server'] for result in results),
+                         ['eu', 'us'])
+        self.assertTrue(all(result['success'] for result in results))
+
+    def test_streamed(self):
+        consumed = []
+
+        def changes():
+            for i in range(200):
+                consumed.append(i)
+                yield {'name': 'h%d.example.com.' % i, 'type': 'A',
+                       'content': '192.0.2.1'}
+        cluster = PdnsCluster({'config_path': self.config_path})
+        self.addCleanup(cluster.close)
+        results = cluster.iter_apply_changes(changes, max_rrsets=2)
+        self.assertTrue(next(results)['success'])
+        time.sleep(0.2)
+        # Servers wait for their results to be read
+        self.assertLess(len(consumed), 100)
+        results.close()
+        results = cluster.iter_apply_changes(changes, max_rrsets=50)
+        self.assertEqual(sorted(result['server'] for result in results),
+                         ['eu'] * 4 + ['us'] * 4)
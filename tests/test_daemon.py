@@ -0,0 +1,56 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+from docopt import docopt
+
+from pypdns import cli
+from pypdns.daemon import PdnsDaemon, forward, trusted_socket
+
+from . import StubTestCase
+
+
+class DaemonTest(StubTestCase):
+
+    def setUp(self):
+        super(DaemonTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'pypdns.sock')
+        self.config_path = os.path.join(self.directory, 'pypdns.ini')
+        with open(self.config_path, 'w') as fh:
+            fh.write('[pypdns]\nendpoint = %s\napikey = tests\n'
+                     % self.config['endpoint'])
+
+    def options(self, *argv):
+        return docopt(cli.__doc__, list(argv) + ['-c', self.config_path])
+
+    def serve(self):
+        daemon = PdnsDaemon(self.pdns(), self.options('serve'), self.path)
+        daemon.bind()
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(daemon.shutdown)
+
+    def test_forward(self):
+        self.serve()
+        out = io.StringIO()
+        code = forward(self.options('zones', 'list', '--output', 'jsonl'),
+                       self.path, out)
+        self.assertEqual(code, 0)
+        self.assertIn('"example.com."', out.getvalue())
+
+    def test_writable_socket(self):
+        self.serve()
+        os.chmod(self.path, 0o666)
+        self.assertFalse(trusted_socket(self.path))
+        self.assertIsNone(forward(self.options('zones', 'list'), self.path))
+
+    def test_not_a_socket(self):
+        open(self.path, 'w').close()
+        os.chmod(self.path, 0o600)
+        self.assertFalse(trusted_socket(self.path))
+        self.assertIsNone(forward(self.options('zones', 'list'), self.path))
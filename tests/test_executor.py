@@ -0,0 +1,67 @@
+import time
+import random
+import threading
+import unittest
+
+from pypdns.executor import ApiExecutor
+
+
+class ApiExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ApiExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_submit_ordered(self):
+        calls = []
+
+        def call(key, i):
+            time.sleep(random.uniform(0, 0.005))
+            calls.append((key, i))
+        futures = [self.executor.submit_ordered(key, call, key, i)
+                   for i in range(20) for key in ('a', 'b')]
+        for future in futures:
+            future.result()
+        for key in ('a', 'b'):
+            self.assertEqual([i for k, i in calls if k == key],
+                             list(range(20)))
+
+    def test_keys_concurrent(self):
+        event = threading.Event()
+        blocked = self.executor.submit_ordered('a', event.wait, 5)
+        queued = self.executor.submit_ordered('a', lambda: 'a')
+        # Calls on another key are not held by the blocked one
+        self.assertEqual(self.executor.submit_ordered('b', lambda: 'b')
+                         .result(timeout=5), 'b')
+        self.assertFalse(queued.done())
+        event.set()
+        self.assertTrue(blocked.result(timeout=5))
+        self.assertEqual(queued.result(timeout=5), 'a')
+
+    def test_ordered_exception(self):
+        failed = self.executor.submit_ordered('a', int, 'x')
+        following = self.executor.submit_ordered('a', int, '1')
+        self.assertRaises(ValueError, failed.result)
+        self.assertEqual(following.result(), 1)
+
+    def test_imap(self):
+        def call(i):
+            time.sleep(random.uniform(0, 0.005))
+            return i * 2
+        self.assertEqual(list(self.executor.imap(call, range(20))),
+                         [i * 2 for i in range(20)])
+        self.assertEqual(list(self.executor.imap(call, range(20),
+                                                 key=lambda i: i % 3)),
+                         [i * 2 for i in range(20)])
+
+    def test_imap_lazy(self):
+        consumed = []
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+        results = self.executor.imap(lambda i: i, items(), max_pending=3)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(len(consumed), 3)
+        self.assertEqual(list(results), list(range(1, 100)))
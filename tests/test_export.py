@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+import tempfile
+
+from pypdns.export import CHECKPOINT
+
+from . import StubTestCase
+
+
+class ExportTest(StubTestCase):
+
+    zones = {'a.example.': 50, 'b.example.': 50, 'c.example.': 50}
+
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def checkpoint(self):
+        with open(os.path.join(self.directory, CHECKPOINT)) as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_export(self):
+        results = self.pdns().export_zones(self.directory)
+        self.assertEqual([result['zone'] for result in results],
+                         sorted(self.zones))
+        self.assertTrue(all(result['success'] for result in results))
+        with open(os.path.join(self.directory, 'a.example.jsonl')) as fh:
+            self.assertEqual(len(fh.readlines()), 50)
+        self.assertEqual(len(self.checkpoint()), 3)
+
+    def test_bind_format(self):
+        results = self.pdns().export_zones(self.directory, name='b',
+                                           fmt='bind')
+        self.assertEqual([result['zone'] for result in results],
+                         ['b.example.'])
+        with open(results[0]['file']) as fh:
+            self.assertEqual(fh.readline(), '$ORIGIN b.example.\n')
+
+    def test_resume(self):
+        pdns = self.pdns()
+        pdns.export_zones(self.directory)
+        self.stub.patch('b.example.', [])
+        self.stub.reset_stats()
+        results = pdns.export_zones(self.directory)
+        self.assertEqual([result['skipped'] for result in results],
+                         [True, False, True])
+        # The listing and the changed zone only
+        self.assertEqual(self.stub.stats()['requests'], 2)
+
+        results = pdns.export_zones(self.directory, resume=False)
+        self.assertFalse(any(result['skipped'] for result in results))
+
+    def test_interrupted_zone(self):
+        self.stub.fail('GET', '/zones/b.example.', truncate=1000)
+        pdns = self.pdns()
+        results = pdns.export_zones(self.directory)
+        self.assertEqual([result['success'] for result in results],
+                         [True, False, True])
+        self.assertEqual(results[1]['code'], -1)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, 'b.example.jsonl')))
+        self.assertEqual([entry['zone'] for entry in self.checkpoint()
+                          if entry.get('error')], ['b.example.'])
+
+        # Only the failed zone is exported again
+        results = pdns.export_zones(self.directory)
+        self.assertEqual([result['skipped'] for result in results],
+                         [True, False, True])
+        self.assertTrue(results[1]['success'])
+
+    def test_sequential(self):
+        self.stub.fail('GET', '/zones/a.example.', truncate=10)
+        results = self.pdns().export_zones(self.directory, concurrent=False)
+        self.assertEqual([result['success'] for result in results],
+                         [False, True, True])
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+
+from . import StubTestCase
+
+
+ZONE_FILE = """$ORIGIN example.net.
+$TTL 300
+@       IN SOA ns1 hostmaster 2024010101 3600 600 86400 300
+@       IN NS  ns1
+ns1     IN A   192.0.2.53
+www     IN A   192.0.2.1
+mail    IN A   192.0.2.2
+ftp 60  IN A   192.0.2.3
+www     IN A   192.0.2.4
+"""
+
+
+class ImportTest(StubTestCase):
+
+    def setUp(self):
+        super(ImportTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'example.net.zone')
+        with open(self.path, 'w') as fh:
+            fh.write(ZONE_FILE)
+
+    def rrsets(self, zone):
+        return dict(((rrset['name'], rrset['type']), rrset)
+                    for rrset in self.stub.zones[zone]['rrsets'])
+
+    def test_new_zone(self):
+        results = self.pdns().import_zone('example.net', self.path,
+                                          max_rrsets=2)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual([result['created'] for result in results],
+                         [True, False, False, False])
+        rrsets = self.rrsets('example.net.')
+        self.assertEqual(len(rrsets), 6)
+        self.assertEqual(rrsets[('ftp.example.net.', 'A')]['ttl'], 60)
+        # Records of www found two chunks apart are merged
+        self.assertEqual(sorted(record['content'] for record in
+                                rrsets[('www.example.net.', 'A')]['records']),
+                         ['192.0.2.1', '192.0.2.4'])
+
+    def test_existing_zone(self):
+        self.stub.add_zone('example.net.', [])
+        self.stub.patch('example.net.', [
+            {'name': 'example.net.', 'type': 'SOA', 'ttl': 3600,
+             'changetype': 'REPLACE',
+             'records': [{'content': 'a.example. b.example. 7 1 1 1 1'}]}])
+        results = self.pdns().import_zone('example.net.', self.path,
+                                          concurrent=False)
+        self.assertEqual([(result['created'], result['code'])
+                          for result in results], [(False, 204)])
+        rrsets = self.rrsets('example.net.')
+        # The SOA of the zone is kept
+        self.assertEqual(rrsets[('example.net.', 'SOA')]['records'][0]
+                         ['content'], 'a.example. b.example. 7 1 1 1 1')
+        self.assertIn(('mail.example.net.', 'A'), rrsets)
+
+    def test_listing_failure(self):
+        self.stub.fail('GET', 'localhost/zones', status=500)
+        results = self.pdns(retries=0).import_zone('example.net.', self.path)
+        self.assertEqual([(result['success'], result['code'])
+                          for result in results], [(False, 500)])
+        self.assertNotIn('example.net.', self.stub.zones)
+
+    def test_invalid_line(self):
+        with open(self.path, 'a') as fh:
+            fh.write('$GENERATE 1-10 host$ A 192.0.2.$\nlast IN A 192.0.2.9\n')
+        for concurrent in (True, False):
+            results = list(self.pdns().iter_import_zone(
+                'example.net.', self.path, max_rrsets=2,
+                concurrent=concurrent))
+            # The chunks read before the invalid line are imported
+            self.assertTrue(all(result['success']
+                                for result in results[:-1]))
+            self.assertEqual(len(results), 4)
+            self.assertEqual((results[-1]['success'], results[-1]['code']),
+                             (False, -1))
+            self.assertIn('%s:10' % self.path, results[-1]['result'])
+        self.assertNotIn(('last.example.net.', 'A'),
+                         self.rrsets('example.net.'))
@@ -0,0 +1,73 @@
+import os
+import json
+import unittest
+import collections
+
+from pypdns import jsonlib
+
+
+def installed(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+class JsonlibTest(unittest.TestCase):
+    """
+    Every installed backend is run, selected with the PYPDNS_JSON
+    environment variable.
+    """
+
+    def setUp(self):
+        self.environ = os.environ.get(jsonlib.BACKEND_ENV)
+        self.addCleanup(self.use, self.environ)
+
+    def use(self, name):
+        if name is None:
+            os.environ.pop(jsonlib.BACKEND_ENV, None)
+        else:
+            os.environ[jsonlib.BACKEND_ENV] = name
+        jsonlib._backend = None
+        return jsonlib.backend()
+
+    def backends(self):
+        for name in jsonlib.BACKENDS:
+            if installed(name):
+                self.assertEqual(self.use(name), name)
+                yield name
+
+    def test_same_output(self):
+        document = {'name': u'\u00e9t\u00e9.example.', 'ttl': 300,
+                    'records': [{'content': '192.0.2.1/24',
+                                 'disabled': False}],
+                    'comments': None}
+        expected = json.dumps(document, sort_keys=True, ensure_ascii=False,
+                              separators=(',', ':'))
+        for name in self.backends():
+            self.assertEqual(jsonlib.dumps(document, sort_keys=True),
+                             expected, name)
+            self.assertEqual(jsonlib.loads(expected), document, name)
+            self.assertEqual(jsonlib.loads(expected.encode('utf-8')),
+                             document, name)
+
+    def test_fallbacks(self):
+        Key = collections.namedtuple('Key', 'name type')
+        for name in self.backends():
+            # Values only the json module encodes
+            self.assertEqual(jsonlib.dumps({'serial': 2 ** 70}),
+                             '{"serial":%d}' % 2 ** 70, name)
+            self.assertEqual(jsonlib.dumps({1: 'a'}), '{"1":"a"}', name)
+            self.assertEqual(jsonlib.dumps([Key('www.', 'A')]),
+                             '[["www.","A"]]', name)
+            self.assertEqual(jsonlib.loads('{"serial": %d}' % 2 ** 70),
+                             {'serial': 2 ** 70}, name)
+
+    def test_invalid(self):
+        for name in self.backends():
+            self.assertRaises(ValueError, jsonlib.loads, '{"name": ')
+            self.assertRaises(ValueError, jsonlib.loads, b'\xff')
+
+    def test_unknown_backend(self):
+        self.assertIn(self.use('nothing'), jsonlib.BACKENDS)
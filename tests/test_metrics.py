@@ -0,0 +1,78 @@
+import unittest
+
+from pypdns.metrics import MetricsCollector, RequestInfo
+
+from . import StubTestCase
+
+
+def request(verb, endpoint, elapsed, status=200, error=None):
+    info = RequestInfo(verb, endpoint, 'http://pdns' + endpoint)
+    info.elapsed = elapsed
+    info.status = status
+    info.request_bytes = 10
+    info.response_bytes = 100
+    info.error = error
+    return info
+
+
+class MetricsCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsCollector(buckets=(0.1, 1.0))
+        self.metrics.after_request(request('GET', '/zones', 0.05))
+        self.metrics.after_request(request('GET', '/zones', 0.5, status=503))
+        self.metrics.after_request(request('GET', '/zones', None,
+                                           error=IOError('refused')))
+        self.metrics.operation('zones_list.filter', 2.0)
+
+    def test_prometheus(self):
+        lines = self.metrics.prometheus().splitlines()
+        # Labels are sorted by name
+        name = 'pypdns_request_duration_seconds'
+        labels = 'endpoint="/zones",%sverb="GET"'
+        for line in ('# TYPE %s histogram' % name,
+                     '%s_bucket{%s} 1' % (name, labels % 'le="0.1",'),
+                     '%s_bucket{%s} 2' % (name, labels % 'le="1.0",'),
+                     '%s_bucket{%s} 2' % (name, labels % 'le="+Inf",'),
+                     '%s_sum{%s} 0.55' % (name, labels % ''),
+                     '%s_count{%s} 2' % (name, labels % ''),
+                     'pypdns_requests_total{%s} 1' % (
+                         labels % 'status="200",'),
+                     'pypdns_requests_total{%s} 1' % (
+                         labels % 'status="503",'),
+                     'pypdns_requests_total{%s} 1' % (
+                         labels % 'status="error",'),
+                     'pypdns_request_bytes_total{%s} 30' % (labels % ''),
+                     'pypdns_response_bytes_total{%s} 200' % (labels % ''),
+                     'pypdns_operation_duration_seconds_bucket{le="+Inf",'
+                     'operation="zones_list.filter"} 1'):
+            self.assertIn(line, lines)
+
+    def test_summary(self):
+        summary = self.metrics.summary()
+        stats = summary['requests']['GET /zones']
+        self.assertEqual(stats['statuses'], {'200': 1, '503': 1, 'error': 1})
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['latency']['max'], 0.5)
+        self.assertEqual(summary['operations']['zones_list.filter']['count'],
+                         1)
+        self.metrics.reset()
+        self.assertEqual(self.metrics.summary(),
+                         {'requests': {}, 'operations': {}})
+
+
+class HookTest(StubTestCase):
+
+    def test_requests(self):
+        pdns = self.pdns()
+        metrics = MetricsCollector()
+        pdns.add_hook(metrics)
+        pdns.zones_list()
+        pdns.zones_get('example.com.')
+        requests = metrics.summary()['requests']
+        self.assertEqual(sorted(requests), ['GET /zones', 'GET /zones/{}'])
+        self.assertEqual(requests['GET /zones/{}']['statuses'], {'200': 1})
+        self.assertGreater(requests['GET /zones/{}']['response_bytes'], 0)
+        self.assertIn('pypdns_requests_total{endpoint="/zones/{}",'
+                      'status="200",verb="GET"} 1',
+                      metrics.prometheus(prefix='pypdns').splitlines())
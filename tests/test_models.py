@@ -0,0 +1,48 @@
+import unittest
+
+from benchmarks.stub import generate_zone
+from pypdns.models import RRSet, SearchResult
+
+
+class RRSetTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for rrset in generate_zone('example.com.', 50):
+            model = RRSet.from_dict(rrset)
+            self.assertEqual(model.to_dict(), rrset)
+            self.assertEqual(RRSet.from_dict(model.to_dict()), model)
+
+    def test_item_access(self):
+        rrset = {'name': 'www.example.com.', 'type': 'A', 'ttl': 300,
+                 'records': [{'content': '192.0.2.1', 'disabled': False}],
+                 'comments': []}
+        model = RRSet.from_dict(rrset)
+        self.assertEqual(model['records'], rrset['records'])
+        self.assertEqual(model.get('comments'), [])
+        self.assertIn('ttl', model)
+        self.assertNotIn('changetype', model)
+        self.assertRaises(KeyError, model.__getitem__, 'changetype')
+        # Names and types are shared between rrsets
+        name = ''.join(['www.', 'example.com.'])
+        self.assertIsNot(name, rrset['name'])
+        self.assertIs(RRSet.from_dict(dict(rrset, name=name)).name,
+                      model.name)
+
+    def test_missing_fields(self):
+        model = RRSet.from_dict({'name': 'www.example.com.', 'type': 'A'})
+        self.assertEqual(model.to_dict(), {'name': 'www.example.com.',
+                                           'type': 'A', 'records': [],
+                                           'comments': []})
+
+
+class SearchResultTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        result = {'object_type': 'record', 'name': 'www.example.com.',
+                  'type': 'A', 'content': '192.0.2.1', 'ttl': 300,
+                  'disabled': False, 'zone': 'example.com.',
+                  'zone_id': 'example.com.'}
+        self.assertEqual(SearchResult.from_dict(result).to_dict(), result)
+        zone = {'object_type': 'zone', 'name': 'example.com.',
+                'zone_id': 'example.com.'}
+        self.assertEqual(SearchResult.from_dict(zone).to_dict(), zone)
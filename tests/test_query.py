@@ -0,0 +1,119 @@
+import unittest
+
+from pypdns.query import (MAX_ZONE_LOOKUPS, SearchPlan, ZoneListingPlan,
+                          exact_name, regex_glob)
+
+from . import StubTestCase
+
+
+def record(name, type_='A', zone='example.com.'):
+    return {'object_type': 'record', 'name': name, 'type': type_,
+            'content': '192.0.2.1', 'zone': zone, 'zone_id': zone}
+
+
+class RegexGlobTest(unittest.TestCase):
+
+    def test_glob(self):
+        for pattern, glob in (('example\\.com\\.$', 'example.com'),
+                              ('web.*\\.example', 'web*.example*'),
+                              ('^www\\.', 'www*'),
+                              ('h[0-9]+\\.example\\.com\\.',
+                               'h*.example.com*'),
+                              ('\\d+\\.example', '*.example*'),
+                              ('ab{2,3}c', 'a*c*'),
+                              ('x', 'x*')):
+            self.assertEqual(regex_glob(pattern), glob, pattern)
+
+    def test_untranslated(self):
+        for pattern in ('', '.*', 'a|b', '(?i)www', '\\d+$'):
+            self.assertIsNone(regex_glob(pattern), pattern)
+
+    def test_exact_name(self):
+        self.assertEqual(exact_name('example\\.com\\.$'), 'example.com.')
+        self.assertEqual(exact_name('^example\\.com$'), 'example.com.')
+        for pattern in ('example\\.com\\.', 'example.com.$', 'ex.*$', '.*'):
+            self.assertIsNone(exact_name(pattern), pattern)
+
+
+class SearchPlanTest(unittest.TestCase):
+
+    def test_over_fetch(self):
+        plan = SearchPlan('*', zone='example.com.', max_results=2)
+        self.assertEqual(plan.params(), {'term': '*example.com',
+                                         'max_results': 4,
+                                         'object_type': 'record'})
+        # A full page with a single match: the next request fetches more
+        page = [record('a.example.com.'), record('a.example.com.org.',
+                                                 zone='example.com.org.'),
+                record('b.example.com.org.', zone='example.com.org.'),
+                record('c.example.com.org.', zone='example.com.org.')]
+        self.assertEqual(len(list(plan.filter(page))), 1)
+        self.assertTrue(plan.pending)
+        self.assertGreater(plan.params()['max_results'], 4)
+        # Results already returned are skipped
+        page.append(record('d.example.com.'))
+        self.assertEqual([result['name'] for result in plan.filter(page)],
+                         ['d.example.com.'])
+        self.assertFalse(plan.pending)
+
+    def test_short_page(self):
+        plan = SearchPlan('www*', rtype='AAAA', max_results=10)
+        self.assertEqual(list(plan.filter([record('www.example.com.')])), [])
+        # The server has nothing more
+        self.assertFalse(plan.pending)
+
+    def test_no_client_side_filter(self):
+        plan = SearchPlan('www*', object_type='zone', max_results=10)
+        self.assertEqual(plan.params(), {'term': 'www*', 'max_results': 10,
+                                         'object_type': 'zone'})
+
+
+class ZoneListingPlanTest(unittest.TestCase):
+
+    def test_plans(self):
+        self.assertEqual(ZoneListingPlan('example\\.com\\.$').zone,
+                         'example.com.')
+        self.assertIsNone(ZoneListingPlan('.*').search)
+        plan = ZoneListingPlan('example\\.')
+        self.assertIsNone(plan.zone)
+        self.assertEqual(plan.search['term'], 'example*')
+        results = [{'object_type': 'zone', 'name': name, 'zone_id': name}
+                   for name in ('example.com.', 'example.org.')]
+        self.assertEqual(plan.lookups(results, 200),
+                         ['example.com.', 'example.org.'])
+        self.assertIsNone(plan.lookups('Unauthorized', 401))
+        self.assertIsNone(plan.lookups(results * MAX_ZONE_LOOKUPS, 200))
+
+    def test_merge(self):
+        zones = [{'name': 'example.com.'}, {'name': 'example.org.'}]
+        self.assertEqual(ZoneListingPlan.merge([([zones[0]], 200),
+                                                ([zones[1]], 200)]),
+                         (zones, 200))
+        self.assertEqual(ZoneListingPlan.merge([([zones[0]], 200),
+                                                ('Not found', 404)]),
+                         ('Not found', 404))
+        # A server ignoring the zone parameter lists every zone
+        self.assertEqual(ZoneListingPlan.merge([(zones, 200)]), (zones, 200))
+
+
+class ZonesListTest(StubTestCase):
+
+    zones = dict(('zone%d.example.' % i, 2) for i in range(30))
+
+    def test_narrowed(self):
+        pdns = self.pdns()
+        self.stub.reset_stats()
+        zones = pdns.zones_list('zone1\\.example\\.$')
+        self.assertEqual([zone['name'] for zone in zones],
+                         ['zone1.example.'])
+        self.assertEqual(self.stub.stats()['requests'], 1)
+        # A search, then a listing per zone found
+        self.stub.reset_stats()
+        zones = pdns.zones_list('zone2.\\.example')
+        self.assertEqual(sorted(zone['name'] for zone in zones),
+                         ['zone2%d.example.' % i for i in range(10)])
+        self.assertEqual(self.stub.stats()['requests'], 11)
+        # Too many zones found, they are all listed
+        self.stub.reset_stats()
+        self.assertEqual(len(pdns.zones_list('zone')), 30)
+        self.assertEqual(self.stub.stats()['requests'], 2)
@@ -0,0 +1,72 @@
+import copy
+
+from . import StubTestCase
+
+
+class ReconcileTest(StubTestCase):
+
+    def desired(self):
+        rrsets = copy.deepcopy(self.stub.zones['example.com.']['rrsets'])
+        for rrset in rrsets:
+            rrset.pop('comments', None)
+        return rrsets
+
+    def test_unchanged(self):
+        differences, results = self.pdns().reconcile('example.com.',
+                                                     self.desired())
+        self.assertEqual(differences, [])
+        self.assertEqual(results, [])
+
+    def test_changes(self):
+        desired = self.desired()
+        removed = desired.pop()
+        desired[-1]['records'] = [{'content': '192.0.2.1',
+                                   'disabled': False}]
+        desired[-1]['type'] = 'A'
+        desired.append({'name': 'new.example.com.', 'type': 'A', 'ttl': 60,
+                        'records': [{'content': '192.0.2.2',
+                                     'disabled': False}]})
+        self.stub.reset_stats()
+        differences, results = self.pdns().reconcile('example.com.', desired,
+                                                     max_rrsets=2)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(len(results), (len(differences) + 1) // 2)
+        # The zone fetch and the PATCH requests only
+        self.assertEqual(self.stub.stats()['requests'], 1 + len(results))
+
+        keys = set((rrset['name'], rrset['type'])
+                   for rrset in self.stub.zones['example.com.']['rrsets'])
+        self.assertIn(('new.example.com.', 'A'), keys)
+        self.assertNotIn((removed['name'], removed['type']), keys)
+        self.assertEqual(self.pdns().reconcile('example.com.', desired)[0],
+                         [])
+
+    def test_name_case(self):
+        desired = self.desired()
+        for rrset in desired:
+            rrset['name'] = rrset['name'].upper()
+        desired[-1]['ttl'] += 1
+        self.stub.reset_stats()
+        differences, results = self.pdns().reconcile('example.com.', desired)
+        # Only the ttl change, no REPLACE and DELETE of the same rrset
+        self.assertEqual([(diff['action'], diff['name'])
+                          for diff in differences],
+                         [('change', desired[-1]['name'].lower())])
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(len(self.stub.zones['example.com.']['rrsets']), 20)
+
+    def test_dry_run(self):
+        desired = self.desired()[:-1]
+        differences, results = self.pdns().reconcile('example.com.', desired,
+                                                     dry_run=True)
+        self.assertEqual(len(differences), 1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(self.stub.zones['example.com.']['rrsets']), 20)
+
+    def test_invalid_batch_size(self):
+        pdns = self.pdns()
+        for max_rrsets in ('0', -1):
+            with self.assertRaises(ValueError):
+                pdns.reconcile('example.com.', self.desired()[:-1],
+                               max_rrsets=max_rrsets)
+        self.assertEqual(len(self.stub.zones['example.com.']['rrsets']), 20)
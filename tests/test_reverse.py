@@ -0,0 +1,113 @@
+import unittest
+
+from pypdns.reverse import (ReverseIndex, covering_zone, ptr_name,
+                            reverse_network)
+
+from . import StubTestCase
+
+
+def rrset(name, type_, *contents):
+    return {'name': name, 'type': type_, 'ttl': 300, 'comments': [],
+            'records': [{'content': content, 'disabled': False}
+                        for content in contents]}
+
+
+class ReverseNetworkTest(unittest.TestCase):
+
+    def test_ipv4(self):
+        self.assertEqual(reverse_network('2.0.192.in-addr.arpa.'),
+                         (4, 0xc00002, 24))
+        self.assertEqual(reverse_network('1.2.0.192.IN-ADDR.ARPA'),
+                         (4, 0xc0000201, 32))
+        self.assertEqual(reverse_network('in-addr.arpa.'), (4, 0, 0))
+
+    def test_ipv6(self):
+        self.assertEqual(reverse_network('8.b.d.0.1.0.0.2.ip6.arpa.'),
+                         (6, 0x20010db8, 32))
+
+    def test_not_reverse(self):
+        for name in ('example.com.', '0/26.2.0.192.in-addr.arpa.',
+                     '256.0.192.in-addr.arpa.', '1.2.3.4.5.in-addr.arpa.',
+                     '10.b.ip6.arpa.'):
+            self.assertIsNone(reverse_network(name), name)
+
+
+class ReverseIndexTest(unittest.TestCase):
+
+    def test_zones(self):
+        index = ReverseIndex()
+        self.assertTrue(index.add_zone('10.in-addr.arpa.'))
+        self.assertTrue(index.add_zone('0.0.10.in-addr.arpa.'))
+        self.assertFalse(index.add_zone('example.com.'))
+        # The longest prefix wins
+        self.assertEqual(index.zone(4, 0x0a000001), '0.0.10.in-addr.arpa.')
+        self.assertEqual(index.zone(4, 0x0a010001), '10.in-addr.arpa.')
+        self.assertIsNone(index.zone(4, 0x0b000001))
+        self.assertIsNone(index.zone(6, 1))
+
+    def test_ptrs(self):
+        index = ReverseIndex()
+        self.assertTrue(index.add_ptr('1.0.0.10.in-addr.arpa.',
+                                      ['WWW.example.com.']))
+        self.assertTrue(index.add_ptr(ptr_name(4, 0x0a000002),
+                                      ['b.example.', 'a.example.']))
+        self.assertFalse(index.add_ptr('0.0.10.in-addr.arpa.', ['x.']))
+        self.assertFalse(index.add_ptr('0/26.0.0.10.in-addr.arpa.', ['x.']))
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.ignored, 2)
+        self.assertEqual(index.targets(4, 0x0a000001), ('www.example.com.',))
+        self.assertEqual(index.targets(4, 0x0a000002),
+                         ('a.example.', 'b.example.'))
+        self.assertEqual(index.targets(4, 0x0a000003), ())
+
+    def test_covering_zone(self):
+        zones = set(['example.com.', 'sub.example.com.'])
+        self.assertEqual(covering_zone('www.Sub.example.com.', zones),
+                         'sub.example.com.')
+        self.assertEqual(covering_zone('example.com', zones), 'example.com.')
+        self.assertIsNone(covering_zone('www.example.net.', zones))
+
+
+class CheckReverseTest(StubTestCase):
+
+    zones = {}
+
+    def setUp(self):
+        super(CheckReverseTest, self).setUp()
+        self.stub.add_zone('a.com.', [rrset('www.a.com.', 'A', '10.0.0.1'),
+                                      rrset('db.a.com.', 'A', '10.0.0.5')])
+        self.stub.add_zone('b.com.', [rrset('www.b.com.', 'A', '10.0.0.2')])
+        self.stub.add_zone('0.0.10.in-addr.arpa.', [
+            rrset('1.0.0.10.in-addr.arpa.', 'PTR', 'www.a.com.'),
+            rrset('2.0.0.10.in-addr.arpa.', 'PTR', 'www.b.com.'),
+            rrset('3.0.0.10.in-addr.arpa.', 'PTR', 'gone.a.com.'),
+            rrset('4.0.0.10.in-addr.arpa.', 'PTR', 'host.example.net.')])
+
+    def ptrs(self):
+        return sorted(rrset['name'] for rrset in
+                      self.stub.zones['0.0.10.in-addr.arpa.']['rrsets'])
+
+    def test_zone_subset(self):
+        pdns = self.pdns()
+        issues = pdns.check_reverse(r'a\.com\.$')
+        self.assertEqual(sorted((issue['issue'], issue['address'],
+                                 issue['fix'] is not None)
+                                for issue in issues),
+                         [('dangling', '10.0.0.3', True),
+                          ('missing', '10.0.0.5', True),
+                          ('out-of-scope', '10.0.0.2', False),
+                          ('out-of-scope', '10.0.0.4', False)])
+        results = list(pdns.fix_reverse(issues))
+        self.assertTrue(all(result['success'] for result in results))
+        # The PTRs of b.com. and of hosts served elsewhere are kept
+        self.assertEqual(self.ptrs(), ['1.0.0.10.in-addr.arpa.',
+                                       '2.0.0.10.in-addr.arpa.',
+                                       '4.0.0.10.in-addr.arpa.',
+                                       '5.0.0.10.in-addr.arpa.'])
+
+    def test_all_zones(self):
+        issues = self.pdns().check_reverse()
+        self.assertEqual(sorted((issue['issue'], issue['address'])
+                                for issue in issues),
+                         [('dangling', '10.0.0.3'), ('missing', '10.0.0.5'),
+                          ('out-of-scope', '10.0.0.4')])
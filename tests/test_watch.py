@@ -0,0 +1,48 @@
+from . import StubTestCase
+
+
+class WatchTest(StubTestCase):
+
+    zones = {'a.example.': 10, 'b.example.': 10}
+
+    def change(self, name):
+        self.stub.patch(name, [{'name': 'new.' + name, 'type': 'A',
+                                'ttl': 60, 'changetype': 'REPLACE',
+                                'records': [{'content': '192.0.2.1'}]}])
+
+    def test_changes(self):
+        pdns = self.pdns()
+        events = []
+
+        def callback(event):
+            events.append(event)
+            if not callback.changed:
+                callback.changed = True
+                self.change('b.example.')
+        callback.changed = False
+        self.stub.patch('a.example.', [])
+        pdns.watch(callback, interval=0, initial=True, cycles=2)
+        self.assertEqual(len([event for event in events
+                              if event['event'] == 'add']), 21)
+        self.assertEqual(events[-1]['name'], 'new.b.example.')
+
+    def test_interrupted_zone(self):
+        self.stub.fail('GET', '/zones/a.example.', truncate=100)
+        events = list(self.pdns().iter_watch(interval=0, cycles=2))
+        self.assertEqual([(event['event'], event['zone'], event['code'])
+                          for event in events], [('error', 'a.example.', -1)])
+
+    def test_listing_failure(self):
+        self.stub.fail('GET', 'localhost/zones', truncate=10)
+        events = list(self.pdns(retries=0).iter_watch(interval=0, cycles=2))
+        self.assertEqual([(event['event'], event['zone'], event['code'])
+                          for event in events], [('error', None, -1)])
+
+    def test_new_zone(self):
+        self.stub.fail('GET', '/zones/a.example.', status=503)
+        watch = self.pdns(retries=0).iter_watch(interval=0, cycles=2)
+        self.assertEqual(next(watch)['event'], 'error')
+        self.stub.add_zone('c.example.', [])
+        # a.example. failed in the first poll, it is fetched again silently
+        self.assertEqual([(event['event'], event['zone']) for event in watch],
+                         [('zone_add', 'c.example.')])
@@ -0,0 +1,50 @@
+import unittest
+
+from benchmarks.stub import generate_zone
+from pypdns.pypdns import iter_match_rrsets
+from pypdns.zone import Zone, literal_prefix
+
+
+class LiteralPrefixTest(unittest.TestCase):
+
+    def test_prefix(self):
+        for pattern, prefix in (('www\\.example\\.com\\.$',
+                                 'www.example.com.'),
+                                ('www.*', 'www'),
+                                ('ab?c', 'a'),
+                                ('ab*', 'a'),
+                                ('ab+', 'ab'),
+                                ('ab{2}', 'a'),
+                                ('a\\.?b', 'a'),
+                                ('mail[0-9]', 'mail'),
+                                ('h(1|2)', ''),
+                                ('\\d+', ''),
+                                ('.*', ''),
+                                ('(?i)www', ''),
+                                ('www|ftp', '')):
+            self.assertEqual(literal_prefix(pattern), prefix, pattern)
+
+
+class ZoneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rrsets = generate_zone('example.com.', 200)
+        self.zone = Zone({'name': 'example.com.', 'rrsets': self.rrsets})
+
+    def test_filter(self):
+        # Same results, in the same order, as a scan of the zone
+        for name, type_ in (('.*', '.*'), ('h1.*', '.*'), ('h1', 'A'),
+                            ('.*', 'A|AAAA'), ('h[12]\\.', 'TXT'),
+                            ('example\\.com\\.$', 'SOA'), ('(?i)H1', '.*'),
+                            ('nothing', '.*'), ('.*', 'NOTHING')):
+            expected = list(iter_match_rrsets(self.rrsets, name, type_))
+            self.assertEqual(self.zone.filter(name, type_), expected,
+                             (name, type_))
+
+    def test_lookups(self):
+        rrset = self.rrsets[10]
+        self.assertIs(self.zone.get(rrset['name'].rstrip('.'),
+                                    rrset['type'].lower()), rrset)
+        self.assertIsNone(self.zone.get('nothing.example.com.', 'A'))
+        self.assertEqual(self.zone.subtree('example.com.'), self.rrsets)
+        self.assertEqual(self.zone.by_type('soa')[0]['name'], 'example.com.')